@@ -0,0 +1,157 @@
+#
+# Licensed under the Apache License, Version 2.0 (the “License”);
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an “AS IS” BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Rows the benchmarks are run on
+They are meant to be created in a transaction which is rolled back.
+"""
+import uuid
+from datetime import timedelta
+from django.db.models import Max
+from django.utils import timezone
+from crapi.mechanic.models import Mechanic, ServiceComment, ServiceRequest
+from crapi.shop.models import Order, Product
+from crapi.user.models import (
+    User,
+    UserDetails,
+    Vehicle,
+    VehicleCompany,
+    VehicleModel,
+)
+
+BATCH_SIZE = 5000
+
+
+def next_id(model):
+    # Tables of the identity service do not always have a default id
+    return (model.objects.aggregate(Max("id"))["id__max"] or 0) + 1
+
+
+class BenchmarkFixtures:
+    """
+    Users, orders and service requests for a number of rows
+    :param rows: number of orders, service requests, comments and users
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.prefix = f"bench-{uuid.uuid4().hex[:8]}-"
+        now = timezone.now()
+
+        user_id = next_id(User)
+        details_id = next_id(UserDetails)
+        users = [
+            User(
+                id=user_id + i,
+                email=f"{self.prefix}{i}@example.com",
+                number=f"9{i:09d}",
+                password="benchmark",
+                role=User.ROLE_CHOICES.USER,
+                created_on=now,
+            )
+            for i in range(rows + 3)
+        ]
+        users[-3].role = User.ROLE_CHOICES.ADMIN
+        users[-2].role = User.ROLE_CHOICES.MECH
+        User.objects.bulk_create(users, batch_size=BATCH_SIZE)
+        UserDetails.objects.bulk_create(
+            [
+                UserDetails(
+                    id=details_id + i,
+                    available_credit=100,
+                    name=f"Benchmark {i}",
+                    status="ACTIVE",
+                    user=user,
+                )
+                for i, user in enumerate(users)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        self.admin, self.mechanic_user, self.customer = users[-3:]
+
+        product = Product.objects.order_by("id").first()
+        if product is None:
+            product = Product.objects.create(
+                name="Seat", price="10.00", image_url="images/seat.svg"
+            )
+        Order.objects.bulk_create(
+            [
+                Order(
+                    user=self.customer,
+                    product=product,
+                    quantity=i % 3 + 1,
+                    created_on=now - timedelta(minutes=i),
+                )
+                for i in range(rows)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+
+        company = VehicleCompany.objects.create(
+            id=next_id(VehicleCompany), name="Benchmark"
+        )
+        vehicle_model = VehicleModel.objects.create(
+            id=next_id(VehicleModel),
+            fuel_type=0,
+            model="Benchmark",
+            vehiclecompany=company,
+        )
+        self.vehicle = Vehicle.objects.create(
+            id=next_id(Vehicle),
+            vin=f"BENCH{uuid.uuid4().hex[:12].upper()}",
+            year=2020,
+            vehicle_model=vehicle_model,
+            owner=self.customer,
+            status="ACTIVE",
+        )
+        self.mechanic = Mechanic.objects.create(
+            mechanic_code=f"{self.prefix}mechanic", user=self.mechanic_user
+        )
+        service_requests = ServiceRequest.objects.bulk_create(
+            [
+                ServiceRequest(
+                    mechanic=self.mechanic,
+                    vehicle=self.vehicle,
+                    problem_details=f"Benchmark problem {i}",
+                    created_on=now - timedelta(minutes=i),
+                    updated_on=now,
+                )
+                for i in range(rows)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        ServiceComment.objects.bulk_create(
+            [
+                ServiceComment(
+                    service_request=service_request,
+                    comment="Checked the spark plugs",
+                    created_on=now,
+                )
+                for service_request in service_requests
+            ],
+            batch_size=BATCH_SIZE,
+        )
+
+    def orders(self):
+        return Order.objects.filter(user=self.customer).order_by("-id")
+
+    def service_requests(self):
+        return ServiceRequest.objects.filter(mechanic=self.mechanic).order_by(
+            "-created_on"
+        )
+
+    def user_details(self):
+        return UserDetails.objects.filter(user__email__startswith=self.prefix).order_by(
+            "id"
+        )
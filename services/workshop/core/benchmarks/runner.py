@@ -0,0 +1,168 @@
+#
+# Licensed under the Apache License, Version 2.0 (the “License”);
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an “AS IS” BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Timing of the serializers and list views, and comparison with a baseline
+"""
+import gc
+import statistics
+import time
+from unittest import mock
+import jwt
+from django.db import connection
+from django.test import Client
+from crapi.mechanic.serializers import (
+    MechanicServiceRequestSerializer,
+    service_request_values,
+)
+from crapi.shop.serializers import OrderSerializer, order_values
+from crapi.user.serializers import UserDetailsSerializer, user_details_values
+from utils.metrics import QueryRecorder
+
+
+def measure(func, repeat):
+    """
+    runs func once to warm up and count its queries, then repeat times
+    :return: dict of the timings in milliseconds and the number of queries
+    """
+    # The queries log of the connection is reset by every request
+    queries = QueryRecorder()
+    with connection.execute_wrapper(queries):
+        func()
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "median_ms": round(statistics.median(timings), 3),
+        "min_ms": round(min(timings), 3),
+        "max_ms": round(max(timings), 3),
+        "queries": queries.count,
+    }
+
+
+def serializer_cases(fixtures):
+    """
+    :return: dict of case name to a function serializing all the rows
+    """
+    return {
+        "OrderSerializer": lambda: OrderSerializer(fixtures.orders(), many=True).data,
+        "order_values": lambda: order_values.data(fixtures.orders()),
+        "MechanicServiceRequestSerializer": lambda: MechanicServiceRequestSerializer(
+            fixtures.service_requests(), many=True
+        ).data,
+        "service_request_values": lambda: service_request_values.data(
+            fixtures.service_requests()
+        ),
+        "UserDetailsSerializer": lambda: UserDetailsSerializer(
+            fixtures.user_details(), many=True
+        ).data,
+        "user_details_values": lambda: user_details_values.data(
+            fixtures.user_details()
+        ),
+    }
+
+
+def authorization(user):
+    # The identity service is mocked, the workshop only reads sub
+    token = jwt.encode({"sub": user.email}, "benchmark", algorithm="HS256")
+    return "Bearer " + token
+
+
+def view_cases(fixtures):
+    """
+    :return: dict of case name to a function calling a list API
+        through the test client
+    """
+    client = Client()
+    paths = {
+        "orders_all": ("/workshop/api/shop/orders/all", fixtures.customer),
+        "products": ("/workshop/api/shop/products", fixtures.customer),
+        "mechanic_service_requests": (
+            "/workshop/api/mechanic/service_requests",
+            fixtures.mechanic_user,
+        ),
+        "merchant_service_requests": (
+            f"/workshop/api/merchant/service_requests/{fixtures.vehicle.vin}",
+            fixtures.customer,
+        ),
+        "management_users_all": (
+            "/workshop/api/management/users/all",
+            fixtures.admin,
+        ),
+    }
+
+    def call(path, user):
+        response = client.get(path, HTTP_AUTHORIZATION=authorization(user))
+        if response.status_code != 200:
+            raise RuntimeError(f"GET {path} returned {response.status_code}")
+
+    return {
+        name: (lambda path=path, user=user: call(path, user))
+        for name, (path, user) in paths.items()
+    }
+
+
+def identity_accepting_all():
+    """
+    patches the identity service call of jwt_auth_required to accept
+    every token
+    """
+    return mock.patch(
+        "utils.jwt.requests.post", return_value=mock.Mock(status_code=200)
+    )
+
+
+def run_cases(fixtures, repeat, kinds=("serializer", "view")):
+    """
+    :return: dict of "kind:case[rows]" to its measure
+    """
+    results = {}
+    cases = {}
+    if "serializer" in kinds:
+        cases["serializer"] = serializer_cases(fixtures)
+    if "view" in kinds:
+        cases["view"] = view_cases(fixtures)
+    with identity_accepting_all():
+        for kind, kind_cases in cases.items():
+            for name, func in kind_cases.items():
+                result = measure(func, repeat)
+                result["rows"] = fixtures.rows
+                results[f"{kind}:{name}[{fixtures.rows}]"] = result
+    return results
+
+
+def compare(results, baseline, threshold, min_delta_ms):
+    """
+    compares the results with a baseline
+    :param threshold: relative slowdown of the median flagged as a regression
+    :param min_delta_ms: slowdowns smaller than this are noise
+    :return: list of (case, baseline result, result, change, regression),
+        more queries than in the baseline are always a regression
+    """
+    rows = []
+    for case, result in results.items():
+        base = baseline.get(case)
+        if base is None:
+            rows.append((case, None, result, None, False))
+            continue
+        delta = result["median_ms"] - base["median_ms"]
+        change = delta / base["median_ms"] if base["median_ms"] else 0.0
+        regression = (change > threshold and delta > min_delta_ms) or (
+            result["queries"] > base["queries"]
+        )
+        rows.append((case, base, result, change, regression))
+    return rows
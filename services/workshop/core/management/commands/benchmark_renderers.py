@@ -0,0 +1,137 @@
+#
+# Licensed under the Apache License, Version 2.0 (the “License”);
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an “AS IS” BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Compares the stock JSONRenderer with the ORJSONRenderer
+on payloads shaped like the order and service request responses
+"""
+import io
+import timeit
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from utils.parsers import ORJSONParser
+from utils.renderers import ORJSONRenderer
+
+
+def order_payload(count):
+    """
+    list of orders as returned by the order APIs,
+    with the raw Decimal, datetime and UUID values of the models
+    :param count: number of orders
+    """
+    now = timezone.now()
+    return {
+        "orders": [
+            {
+                "id": i,
+                "user": {"email": f"user{i}@example.com", "number": "9876543210"},
+                "product": {
+                    "id": i % 5 + 1,
+                    "name": "Seat",
+                    "price": Decimal("10.50") * (i % 7 + 1),
+                    "image_url": "images/seat.svg",
+                },
+                "quantity": i % 3 + 1,
+                "status": "delivered",
+                "transaction_id": uuid.uuid4(),
+                "created_on": now - timedelta(minutes=i),
+            }
+            for i in range(count)
+        ],
+        "available_credit": 155.5,
+    }
+
+
+def service_request_payload(count):
+    """
+    list of service requests as returned by the mechanic APIs,
+    with nested vehicle, mechanic and comments
+    :param count: number of service requests
+    """
+    now = timezone.now()
+    return {
+        "service_requests": [
+            {
+                "id": i,
+                "mechanic": {
+                    "id": 1,
+                    "mechanic_code": "TRAC_JHN",
+                    "user": {"email": "jhon@example.com", "number": "4156895423"},
+                },
+                "vehicle": {
+                    "id": i,
+                    "vin": f"0BZCX25UTBJ98{i:04d}",
+                    "owner": {"email": f"user{i}@example.com", "number": "9876543210"},
+                },
+                "problem_details": "Engine makes a noise “whenever” it is cold",
+                "status": "pending",
+                "created_on": (now - timedelta(days=i)).strftime("%d %B, %Y, %H:%M:%S"),
+                "updated_on": now.strftime("%d %B, %Y, %H:%M:%S"),
+                "comments": [
+                    {"id": j, "comment": "Checked the spark plugs", "created_on": now}
+                    for j in range(i % 4)
+                ],
+            }
+            for i in range(count)
+        ],
+        "count": count,
+    }
+
+
+class Command(BaseCommand):
+    """
+    Benchmarks the JSON renderers and parsers
+    """
+
+    help = "Compares JSONRenderer and ORJSONRenderer timings and output"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100)
+        parser.add_argument("--number", type=int, default=200)
+
+    def handle(self, *args, **options):
+        payloads = {
+            "orders": order_payload(options["rows"]),
+            "service_requests": service_request_payload(options["rows"]),
+        }
+        number = options["number"]
+        for name, payload in payloads.items():
+            expected = JSONRenderer().render(payload)
+            rendered = ORJSONRenderer().render(payload)
+            stock = timeit.timeit(lambda: JSONRenderer().render(payload), number=number)
+            fast = timeit.timeit(
+                lambda: ORJSONRenderer().render(payload), number=number
+            )
+            self.stdout.write(
+                f"render {name}: {len(expected)} bytes, "
+                f"stock {stock / number * 1000:.3f} ms, "
+                f"orjson {fast / number * 1000:.3f} ms, "
+                f"speedup {stock / fast:.1f}x, identical {expected == rendered}"
+            )
+
+            stock = timeit.timeit(
+                lambda: JSONParser().parse(io.BytesIO(expected)), number=number
+            )
+            fast = timeit.timeit(
+                lambda: ORJSONParser().parse(io.BytesIO(expected)), number=number
+            )
+            self.stdout.write(
+                f"parse {name}: stock {stock / number * 1000:.3f} ms, "
+                f"orjson {fast / number * 1000:.3f} ms, speedup {stock / fast:.1f}x"
+            )
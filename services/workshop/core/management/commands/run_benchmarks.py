@@ -0,0 +1,141 @@
+#
+# Licensed under the Apache License, Version 2.0 (the “License”);
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an “AS IS” BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Times the serializers and list views on fixtures of several sizes,
+and compares the timings with a baseline
+"""
+import json
+import platform
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+from core.benchmarks.fixtures import BenchmarkFixtures
+from core.benchmarks.runner import compare, run_cases
+
+
+class Command(BaseCommand):
+    """
+    Benchmarks the serializers and list views
+    Fixtures are created in a transaction which is rolled back.
+    """
+
+    help = "Times serializers and list views, and flags regressions on a baseline"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            default="10,100,1000",
+            help="comma separated numbers of rows, up to 100000. The model "
+            "serializers run a few queries per row, so large sizes take minutes",
+        )
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument(
+            "--kind", choices=("serializer", "view"), action="append", default=None
+        )
+        parser.add_argument("--output", help="file to write the results to")
+        parser.add_argument("--baseline", help="results of a previous run")
+        parser.add_argument("--threshold", type=float, default=0.2)
+        parser.add_argument("--min-delta-ms", type=float, default=0.5)
+        parser.add_argument(
+            "--update-baseline",
+            action="store_true",
+            help="write the results to the baseline file",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options["sizes"].split(",")]
+        except ValueError:
+            raise CommandError("--sizes should be a comma separated list of numbers")
+        if not all(0 < size <= 100000 for size in sizes):
+            raise CommandError("sizes should be between 1 and 100000")
+        kinds = options["kind"] or ("serializer", "view")
+
+        results = {}
+        # The slow query log and profiler would measure themselves
+        with override_settings(SLOW_QUERY_LOG_FILE="", PROFILING_SAMPLE_RATE=0):
+            for size in sizes:
+                self.stdout.write(f"Running the benchmarks on {size} rows")
+                with transaction.atomic():
+                    fixtures = BenchmarkFixtures(size)
+                    results.update(run_cases(fixtures, options["repeat"], kinds))
+                    transaction.set_rollback(True)
+
+        report = {
+            "meta": {
+                "created_on": timezone.now().isoformat(),
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "repeat": options["repeat"],
+            },
+            "results": results,
+        }
+        if options["output"]:
+            self.write_report(options["output"], report)
+
+        regressions = 0
+        if options["baseline"] and not options["update_baseline"]:
+            try:
+                with open(options["baseline"]) as baseline_file:
+                    baseline = json.load(baseline_file)["results"]
+            except (OSError, ValueError, KeyError) as e:
+                raise CommandError(f"Could not read the baseline: {e}")
+            rows = compare(
+                results, baseline, options["threshold"], options["min_delta_ms"]
+            )
+            regressions = self.print_comparison(rows)
+        else:
+            self.print_results(results)
+            if options["update_baseline"]:
+                if not options["baseline"]:
+                    raise CommandError("--update-baseline needs --baseline")
+                self.write_report(options["baseline"], report)
+
+        if regressions:
+            raise CommandError(f"{regressions} regressions over the baseline")
+
+    @staticmethod
+    def write_report(path, report):
+        with open(path, "w") as report_file:
+            json.dump(report, report_file, indent=2, sort_keys=True)
+
+    def print_results(self, results):
+        for case, result in results.items():
+            self.stdout.write(
+                f"{case:<55} median {result['median_ms']:>10.3f} ms "
+                f"min {result['min_ms']:>10.3f} ms {result['queries']:>6} queries"
+            )
+
+    def print_comparison(self, rows):
+        regressions = 0
+        for case, base, result, change, regression in rows:
+            if base is None:
+                self.stdout.write(
+                    f"{case:<55} {result['median_ms']:>10.3f} ms (no baseline)"
+                )
+                continue
+            line = (
+                f"{case:<55} {base['median_ms']:>10.3f} -> "
+                f"{result['median_ms']:>10.3f} ms {change:>+8.1%} "
+                f"{base['queries']:>6} -> {result['queries']:>6} queries"
+            )
+            if regression:
+                regressions += 1
+                self.stdout.write(self.style.ERROR(line + " REGRESSION"))
+            else:
+                self.stdout.write(line)
+        return regressions
@@ -0,0 +1,125 @@
+#
+# Licensed under the Apache License, Version 2.0 (the “License”);
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an “AS IS” BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Summarizes the slow query log written by utils.slow_queries
+"""
+import json
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+SORT_KEYS = {
+    "total": lambda shape: shape["total_ms"],
+    "count": lambda shape: shape["count"],
+    "max": lambda shape: shape["max_ms"],
+    "mean": lambda shape: shape["total_ms"] / shape["count"],
+}
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def read_shapes(path, view=None):
+    """
+    groups the entries of the slow query log by query shape
+    :param path: path of the slow query log
+    :param view: only keep the queries of this view
+    :return: dict of fingerprint to aggregated shape
+    """
+    shapes = {}
+    with open(path) as log_file:
+        for line in log_file:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Lines cut by a crash are skipped
+                continue
+            if view and entry.get("view") != view:
+                continue
+            shape = shapes.setdefault(
+                entry["fingerprint"],
+                {
+                    "sql": entry["sql"],
+                    "count": 0,
+                    "errors": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "durations": [],
+                    "views": {},
+                    "params": set(),
+                    "explain": None,
+                },
+            )
+            duration = entry["duration_ms"]
+            shape["count"] += 1
+            shape["errors"] += "error" in entry
+            shape["total_ms"] += duration
+            shape["max_ms"] = max(shape["max_ms"], duration)
+            shape["durations"].append(duration)
+            shape["views"][entry["view"]] = shape["views"].get(entry["view"], 0) + 1
+            shape["params"].add(entry["params_fingerprint"])
+            if entry.get("explain"):
+                shape["explain"] = entry["explain"]
+    return shapes
+
+
+class Command(BaseCommand):
+    """
+    Lists the query shapes which spent the most time over the threshold
+    """
+
+    help = "Summarizes the slowest query shapes of the slow query log"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--file", default=None)
+        parser.add_argument("--top", type=int, default=10)
+        parser.add_argument("--sort", choices=sorted(SORT_KEYS), default="total")
+        parser.add_argument("--view", default=None)
+        parser.add_argument("--plans", action="store_true")
+
+    def handle(self, *args, **options):
+        path = options["file"] or settings.SLOW_QUERY_LOG_FILE
+        try:
+            shapes = read_shapes(path, options["view"])
+        except OSError as e:
+            raise CommandError(f"Could not read {path}: {e}")
+        if not shapes:
+            self.stdout.write("No slow queries")
+            return
+
+        ranked = sorted(
+            shapes.items(), key=lambda item: SORT_KEYS[options["sort"]](item[1])
+        )[::-1][: options["top"]]
+        for shape_id, shape in ranked:
+            views = ", ".join(
+                f"{view} ({count})"
+                for view, count in sorted(
+                    shape["views"].items(), key=lambda item: -item[1]
+                )
+            )
+            self.stdout.write(
+                f"{shape_id}: {shape['count']} slow, {shape['errors']} failed, "
+                f"{len(shape['params'])} distinct params, "
+                f"total {shape['total_ms']:.1f} ms, "
+                f"mean {shape['total_ms'] / shape['count']:.1f} ms, "
+                f"p95 {percentile(shape['durations'], 0.95):.1f} ms, "
+                f"max {shape['max_ms']:.1f} ms"
+            )
+            self.stdout.write(f"  views: {views}")
+            self.stdout.write(f"  sql: {shape['sql']}")
+            if options["plans"] and shape["explain"]:
+                for line in shape["explain"].splitlines():
+                    self.stdout.write(f"    {line}")
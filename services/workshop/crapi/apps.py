@@ -213,9 +213,26 @@ class CRAPIConfig(AppConfig):
 
     def ready(self):
         """
+        Record the queries of the requests on every connection
+        Publish the writes of the cached models on the invalidation bus
         Pre-populate mechanic model and product model
         :return: None
         """
+        from django.db.backends.signals import connection_created
+        from crapi.mechanic.models import Mechanic, ServiceRequest
+        from crapi.shop.models import Order, Product
+        from crapi.user.models import UserDetails
+        from utils.invalidation import bus
+        from utils.profiling import install_query_wrappers
+
+        connection_created.connect(
+            install_query_wrappers, dispatch_uid="install_query_wrappers"
+        )
+
+        for model in (Product, UserDetails, ServiceRequest, Mechanic):
+            bus.publish_writes(model)
+        bus.publish_writes(Order, fields=("transaction_id",))
+
         # Check if sys.argv contains 'runserver' or 'runserver_plus'
         is_runserver = any("runserver" in x for x in sys.argv)
         if not is_runserver:
@@ -0,0 +1,28 @@
+#
+# Licensed under the Apache License, Version 2.0 (the “License”);
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an “AS IS” BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Memoized lookups of mechanics
+"""
+from crapi.mechanic.models import Mechanic
+from crapi.user.models import User
+from utils.cache import memoize
+
+
+@memoize("mechanic_list", models=(Mechanic, User))
+def mechanic_list():
+    """
+    :return: list of all the mechanics with their users, by id
+    """
+    return list(Mechanic.objects.select_related("user").order_by("id"))
@@ -19,6 +19,9 @@ from rest_framework import serializers
 
 from crapi.mechanic.models import Mechanic, ServiceRequest, ServiceComment
 from crapi.user.serializers import UserSerializer, VehicleSerializer
+from crapi_site import settings
+from utils import messages
+from utils.values_serializer import ValuesRelated, ValuesSerializer
 
 
 class MechanicSerializer(serializers.ModelSerializer):
@@ -83,6 +86,38 @@ class ReceiveReportSerializer(serializers.Serializer):
     owner_id = serializers.CharField(required=False)
 
 
+class ReportsExportSerializer(serializers.Serializer):
+    """
+    Serializer for the bulk report download API
+    """
+
+    report_ids = serializers.CharField(required=False)
+    start_date = serializers.DateField(required=False)
+    end_date = serializers.DateField(required=False)
+
+    def validate_report_ids(self, value):
+        report_ids = [report_id.strip() for report_id in value.split(",")]
+        if not all(report_id.isnumeric() for report_id in report_ids):
+            raise serializers.ValidationError(messages.INVALID_REPORT_IDS)
+        if len(report_ids) > settings.REPORTS_EXPORT_LIMIT:
+            raise serializers.ValidationError(
+                messages.REPORTS_EXPORT_LIMIT_EXCEEDED.format(
+                    settings.REPORTS_EXPORT_LIMIT
+                )
+            )
+        return [int(report_id) for report_id in report_ids]
+
+    def validate(self, attrs):
+        has_date_range = "start_date" in attrs and "end_date" in attrs
+        if "report_ids" not in attrs and not has_date_range:
+            raise serializers.ValidationError(
+                messages.REPORT_IDS_OR_DATE_RANGE_REQUIRED
+            )
+        if has_date_range and attrs["start_date"] > attrs["end_date"]:
+            raise serializers.ValidationError(messages.INVALID_DATE_RANGE)
+        return attrs
+
+
 class SignUpSerializer(serializers.Serializer):
     """
     Serializer for Sign up
@@ -135,3 +170,13 @@ class ServiceRequestStatusUpdateSerializer(serializers.ModelSerializer):
 
         model = ServiceRequest
         fields = ["status"]
+
+
+service_request_values = ValuesSerializer(
+    MechanicServiceRequestSerializer,
+    related={
+        "comments": ValuesRelated(
+            ServiceCommentViewSerializer, "service_request", order_by=("-created_on",)
+        )
+    },
+)
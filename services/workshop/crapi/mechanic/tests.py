@@ -13,6 +13,10 @@
 """
 contains all the test cases related to mechanic
 """
+import io
+import json
+import zipfile
+from datetime import timedelta
 from django.utils import timezone
 from unittest.mock import patch
 from utils.mock_methods import (
@@ -21,11 +25,13 @@ from utils.mock_methods import (
     get_sample_user_data,
 )
 from crapi.mechanic.models import Mechanic, ServiceRequest, User, ServiceComment
+from crapi.mechanic.serializers import MechanicServiceRequestSerializer
+from crapi.models import RateLimitBucket
 from crapi.user.models import Vehicle, VehicleCompany, VehicleModel
 
 patch("utils.jwt.jwt_auth_required", mock_jwt_auth_required).start()
 
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from utils import messages
 
 
@@ -314,3 +320,178 @@ class MechanicServiceWorkFlowTestCase(TestCase):
         self.assertEqual(comments.status_code, 200)
         print(comments.json())
         self.assertEqual(len(comments.json()), comments_len + 1)
+
+    def test_get_service_requests(self):
+        """
+        creates comments for the service request and a second service request
+        should get the same service requests as MechanicServiceRequestSerializer
+        :return: None
+        """
+        for days in (2, 1):
+            ServiceComment.objects.create(
+                service_request=self.service_request,
+                comment="Comment %s" % days,
+                created_on=timezone.now() - timedelta(days=days),
+            )
+        ServiceRequest.objects.create(
+            vehicle=self.vehicle,
+            mechanic=self.mechanic,
+            problem_details="Brakes are squeaking",
+            created_on=timezone.now(),
+        )
+        res = self.client.get(
+            "/workshop/api/mechanic/service_requests", **self.mechanic_auth_headers
+        )
+        self.assertEqual(res.status_code, 200)
+        service_requests = ServiceRequest.objects.filter(
+            mechanic__user=self.mechanic.user
+        ).order_by("-created_on")
+        expected = MechanicServiceRequestSerializer(service_requests, many=True).data
+        self.assertEqual(
+            res.json()["service_requests"], json.loads(json.dumps(expected))
+        )
+        self.assertEqual(len(res.json()["service_requests"][1]["comments"]), 2)
+
+    def test_get_service_requests_page(self):
+        """
+        creates a second service request and lists them one per page
+        should get only the service request of the requested page
+        :return: None
+        """
+        ServiceRequest.objects.create(
+            vehicle=self.vehicle,
+            mechanic=self.mechanic,
+            problem_details="Brakes are squeaking",
+            created_on=timezone.now(),
+        )
+        res = self.client.get(
+            "/workshop/api/mechanic/service_requests",
+            {"limit": 1, "offset": 1, "fields": "id"},
+            **self.mechanic_auth_headers
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            res.json(),
+            {
+                "service_requests": [{"id": self.service_request.id}],
+                "next_offset": None,
+                "previous_offset": 0,
+                "count": 1,
+            },
+        )
+
+    def test_get_service_requests_fieldset(self):
+        """
+        lists the service requests with fields and expand
+        should get only the requested fields and relations
+        :return: None
+        """
+        ServiceComment.objects.create(
+            service_request=self.service_request,
+            comment="Checked the engine",
+            created_on=timezone.now(),
+        )
+        res = self.client.get(
+            "/workshop/api/mechanic/service_requests",
+            {"fields": "id,status,comments.comment"},
+            **self.mechanic_auth_headers
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            res.json()["service_requests"],
+            [
+                {
+                    "id": self.service_request.id,
+                    "status": "PENDING",
+                    "comments": [{"comment": "Checked the engine"}],
+                }
+            ],
+        )
+        res = self.client.get(
+            "/workshop/api/mechanic/service_requests",
+            {"expand": "vehicle"},
+            **self.mechanic_auth_headers
+        )
+        self.assertEqual(res.status_code, 200)
+        service_request = res.json()["service_requests"][0]
+        self.assertEqual(service_request["mechanic"], self.mechanic.id)
+        self.assertEqual(service_request["vehicle"]["owner"], self.user.id)
+        self.assertNotIn("comments", service_request)
+
+    def test_download_reports(self):
+        """
+        downloads the reports of the mechanic as a zip archive
+        should get a zip with one rendered pdf per service request
+        :return: None
+        """
+        res = self.client.get(
+            "/workshop/api/mechanic/download_reports",
+            {"report_ids": str(self.service_request.id)},
+            **self.mechanic_auth_headers
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res["Content-Type"], "application/zip")
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(res.streaming_content)))
+        self.assertEqual(
+            archive.namelist(), ["report_%s.pdf" % self.service_request.id]
+        )
+        self.assertTrue(
+            archive.read("report_%s.pdf" % self.service_request.id).startswith(b"%PDF")
+        )
+
+    def test_download_reports_bad_request(self):
+        """
+        downloads reports without report_ids or a date range
+        should get a bad request response
+        :return: None
+        """
+        res = self.client.get(
+            "/workshop/api/mechanic/download_reports", **self.mechanic_auth_headers
+        )
+        self.assertEqual(res.status_code, 400)
+        res = self.client.get(
+            "/workshop/api/mechanic/download_reports",
+            {"report_ids": "1,abc"},
+            **self.mechanic_auth_headers
+        )
+        self.assertEqual(res.status_code, 400)
+
+    @override_settings(RATE_LIMITS={"service_report": (2, 60)})
+    def test_get_report_rate_limited(self):
+        """
+        gets reports over the budget of the user, with each backend
+        should get the RateLimit headers, then a too many requests response
+        :return: None
+        """
+        for backend in ("memory", "database"):
+            with self.settings(RATE_LIMIT_BACKEND=backend):
+                for remaining in ("1", "0"):
+                    res = self.client.get(
+                        "/workshop/api/mechanic/mechanic_report",
+                        {"report_id": "abc"},
+                        **self.user_auth_headers
+                    )
+                    self.assertEqual(res.status_code, 400)
+                    self.assertEqual(res["RateLimit-Limit"], "2")
+                    self.assertEqual(res["RateLimit-Remaining"], remaining)
+                    self.assertEqual(res["RateLimit-Policy"], "2;w=60")
+                res = self.client.get(
+                    "/workshop/api/mechanic/mechanic_report",
+                    {"report_id": "abc"},
+                    **self.user_auth_headers
+                )
+                self.assertEqual(res.status_code, 429)
+                self.assertEqual(res["Retry-After"], "30")
+                self.assertEqual(
+                    res.json()["message"], messages.RATE_LIMITED.format(30)
+                )
+        self.assertLess(
+            RateLimitBucket.objects.get(key="service_report:%s" % self.user.id).tokens,
+            1,
+        )
+        res = self.client.get(
+            "/workshop/api/mechanic/mechanic_report",
+            {"report_id": "abc"},
+            **self.mechanic_auth_headers
+        )
+        self.assertEqual(res.status_code, 400)
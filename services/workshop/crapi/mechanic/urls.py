@@ -19,6 +19,7 @@ The `urlpatterns` list routes URLs to views.
 from django.urls import include, re_path
 
 import crapi.mechanic.views as mechanic_views
+from utils.compression import no_compression
 
 urlpatterns = [
     re_path(r"signup$", mechanic_views.SignUpView.as_view()),
@@ -41,6 +42,12 @@ urlpatterns = [
         r"service_request$",
         mechanic_views.MechanicServiceRequestsView.as_view(),
     ),
-    re_path(r"download_report$", mechanic_views.DownloadReportView.as_view()),
+    re_path(
+        r"download_report$", no_compression(mechanic_views.DownloadReportView.as_view())
+    ),
+    re_path(
+        r"download_reports$",
+        no_compression(mechanic_views.DownloadReportsView.as_view()),
+    ),
     re_path(r"$", mechanic_views.MechanicView.as_view()),
 ]
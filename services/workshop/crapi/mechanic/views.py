@@ -18,6 +18,7 @@ contains all the views related to Mechanic
 import os
 import bcrypt
 import re
+from functools import partial
 from urllib.parse import unquote
 from django.template.loader import get_template
 from xhtml2pdf import pisa
@@ -28,21 +29,29 @@ from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.db import models
-from django.http import FileResponse
+from django.http import FileResponse, StreamingHttpResponse
 from crapi_site import settings
 from utils.jwt import jwt_auth_required
 from utils import messages
 from crapi.user.models import User, Vehicle, UserDetails
 from utils.logging import log_error
+from utils.coalescing import coalesced, shared_scope
+from utils.rate_limit import rate_limited
+from utils.values_serializer import FieldsetSerializer
+from utils.zip_stream import iter_zip
+from crapi.user.lookups import vehicle_by_vin
+from .lookups import mechanic_list
 from .models import Mechanic, ServiceRequest, ServiceComment
 from .serializers import (
     MechanicSerializer,
     MechanicServiceRequestSerializer,
     ReceiveReportSerializer,
+    ReportsExportSerializer,
     SignUpSerializer,
     ServiceRequestStatusUpdateSerializer,
     ServiceCommentCreateSerializer,
     ServiceCommentViewSerializer,
+    service_request_values,
 )
 from rest_framework.pagination import LimitOffsetPagination
 
@@ -128,6 +137,7 @@ class MechanicView(APIView, LimitOffsetPagination):
     """
 
     @jwt_auth_required
+    @coalesced(scope=shared_scope)
     def get(self, request, user=None):
         """
         get_mechanic view for fetching the list of mechanics
@@ -139,7 +149,7 @@ class MechanicView(APIView, LimitOffsetPagination):
             mechanics list and 200 status if no error
             message and corresponding status if error
         """
-        mechanics = Mechanic.objects.all().order_by("id")
+        mechanics = mechanic_list()
         paginated = self.paginate_queryset(mechanics, request)
         if paginated is None:
             return Response(
@@ -187,7 +197,7 @@ class ReceiveReportView(APIView):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         report_details = serializer.data
         mechanic = Mechanic.objects.get(mechanic_code=report_details["mechanic_code"])
-        vehicle = Vehicle.objects.get(vin=report_details["vin"])
+        vehicle = vehicle_by_vin(report_details["vin"])
         service_request = ServiceRequest.objects.create(
             vehicle=vehicle,
             mechanic=mechanic,
@@ -211,6 +221,7 @@ class GetReportView(APIView):
     """
 
     @jwt_auth_required
+    @rate_limited("service_report")
     def get(self, request, user=None):
         """
         fetch service request details from report_link
@@ -260,24 +271,34 @@ class MechanicServiceRequestsView(APIView, LimitOffsetPagination):
         :param request: http request for the view
             method allowed: GET
             http request should be authorised by the jwt token of the mechanic
+            query params: 'fields' and 'expand' as comma separated lists
+                of dotted field paths, e.g. fields=id,status&expand=vehicle
         :param user: User object of the requesting user
         :returns Response object with
             list of service request object and 200 status if no error
             message and corresponding status if error
         """
+        fieldset = FieldsetSerializer(
+            data=request.GET, context={"values": service_request_values}
+        )
+        if not fieldset.is_valid():
+            log_error(
+                request.path, request.GET, status.HTTP_400_BAD_REQUEST, fieldset.errors
+            )
+            return Response(fieldset.errors, status=status.HTTP_400_BAD_REQUEST)
+        selection = fieldset.validated_data["selection"]
 
         service_requests = ServiceRequest.objects.filter(mechanic__user=user).order_by(
             "-created_on"
         )
-        paginated = self.paginate_queryset(service_requests, request)
+        paginated = self.paginate_queryset(selection.values(service_requests), request)
         if paginated is None:
             return Response(
                 {"message": messages.NO_OBJECT_FOUND},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        serializer = MechanicServiceRequestSerializer(service_requests, many=True)
         response_data = dict(
-            service_requests=serializer.data,
+            service_requests=selection.serialize(paginated),
             next_offset=(
                 self.offset + self.limit
                 if self.offset + self.limit < self.count
@@ -407,6 +428,73 @@ class DownloadReportView(APIView):
                 status=status.HTTP_403_FORBIDDEN
             )
 
+
+class DownloadReportsView(APIView):
+    """
+    A view to download several service reports as one ZIP archive.
+    """
+
+    @jwt_auth_required
+    def get(self, request, user=None):
+        """
+        streams the service report PDFs of the mechanic as a ZIP archive
+        :param request: http request for the view
+            method allowed: GET
+            http request should be authorised by the jwt token of the mechanic
+            query params: 'report_ids' as a comma separated list
+                or 'start_date' and 'end_date' as YYYY-MM-DD
+        :param user: User object of the requesting user
+        :returns StreamingHttpResponse with the ZIP archive if no error
+            message and corresponding status if error
+        """
+        serializer = ReportsExportSerializer(data=request.GET)
+        if not serializer.is_valid():
+            log_error(
+                request.path,
+                request.GET,
+                status.HTTP_400_BAD_REQUEST,
+                serializer.errors,
+            )
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        criteria = serializer.validated_data
+        service_requests = ServiceRequest.objects.filter(mechanic__user=user)
+        if "report_ids" in criteria:
+            service_requests = service_requests.filter(id__in=criteria["report_ids"])
+        if "start_date" in criteria:
+            service_requests = service_requests.filter(
+                created_on__date__gte=criteria["start_date"]
+            )
+        if "end_date" in criteria:
+            service_requests = service_requests.filter(
+                created_on__date__lte=criteria["end_date"]
+            )
+        report_ids = list(
+            service_requests.order_by("id").values_list("id", flat=True)[
+                : settings.REPORTS_EXPORT_LIMIT + 1
+            ]
+        )
+        if not report_ids:
+            return Response(
+                {"message": messages.NO_REPORTS_FOUND},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        if len(report_ids) > settings.REPORTS_EXPORT_LIMIT:
+            return Response(
+                {
+                    "message": messages.REPORTS_EXPORT_LIMIT_EXCEEDED.format(
+                        settings.REPORTS_EXPORT_LIMIT
+                    )
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        response = StreamingHttpResponse(
+            iter_zip(service_report_entries(report_ids)),
+            content_type="application/zip",
+        )
+        response["Content-Disposition"] = 'attachment; filename="service_reports.zip"'
+        return response
+
+
 def validate_filename(input: str) -> bool:
     """
     Allowed: alphanumerics, _, :, %HH
@@ -415,13 +503,20 @@ def validate_filename(input: str) -> bool:
     return bool(url_encoded_pattern.fullmatch(input))
 
 
+def get_report_filepath(report_id):
+    """
+    Returns the path on the disk of the service report's PDF file.
+    """
+    return os.path.join(settings.BASE_DIR, "reports", f"report_{report_id}")
+
+
 def service_report_pdf(response_data, report_id):
     """
     Generates service report's PDF file from a template and saves it to the disk.
     """
     reports_dir = os.path.join(settings.BASE_DIR, 'reports')
     os.makedirs(reports_dir, exist_ok=True)
-    report_filepath = os.path.join(reports_dir, f"report_{report_id}")
+    report_filepath = get_report_filepath(report_id)
 
     template = get_template('service_report.html')
     html_string = template.render({'service': response_data})
@@ -431,6 +526,29 @@ def service_report_pdf(response_data, report_id):
     manage_reports_directory()
 
 
+def open_service_report_pdf(report_id):
+    """
+    Opens service report's PDF file, rendering it first if it is not on the disk.
+    """
+    report_filepath = get_report_filepath(report_id)
+    try:
+        return open(report_filepath, "rb")
+    except FileNotFoundError:
+        service_request = ServiceRequest.objects.get(id=report_id)
+        response_data = dict(MechanicServiceRequestSerializer(service_request).data)
+        service_report_pdf(response_data, report_id)
+        return open(report_filepath, "rb")
+
+
+def service_report_entries(report_ids):
+    """
+    Yields ZIP entries for the given reports. The PDFs are opened or rendered
+    only when the archive stream reaches them.
+    """
+    for report_id in report_ids:
+        yield f"report_{report_id}.pdf", partial(open_service_report_pdf, report_id)
+
+
 def manage_reports_directory():
     """
     Checks reports directory and deletes the oldest one if the
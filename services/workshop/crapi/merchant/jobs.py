@@ -0,0 +1,293 @@
+#
+# Licensed under the Apache License, Version 2.0 (the “License”);
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an “AS IS” BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Runs contact mechanic calls as jobs on a bounded worker pool
+Jobs run in the worker process which accepted them. When
+CONTACT_MECHANIC_JOB_DIR is set, their state is also written there so
+the other gunicorn workers can answer the polls.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from crapi_site import settings
+
+logger = logging.getLogger()
+
+
+class JobQueueFull(Exception):
+    """
+    Raised when the pool already holds the maximum number of jobs
+    """
+
+
+class ContactMechanicJob:
+    """
+    State of a contact mechanic job
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    FINISHED = "finished"
+
+    def __init__(self, user_id, on_change=None):
+        self.id = str(uuid.uuid4())
+        self.user_id = user_id
+        self.status = self.QUEUED
+        self.attempts = 0
+        self.last_status = None
+        self.response = None
+        self.response_status = None
+        self.created_on = timezone.now()
+        self.finished_on = None
+        self.finished_at = None
+        self._on_change = on_change
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        :param data: dict of to_dict with the user_id of the job
+        :return: ContactMechanicJob
+        """
+        job = cls(data["user_id"])
+        job.id = data["id"]
+        job.status = data["status"]
+        job.attempts = data["attempts"]
+        job.last_status = data["last_status"]
+        job.response = data["response"]
+        job.response_status = data["response_status"]
+        job.created_on = parse_datetime(data["created_on"])
+        if data["finished_on"]:
+            job.finished_on = parse_datetime(data["finished_on"])
+        return job
+
+    def _changed(self, state=None):
+        if self._on_change is not None:
+            self._on_change(self, state)
+
+    def record_attempt(self, attempt, response, error):
+        """
+        on_attempt callback of the mechanic api client
+        """
+        with self._lock:
+            self.attempts = attempt
+            self.last_status = (
+                response.status_code if response is not None else type(error).__name__
+            )
+        self._changed()
+
+    def start(self):
+        with self._lock:
+            self.status = self.RUNNING
+        self._changed()
+
+    def finish(self, response, response_status):
+        finished_on = timezone.now()
+        # Saved first, so that the other workers do not read the job running
+        # once this one reports it finished
+        self._changed(
+            dict(
+                self.to_dict(),
+                status=self.FINISHED,
+                response=response,
+                response_status=response_status,
+                finished_on=finished_on,
+            )
+        )
+        with self._lock:
+            self.response = response
+            self.response_status = response_status
+            self.status = self.FINISHED
+            self.finished_on = finished_on
+            self.finished_at = time.monotonic()
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "id": self.id,
+                "status": self.status,
+                "attempts": self.attempts,
+                "last_status": self.last_status,
+                "response": self.response,
+                "response_status": self.response_status,
+                "created_on": self.created_on,
+                "finished_on": self.finished_on,
+            }
+
+
+class ContactMechanicJobRunner:
+    """
+    Bounded pool running contact mechanic jobs
+    At most max_workers jobs run at a time and at most max_pending wait for
+    a worker, further submissions are rejected with JobQueueFull
+    :param state_dir: directory shared by the workers the state of the jobs
+        is written to, jobs are only kept in memory when empty
+    """
+
+    def __init__(self, max_workers, max_pending, ttl, state_dir=""):
+        self.max_workers = max_workers
+        self.ttl = ttl
+        self.state_dir = state_dir
+        self._swept_at = time.monotonic()
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        self._executor = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="contact-mechanic"
+            )
+        return self._executor
+
+    def _evict_expired(self):
+        expired_before = time.monotonic() - self.ttl
+        for job_id, job in list(self._jobs.items()):
+            if job.finished_at is not None and job.finished_at < expired_before:
+                del self._jobs[job_id]
+                self._remove_state(job_id)
+        if self.state_dir and self._swept_at < expired_before:
+            # Jobs of the workers which were recycled
+            self._swept_at = time.monotonic()
+            for name in os.listdir(self.state_dir):
+                self._expired_state(os.path.join(self.state_dir, name))
+
+    def _state_path(self, job_id):
+        return os.path.join(self.state_dir, f"{job_id}.json")
+
+    def _expired_state(self, path):
+        """
+        removes the state file at path if it was not written for ttl
+        :return: True if it was expired
+        """
+        try:
+            if time.time() - os.path.getmtime(path) < self.ttl:
+                return False
+            os.remove(path)
+        except OSError:
+            pass
+        return True
+
+    def _remove_state(self, job_id):
+        if self.state_dir:
+            try:
+                os.remove(self._state_path(job_id))
+            except OSError:
+                pass
+
+    def _save_state(self, job, state=None):
+        """
+        writes the state of the job, job.to_dict() by default
+        """
+        if not self.state_dir:
+            return
+        if state is None:
+            state = job.to_dict()
+        path = self._state_path(job.id)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}"
+        try:
+            with open(temp_path, "w") as state_file:
+                json.dump(
+                    dict(state, user_id=job.user_id),
+                    state_file,
+                    default=lambda value: value.isoformat(),
+                )
+            os.replace(temp_path, path)
+        except (OSError, TypeError, AttributeError) as e:
+            logger.warning(f"Could not save the state of job {job.id}: {e}")
+
+    def _load_state(self, job_id):
+        if not self.state_dir:
+            return None
+        path = self._state_path(job_id)
+        if self._expired_state(path):
+            return None
+        try:
+            with open(path) as state_file:
+                return ContactMechanicJob.from_dict(json.load(state_file))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def submit(self, user_id, work):
+        """
+        queues a job
+        :param user_id: id of the user owning the job
+        :param work: function called with the job, returning
+            (response, response_status) of the mechanic api
+        :return: ContactMechanicJob
+        :raises JobQueueFull: if the pool is saturated
+        """
+        if not self._slots.acquire(blocking=False):
+            raise JobQueueFull()
+        job = ContactMechanicJob(user_id, on_change=self._save_state)
+        try:
+            self._save_state(job)
+            with self._lock:
+                self._evict_expired()
+                self._jobs[job.id] = job
+                self._get_executor().submit(self._run, job, work)
+        except BaseException:
+            # _run releases the slot of a job only once it is running
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            self._remove_state(job.id)
+            self._slots.release()
+            raise
+        return job
+
+    def _run(self, job, work):
+        job.start()
+        try:
+            response, response_status = work(job)
+        except Exception as e:
+            logger.error(f"Contact mechanic job {job.id} failed: {e}", exc_info=True)
+            response, response_status = {"message": str(e)}, 500
+        finally:
+            self._slots.release()
+        job.finish(response, response_status)
+
+    def get(self, job_id):
+        """
+        :param job_id: id of the job
+        :return: ContactMechanicJob or None if unknown or expired
+        """
+        with self._lock:
+            self._evict_expired()
+            job = self._jobs.get(job_id)
+        if job is None:
+            # Accepted by another worker
+            job = self._load_state(job_id)
+        return job
+
+
+job_runner = ContactMechanicJobRunner(
+    max_workers=settings.CONTACT_MECHANIC_JOB_WORKERS,
+    max_pending=settings.CONTACT_MECHANIC_JOB_QUEUE_SIZE,
+    ttl=settings.CONTACT_MECHANIC_JOB_TTL,
+    state_dir=settings.CONTACT_MECHANIC_JOB_DIR,
+)
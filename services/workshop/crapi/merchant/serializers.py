@@ -18,6 +18,8 @@ contains serializers for Merchant APIs
 from rest_framework import serializers
 from crapi.mechanic.models import Mechanic, ServiceRequest, ServiceComment
 from crapi.mechanic.serializers import VehicleSerializer, ServiceCommentViewSerializer
+from crapi_site import settings
+from utils.values_serializer import ValuesRelated, ValuesSerializer
 
 
 class ContactMechanicSerializer(serializers.Serializer):
@@ -26,8 +28,14 @@ class ContactMechanicSerializer(serializers.Serializer):
     """
 
     mechanic_api = serializers.CharField()
+    mechanic_apis = serializers.ListField(
+        child=serializers.CharField(),
+        required=False,
+        max_length=settings.MECHANIC_API_MAX_FANOUT,
+    )
     repeat_request_if_failed = serializers.BooleanField(required=False)
     number_of_repeats = serializers.IntegerField(required=False)
+    run_as_job = serializers.BooleanField(required=False)
 
 
 class MechanicPublicSerializer(serializers.ModelSerializer):
@@ -76,3 +84,13 @@ class UserServiceRequestSerializer(serializers.ModelSerializer):
             "updated_on",
             "comments",
         )
+
+
+user_service_request_values = ValuesSerializer(
+    UserServiceRequestSerializer,
+    related={
+        "comments": ValuesRelated(
+            ServiceCommentViewSerializer, "service_request", order_by=("id",)
+        )
+    },
+)
@@ -13,21 +13,31 @@
 """
 contains all the test cases related to merchant
 """
-from unittest.mock import patch
+from unittest.mock import AsyncMock, Mock, patch
 from utils.mock_methods import (
     get_sample_mechanic_data,
+    mock_async_jwt_auth_required,
     mock_jwt_auth_required,
     get_sample_user_data,
 )
 from crapi.mechanic.models import ServiceRequest, Mechanic
 
 patch("utils.jwt.jwt_auth_required", mock_jwt_auth_required).start()
+patch("utils.jwt.async_jwt_auth_required", mock_async_jwt_auth_required).start()
 
+import asyncio
+import os
+import tempfile
+import time
+import uuid
 import bcrypt
-from django.test import TestCase, Client
+import httpx
+from django.test import SimpleTestCase, TestCase, Client
 from django.utils import timezone
 from utils import messages
 from crapi.user.models import User, Vehicle, VehicleModel, VehicleCompany
+from crapi.merchant.jobs import ContactMechanicJob, ContactMechanicJobRunner
+from utils.http_client import get_first_success, get_with_retries
 
 
 class MerchantTestCase(TestCase):
@@ -164,6 +174,66 @@ class MerchantTestCase(TestCase):
         )
         self.assertEqual(res.status_code, 200)
 
+    def test_contact_mechanic_params(self):
+        """
+        contacts a mechanic api with the fields of contact_mechanic
+        should only forward the fields of the receive_report api
+        :return: None
+        """
+        self.contact_mechanic_request_body["mechanic_apis"] = ["http://127.0.0.1:1/"]
+        get = AsyncMock(return_value=httpx.Response(200, json={"sent": True}))
+        with patch("crapi.merchant.views.get_first_success", get):
+            res = self.client.post(
+                "/workshop/api/merchant/contact_mechanic",
+                self.contact_mechanic_request_body,
+                **self.user_auth_headers,
+                content_type="application/json"
+            )
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            get.call_args.kwargs["params"],
+            {
+                "mechanic_code": self.mechanic["mechanic_code"],
+                "vin": self.vehicle.vin,
+                "problem_details": "My Car is not working",
+            },
+        )
+
+    def test_contact_mechanic_job(self):
+        """
+        runs contact mechanic as a job against an unreachable mechanic api
+        should get 202 with a job id
+        polls the job status until it is finished
+        should get the attempts and the final response of the job
+        only the owner of the job should be able to see it
+        :return: None
+        """
+        self.contact_mechanic_request_body["mechanic_api"] = "http://127.0.0.1:1/api"
+        self.contact_mechanic_request_body["number_of_repeats"] = 1
+        self.contact_mechanic_request_body["run_as_job"] = True
+        res = self.client.post(
+            "/workshop/api/merchant/contact_mechanic",
+            self.contact_mechanic_request_body,
+            **self.user_auth_headers,
+            content_type="application/json"
+        )
+        self.assertEqual(res.status_code, 202)
+        job_url = "/workshop/api/merchant/contact_mechanic/jobs/%s" % res.json()["id"]
+        self.assertTrue(res.json()["status_url"].endswith(job_url))
+
+        for _ in range(100):
+            job = self.client.get(job_url, **self.user_auth_headers).json()
+            if job["status"] == "finished":
+                break
+            time.sleep(0.1)
+        self.assertEqual(job["status"], "finished")
+        self.assertEqual(job["attempts"], 2)
+        self.assertEqual(job["response_status"], 400)
+        self.assertEqual(job["response"]["message"], messages.COULD_NOT_CONNECT)
+
+        res = self.client.get(job_url, **self.mechanic_auth_headers)
+        self.assertEqual(res.status_code, 404)
+
     def test_receive_report_and_get_report(self):
         """
         tests receive_report with a valid request
@@ -335,3 +405,149 @@ class UserServiceRequestsViewTestCase(TestCase):
         self.assertEqual(len(res.json()["service_requests"]), service_request_count + 1)
         self.assertEqual(res.json()["service_requests"][0]["status"], "PENDING")
         self.assertEqual(res.json()["service_requests"][1]["status"], "COMPLETED")
+
+        res = self.client.get(
+            "/workshop/api/merchant/service_requests/%s" % vin,
+            {"limit": 1, "offset": 1, "fields": "id"},
+            **self.user_auth_headers
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            res.json()["service_requests"], [{"id": self.service_request.id}]
+        )
+        self.assertEqual(res.json()["previous_offset"], 0)
+
+
+class ContactMechanicRetryTestCase(SimpleTestCase):
+    """
+    contains the test cases of the retrying mechanic api client
+    """
+
+    def get_client(self, handler):
+        """
+        creates a client which answers every request with the handler
+        :param handler: function from httpx.Request to httpx.Response
+        :return: httpx.AsyncClient
+        """
+        return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    def test_retries_until_success(self):
+        """
+        mechanic api fails twice before answering
+        should get the successful response on the third attempt
+        :return: None
+        """
+        attempts = []
+
+        def handler(request):
+            attempts.append(request)
+            if len(attempts) < 3:
+                return httpx.Response(503)
+            return httpx.Response(200, json={"status": "ok"})
+
+        response = asyncio.run(
+            get_with_retries(
+                "http://mechanic.test/api",
+                attempts=5,
+                backoff_base=0.001,
+                backoff_max=0.001,
+                client=self.get_client(handler),
+            )
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(attempts), 3)
+
+    def test_stops_at_deadline(self):
+        """
+        mechanic api never answers 200 and the deadline is shorter than the backoff
+        should get the failed response without using all the attempts
+        :return: None
+        """
+        attempts = []
+
+        def handler(request):
+            attempts.append(request)
+            return httpx.Response(503)
+
+        response = asyncio.run(
+            get_with_retries(
+                "http://mechanic.test/api",
+                attempts=100,
+                deadline=0.05,
+                backoff_base=1,
+                backoff_max=1,
+                client=self.get_client(handler),
+            )
+        )
+        self.assertEqual(response.status_code, 503)
+        self.assertLess(len(attempts), 100)
+
+    def test_first_success(self):
+        """
+        contacts a failing and a working mechanic api concurrently
+        should get the response of the working one
+        :return: None
+        """
+
+        def handler(request):
+            if request.url.host == "down.test":
+                raise httpx.ConnectError("connection refused", request=request)
+            return httpx.Response(200, json={"mechanic": request.url.host})
+
+        response = asyncio.run(
+            get_first_success(
+                ["http://down.test/api", "http://up.test/api"],
+                attempts=2,
+                backoff_base=0.001,
+                backoff_max=0.001,
+                client=self.get_client(handler),
+            )
+        )
+        self.assertEqual(response.json(), {"mechanic": "up.test"})
+
+
+class ContactMechanicJobStateTestCase(SimpleTestCase):
+    """
+    contains the test cases of the contact mechanic jobs shared by workers
+    """
+
+    def test_job_polled_from_another_worker(self):
+        """
+        runs a job in a runner and polls it from another one sharing its state dir
+        should get the state of the job from both runners
+        :return: None
+        """
+        with tempfile.TemporaryDirectory() as state_dir:
+            runner = ContactMechanicJobRunner(1, 1, ttl=60, state_dir=state_dir)
+            other_runner = ContactMechanicJobRunner(1, 1, ttl=60, state_dir=state_dir)
+            job = runner.submit(1, lambda job: ({"sent": True}, 200))
+            for _ in range(100):
+                polled_job = other_runner.get(job.id)
+                if polled_job.status == ContactMechanicJob.FINISHED:
+                    break
+                time.sleep(0.01)
+
+            self.assertEqual(job.status, ContactMechanicJob.FINISHED)
+            self.assertEqual(polled_job.user_id, 1)
+            self.assertEqual(polled_job.to_dict(), job.to_dict())
+            self.assertIsNone(other_runner.get(str(uuid.uuid4())))
+
+    def test_failed_submit_releases_slot(self):
+        """
+        submits a job to a runner whose pool cannot take it, then another one
+        should raise for the first job and still run the second one
+        :return: None
+        """
+        with tempfile.TemporaryDirectory() as state_dir:
+            runner = ContactMechanicJobRunner(1, 1, ttl=60, state_dir=state_dir)
+            executor = Mock(**{"submit.side_effect": RuntimeError("shut down")})
+            with patch.object(runner, "_get_executor", return_value=executor):
+                with self.assertRaises(RuntimeError):
+                    runner.submit(1, lambda job: ({"sent": True}, 200))
+            self.assertEqual(os.listdir(state_dir), [])
+            job = runner.submit(1, lambda job: ({"sent": True}, 200))
+            for _ in range(100):
+                if job.status == ContactMechanicJob.FINISHED:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(job.status, ContactMechanicJob.FINISHED)
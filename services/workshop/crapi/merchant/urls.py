@@ -22,6 +22,11 @@ import crapi.merchant.views as merchant_views
 
 urlpatterns = [
     re_path(r"contact_mechanic$", merchant_views.ContactMechanicView.as_view()),
+    re_path(
+        r"contact_mechanic/jobs/(?P<job_id>[0-9a-f-]+)$",
+        merchant_views.ContactMechanicJobView.as_view(),
+        name="contact-mechanic-job",
+    ),
     re_path(
         r"service_requests/(?P<vin>[^/]+)$",
         merchant_views.UserServiceRequestsView.as_view(),
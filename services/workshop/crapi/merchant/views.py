@@ -15,44 +15,59 @@
 """
 contains all the views related to Merchant
 """
+import asyncio
 import logging
-import requests
-from requests.exceptions import MissingSchema, InvalidURL
+import httpx
+from django.urls import reverse
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from crapi.mechanic.serializers import (
+    ReceiveReportSerializer,
     ServiceCommentViewSerializer,
     ServiceCommentCreateSerializer,
 )
-from utils.jwt import jwt_auth_required
+from utils.async_views import AsyncAPIView
+from utils.jwt import async_jwt_auth_required, jwt_auth_required
 from utils import messages
 from rest_framework.pagination import LimitOffsetPagination
+from utils.http_client import get_first_success, run_async, run_sync
 from utils.logging import log_error
+from utils.rate_limit import rate_limited
 from crapi_site import settings
 from crapi.mechanic.models import ServiceRequest, ServiceComment
-from .serializers import ContactMechanicSerializer, UserServiceRequestSerializer
+from .jobs import JobQueueFull, job_runner
+from utils.values_serializer import FieldsetSerializer
+from .serializers import ContactMechanicSerializer, user_service_request_values
 
 
 logger = logging.getLogger()
 
+# Query params of the receive_report api of the mechanics
+MECHANIC_API_PARAMS = tuple(ReceiveReportSerializer().fields)
 
-class ContactMechanicView(APIView):
+
+class ContactMechanicView(AsyncAPIView):
     """
     View for contact mechanic feature
     """
 
-    @jwt_auth_required
-    def post(self, request, user=None):
+    @async_jwt_auth_required
+    @rate_limited("contact_mechanic")
+    async def post(self, request, user=None):
         """
         contact_mechanic view to call the mechanic api
         :param request: http request for the view
             method allowed: POST
             http request should be authorised by the jwt token of the user
             mandatory fields: ['mechanic_api']
+            optional fields: ['mechanic_apis'] further apis which are
+                contacted concurrently, the first success is returned
+                ['run_as_job'] queue the call and return 202 with a job id
         :param user: User object of the requesting user
         :returns Response object with
             response_from_mechanic_api and 200 status if no error
+            job id and status url and 202 status if run as a job
             message and corresponding status if error
         """
         request_data = request.data
@@ -79,53 +94,126 @@ class ContactMechanicView(APIView):
                 status=status.HTTP_503_SERVICE_UNAVAILABLE,
             )
 
-        repeat_count = 0
-        while True:
-            request_url = request_data["mechanic_api"]
-            logger.info(f"Repeat count: {repeat_count}, mechanic_api: {request_url}")
+        number_of_attempts = number_of_repeats + 1 if repeat_request_if_failed else 1
+        mechanic_apis = [
+            request_data["mechanic_api"],
+            *serializer.validated_data.get("mechanic_apis", []),
+        ]
+        params = {
+            field: request_data[field]
+            for field in MECHANIC_API_PARAMS
+            if field in request_data
+        }
+        authorization = request.META.get("HTTP_AUTHORIZATION")
+        if serializer.validated_data.get("run_as_job", False):
             try:
-                mechanic_response = requests.get(
-                    request_url,
-                    params=request_data,
-                    headers={"Authorization": request.META.get("HTTP_AUTHORIZATION")},
-                    verify=False,
+                job = job_runner.submit(
+                    user.id,
+                    lambda job: run_sync(
+                        contact_mechanic_apis(
+                            request.path,
+                            mechanic_apis,
+                            params,
+                            authorization,
+                            number_of_attempts,
+                            on_attempt=job.record_attempt,
+                        )
+                    ),
+                )
+            except JobQueueFull:
+                return Response(
+                    {"message": messages.CONTACT_MECHANIC_JOB_QUEUE_FULL},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE,
                 )
-                if mechanic_response.status_code == status.HTTP_200_OK:
-                    logger.info(f"Got a valid response at repeat count: {repeat_count}")
-                    break
-                if not repeat_request_if_failed:
-                    break
-                if repeat_count == number_of_repeats:
-                    break
-                repeat_count += 1
-            except (MissingSchema, InvalidURL) as e:
-                log_error(request.path, request.data, status.HTTP_400_BAD_REQUEST, e)
-                return Response({"message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
-            except requests.exceptions.ConnectionError as e:
-                if not repeat_request_if_failed:
-                    return Response(
-                        {"message": messages.COULD_NOT_CONNECT},
-                        status=status.HTTP_400_BAD_REQUEST,
-                    )
-                if repeat_count == number_of_repeats:
-                    return Response(
-                        {"message": messages.COULD_NOT_CONNECT},
-                        status=status.HTTP_400_BAD_REQUEST,
-                    )
-                repeat_count += 1
-                continue
-        mechanic_response_status = mechanic_response.status_code
-        try:
-            mechanic_response = mechanic_response.json()
-        except ValueError:
-            mechanic_response = mechanic_response.text
-        return Response(
-            {
-                "response_from_mechanic_api": mechanic_response,
-                "status": mechanic_response_status,
-            },
-            status=mechanic_response_status,
+            status_url = request.build_absolute_uri(
+                reverse("contact-mechanic-job", kwargs={"job_id": job.id})
+            )
+            return Response(
+                {"id": job.id, "status": job.status, "status_url": status_url},
+                status=status.HTTP_202_ACCEPTED,
+            )
+
+        response_data, response_status = await run_async(
+            contact_mechanic_apis(
+                request.path, mechanic_apis, params, authorization, number_of_attempts
+            )
         )
+        return Response(response_data, status=response_status)
+
+
+class ContactMechanicJobView(APIView):
+    """
+    View to poll the state of a contact mechanic job
+    """
+
+    @jwt_auth_required
+    def get(self, request, user=None, job_id=None):
+        """
+        fetch the state of a contact mechanic job of the user
+        :param request: http request for the view
+            method allowed: GET
+            http request should be authorised by the jwt token of the user
+        :param user: User object of the requesting user
+        :param job_id: id of the job returned by contact_mechanic
+        :returns Response object with
+            attempts, last status and mechanic response of the job
+            and 200 status if no error
+            message and corresponding status if error
+        """
+        job = job_runner.get(job_id)
+        if job is None or job.user_id != user.id:
+            return Response(
+                {"message": messages.NO_OBJECT_FOUND},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        return Response(job.to_dict(), status=status.HTTP_200_OK)
+
+
+async def contact_mechanic_apis(
+    request_path,
+    mechanic_apis,
+    params,
+    authorization,
+    number_of_attempts,
+    on_attempt=None,
+):
+    """
+    calls the mechanic apis and returns the first successful answer
+    meant to run on the shared outbound event loop with run_sync or run_async
+    :param request_path: path of the contact_mechanic request, for the logs
+    :param mechanic_apis: urls of the mechanic apis
+    :param params: query params sent to the mechanic apis
+    :param authorization: Authorization header sent to the mechanic apis
+    :param number_of_attempts: maximum number of attempts per mechanic api
+    :param on_attempt: called with (attempt, response, error) after every attempt
+    :return: tuple of response data and status code
+    """
+    try:
+        mechanic_response = await asyncio.wait_for(
+            get_first_success(
+                mechanic_apis,
+                params=params,
+                headers={"Authorization": authorization},
+                attempts=number_of_attempts,
+                on_attempt=on_attempt,
+            ),
+            timeout=settings.MECHANIC_API_DEADLINE
+            + settings.MECHANIC_API_ATTEMPT_TIMEOUT,
+        )
+    except (httpx.UnsupportedProtocol, httpx.InvalidURL) as e:
+        log_error(request_path, params, status.HTTP_400_BAD_REQUEST, e)
+        return {"message": str(e)}, status.HTTP_400_BAD_REQUEST
+    except (httpx.TransportError, asyncio.TimeoutError):
+        return {"message": messages.COULD_NOT_CONNECT}, status.HTTP_400_BAD_REQUEST
+    mechanic_response_status = mechanic_response.status_code
+    try:
+        mechanic_response = mechanic_response.json()
+    except ValueError:
+        mechanic_response = mechanic_response.text
+    return {
+        "response_from_mechanic_api": mechanic_response,
+        "status": mechanic_response_status,
+    }, mechanic_response_status
 
 
 class UserServiceCommentView(APIView):
@@ -169,24 +257,34 @@ class UserServiceRequestsView(APIView, LimitOffsetPagination):
         :param request: http request for the view
             method allowed: GET
             http request should be authorised by the jwt token of the mechanic
+            query params: 'fields' and 'expand' as comma separated lists
+                of dotted field paths, e.g. fields=id,status&expand=vehicle
         :param user: User object of the requesting user
         :returns Response object with
             list of service request object and 200 status if no error
             message and corresponding status if error
         """
+        fieldset = FieldsetSerializer(
+            data=request.GET, context={"values": user_service_request_values}
+        )
+        if not fieldset.is_valid():
+            log_error(
+                request.path, request.GET, status.HTTP_400_BAD_REQUEST, fieldset.errors
+            )
+            return Response(fieldset.errors, status=status.HTTP_400_BAD_REQUEST)
+        selection = fieldset.validated_data["selection"]
 
         service_requests = ServiceRequest.objects.filter(vehicle__vin=vin).order_by(
             "-created_on"
         )
-        paginated = self.paginate_queryset(service_requests, request)
+        paginated = self.paginate_queryset(selection.values(service_requests), request)
         if paginated is None:
             return Response(
                 {"message": messages.NO_OBJECT_FOUND},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        serializer = UserServiceRequestSerializer(service_requests, many=True)
         response_data = dict(
-            service_requests=serializer.data,
+            service_requests=selection.serialize(paginated),
             next_offset=(
                 self.offset + self.limit
                 if self.offset + self.limit < self.count
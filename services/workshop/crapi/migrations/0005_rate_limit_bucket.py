@@ -0,0 +1,27 @@
+# Generated by Django 4.1.13 on 2026-10-19 17:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crapi", "0004_alter_servicerequest_status_servicecomment"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RateLimitBucket",
+            fields=[
+                (
+                    "key",
+                    models.CharField(max_length=255, primary_key=True, serialize=False),
+                ),
+                ("tokens", models.FloatField()),
+                ("updated_on", models.DateTimeField()),
+            ],
+            options={
+                "db_table": "rate_limit_bucket",
+            },
+        ),
+    ]
@@ -10,3 +10,26 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+
+
+"""
+Models shared by the apps of crapi
+"""
+from django.db import models
+
+
+class RateLimitBucket(models.Model):
+    """
+    RateLimitBucket Model
+    represents the token bucket of a user for a rate limited scope
+    """
+
+    key = models.CharField(max_length=255, primary_key=True)
+    tokens = models.FloatField()
+    updated_on = models.DateTimeField()
+
+    class Meta:
+        db_table = "rate_limit_bucket"
+
+    def __str__(self):
+        return f"{self.key} - {self.tokens}"
@@ -0,0 +1,98 @@
+#
+# Licensed under the Apache License, Version 2.0 (the “License”);
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an “AS IS” BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Keeps the product catalog in memory, shared by all the users
+The workers load it from the shared cache, so a single one queries it.
+"""
+import hashlib
+import os
+import threading
+import time
+from crapi_site import settings
+from crapi.shop.models import Product
+from crapi.shop.serializers import product_values
+from utils.cache import memoize
+from utils.invalidation import bus
+from utils.renderers import ORJSONRenderer
+
+
+@memoize("product_catalog", ttl=settings.PRODUCT_CATALOG_TTL, models=(Product,))
+def load_catalog():
+    """
+    :return: (list of serialized products, content hash of the list)
+    """
+    products = product_values.data(Product.objects.all().order_by("-id"))
+    return products, hashlib.sha1(ORJSONRenderer().render(products)).hexdigest()
+
+
+class ProductCatalog:
+    """
+    Process wide cache of the serialized product list
+    The list is loaded once per ttl, or after invalidate, by a single thread.
+    Every version of the list gets a content hash used in the ETag of the
+    product API.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entry = None
+        self._generation = 0
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        self._lock = threading.Lock()
+
+    def _fresh_entry(self):
+        entry = self._entry
+        if entry is not None and time.monotonic() - entry[2] < self.ttl:
+            return entry
+        return None
+
+    def get(self):
+        """
+        :return: (list of serialized products, content hash of the list)
+        """
+        entry = self._fresh_entry()
+        if entry is None:
+            with self._lock:
+                entry = self._fresh_entry()
+                if entry is None:
+                    entry = self._load()
+        return entry[0], entry[1]
+
+    def _load(self):
+        generation = self._generation
+        products, version = load_catalog()
+        entry = (products, version, time.monotonic())
+        # A write during the load makes the loaded list outdated already
+        if generation == self._generation:
+            self._entry = entry
+        return entry
+
+    def evict(self, message=None):
+        """
+        drops the list of the worker, after a write of another worker
+        """
+        self._generation += 1
+        self._entry = None
+
+    def invalidate(self):
+        self.evict()
+        load_catalog.invalidate()
+
+
+product_catalog = ProductCatalog(ttl=settings.PRODUCT_CATALOG_TTL)
+bus.subscribe(Product, product_catalog.evict, product_catalog.evict)
@@ -0,0 +1,260 @@
+#
+# Licensed under the Apache License, Version 2.0 (the “License”);
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an “AS IS” BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Fetches the payment details of orders from the API gateway
+and caches them per transaction_id
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from asgiref.sync import sync_to_async
+from django.db import connections
+from crapi_site import settings
+from crapi.shop.models import Order
+from crapi.user.models import UserDetails
+from crapi.user.serializers import UserSerializer
+from utils.helper import basic_auth
+from utils.http_client import post, run_async
+from utils.invalidation import bus
+from utils.metrics import observe_outbound
+
+logger = logging.getLogger()
+
+
+def payment_request_data(order, order_data):
+    """
+    :param order: Order object
+    :param order_data: serialized order
+    :return: body of the payment request of the order
+    """
+    user_dict = UserSerializer(order.user).data
+    user_details = UserDetails.objects.get(user=order.user)
+    user_dict["name"] = user_details.name
+    data = {}
+    data["user"] = user_dict
+    data["order"] = order_data
+    data["amount"] = float(order.product.price) * int(order.quantity)
+    return data
+
+
+def gateway_headers():
+    gateway_credential = basic_auth(
+        settings.API_GATEWAY_USERNAME, settings.API_GATEWAY_PASSWORD
+    )
+    return {
+        "Authorization": gateway_credential,
+        "Content-Type": "application/json",
+    }
+
+
+def payment_from_response(payment_response):
+    """
+    :param payment_response: response of the API gateway
+    :return: payment details, empty if the gateway failed
+    """
+    payment = {}
+    if payment_response.status_code == 200:
+        payment = payment_response.json()
+    else:
+        logging.error(
+            "Payment response error, {}: {}".format(
+                payment_response.status_code, payment_response.content
+            )
+        )
+    logging.debug("payment response: {}".format(payment))
+    return payment
+
+
+def request_payment(order, order_data):
+    """
+    asks the API gateway for the payment details of an order
+    :param order: Order object
+    :param order_data: serialized order
+    :return: payment details, empty if the gateway failed
+    """
+    payment = {}
+    try:
+        data = payment_request_data(order, order_data)
+        gateway_endpoint = settings.API_GATEWAY_URL + "/v1/payment"
+        logging.debug(gateway_endpoint)
+        try:
+            with observe_outbound("gateway"):
+                payment_response = requests.post(
+                    gateway_endpoint,
+                    headers=gateway_headers(),
+                    json=data,
+                    verify=False,
+                    timeout=5,
+                )
+            payment = payment_from_response(payment_response)
+        except Exception as e:
+            logging.error(e, exc_info=True)
+    except Exception as e:
+        logging.error(e, exc_info=True)
+    return payment
+
+
+async def request_payment_async(order, order_data):
+    """
+    asks the API gateway for the payment details of an order
+    without holding a thread while waiting for it
+    :param order: Order object
+    :param order_data: serialized order
+    :return: payment details, empty if the gateway failed
+    """
+    payment = {}
+    try:
+        data = await sync_to_async(payment_request_data)(order, order_data)
+        gateway_endpoint = settings.API_GATEWAY_URL + "/v1/payment"
+        logging.debug(gateway_endpoint)
+        try:
+            with observe_outbound("gateway"):
+                payment_response = await run_async(
+                    post(
+                        gateway_endpoint,
+                        headers=gateway_headers(),
+                        json=data,
+                        timeout=5,
+                    )
+                )
+            payment = payment_from_response(payment_response)
+        except Exception as e:
+            logging.error(e, exc_info=True)
+    except Exception as e:
+        logging.error(e, exc_info=True)
+    return payment
+
+
+class PaymentCache:
+    """
+    Process wide cache of payment details keyed by transaction_id
+    Entries younger than ttl are served as they are. Entries younger than
+    ttl + stale_ttl are served too, while a background thread refreshes them.
+    Failed gateway calls are never cached.
+    """
+
+    def __init__(self, ttl, stale_ttl, max_entries):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = None
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._executor = None
+
+    def get(self, transaction_id, fetch):
+        """
+        returns the payment details of a transaction
+        :param transaction_id: key of the cache entry
+        :param fetch: function returning fresh payment details
+        :return: payment details
+        """
+        payment = self._cached(transaction_id, fetch)
+        if payment is None:
+            payment = fetch()
+            self.set(transaction_id, payment)
+        return payment
+
+    async def aget(self, transaction_id, fetch, refresh):
+        """
+        returns the payment details of a transaction in async views
+        :param transaction_id: key of the cache entry
+        :param fetch: coroutine function returning fresh payment details
+        :param refresh: function returning fresh payment details,
+            called by the background refresh of stale entries
+        :return: payment details
+        """
+        payment = self._cached(transaction_id, refresh)
+        if payment is None:
+            payment = await fetch()
+            self.set(transaction_id, payment)
+        return payment
+
+    def _cached(self, transaction_id, refresh):
+        """
+        :return: cached payment details, None if they must be fetched
+        """
+        with self._lock:
+            entry = self._entries.get(transaction_id)
+        if entry is not None:
+            payment, fetched_at = entry
+            age = time.monotonic() - fetched_at
+            if age < self.ttl:
+                return payment
+            if age < self.ttl + self.stale_ttl:
+                self._refresh_in_background(transaction_id, refresh)
+                return payment
+        return None
+
+    def set(self, transaction_id, payment):
+        if not payment:
+            return
+        with self._lock:
+            self._entries[transaction_id] = (payment, time.monotonic())
+            self._entries.move_to_end(transaction_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, transaction_id):
+        with self._lock:
+            self._entries.pop(transaction_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def evict(self, message):
+        """
+        drops the payment of an order written by another worker
+        """
+        self.invalidate(message["transaction_id"])
+
+    def _refresh_in_background(self, transaction_id, fetch):
+        with self._lock:
+            if transaction_id in self._refreshing:
+                return
+            self._refreshing.add(transaction_id)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=settings.PAYMENT_CACHE_REFRESH_WORKERS,
+                    thread_name_prefix="payment-refresh",
+                )
+        self._executor.submit(self._refresh, transaction_id, fetch)
+
+    def _refresh(self, transaction_id, fetch):
+        try:
+            self.set(transaction_id, fetch())
+        finally:
+            with self._lock:
+                self._refreshing.discard(transaction_id)
+            connections.close_all()
+
+
+payment_cache = PaymentCache(
+    ttl=settings.PAYMENT_CACHE_TTL,
+    stale_ttl=settings.PAYMENT_CACHE_STALE_TTL,
+    max_entries=settings.PAYMENT_CACHE_MAX_ENTRIES,
+)
+bus.subscribe(Order, payment_cache.evict, payment_cache.clear)
@@ -19,6 +19,7 @@ from rest_framework import serializers
 
 from crapi.shop.models import Order, Product, Coupon
 from crapi.user.serializers import UserSerializer
+from utils.values_serializer import ValuesSerializer
 
 
 class ProductSerializer(serializers.ModelSerializer):
@@ -83,3 +84,7 @@ class ProductQuantitySerializer(serializers.Serializer):
 
     product_id = serializers.IntegerField()
     quantity = serializers.IntegerField()
+
+
+order_values = ValuesSerializer(OrderSerializer)
+product_values = ValuesSerializer(ProductSerializer)
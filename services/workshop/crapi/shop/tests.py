@@ -13,19 +13,59 @@
 """
 contains all the test cases related to shop management
 """
-from unittest.mock import patch
-from utils.mock_methods import get_sample_user_data, mock_jwt_auth_required
+from unittest.mock import Mock, PropertyMock, patch
+from utils.mock_methods import (
+    get_sample_user_data,
+    mock_async_jwt_auth_required,
+    mock_jwt_auth_required,
+)
 
 patch("utils.jwt.jwt_auth_required", mock_jwt_auth_required).start()
+patch("utils.jwt.async_jwt_auth_required", mock_async_jwt_auth_required).start()
 
+import gzip
+import io
+import os
+import queue
+import tempfile
+import threading
+import time
 import logging
+import uuid
 import bcrypt
 import json
-from django.test import TestCase, Client
+from decimal import Decimal
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import (
+    AsyncClient,
+    Client,
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    override_settings,
+)
 from django.utils import timezone
 from utils import messages
 from crapi.user.models import User, UserDetails
-from crapi.shop.models import Coupon
+from crapi.shop.models import Coupon, Order, Product
+from crapi.shop.catalog import product_catalog
+from crapi.shop.payment import payment_cache
+from crapi.shop.serializers import OrderSerializer
+from utils.admission import AdmissionMiddleware, Gate, Shed
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+from utils.coalescing import coalesced, shared_scope
+from utils.compression import negotiate_encoding
+from utils.health import HealthSampler, sampler
+from utils.invalidation import InvalidationBus, bus
+from utils.parsers import ORJSONParser
+from utils.renderers import ORJSONRenderer
+from utils.warmup import open_connections, warm_up
 
 logger = logging.getLogger("ProductTest")
 
@@ -207,3 +247,881 @@ class ProductTestCase(TestCase):
         self.create_order()
         res = self.client.get("/workshop/api/shop/orders/" + str(self.order_id))
         self.assertEqual(res.status_code, 200)
+
+
+class ProductCatalogTestCase(TestCase):
+    """
+    contains all the test cases related to the cached product catalog
+    """
+
+    def setUp(self):
+        """
+        creates a dummy user and a product
+        :return: None
+        """
+        self.client = Client()
+        user_data = get_sample_user_data()
+        user = User.objects.create(
+            email=user_data["email"],
+            number=user_data["number"],
+            password=user_data["password"],
+            role=User.ROLE_CHOICES.USER,
+            created_on=timezone.now(),
+        )
+        UserDetails.objects.create(
+            available_credit=100,
+            name=user_data["name"],
+            status="ACTIVE",
+            user=user,
+        )
+        Product.objects.create(name="Seat", price=10, image_url="seat.svg")
+        product_catalog.invalidate()
+        self.auth_headers = {"HTTP_AUTHORIZATION": "Bearer " + user_data["email"]}
+
+    def test_get_products_not_modified(self):
+        """
+        retrieves the products twice, the second time with the ETag
+        should get the products, then a 304 response
+        should not read the catalog from the database the second time
+        :return: None
+        """
+        res = self.client.get("/workshop/api/shop/products", **self.auth_headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()["credit"], 100)
+        self.assertEqual(res.json()["products"][0]["price"], "10.00")
+        # one query for the user of the token, one for the credit
+        with self.assertNumQueries(2):
+            res = self.client.get(
+                "/workshop/api/shop/products",
+                HTTP_IF_NONE_MATCH=res["ETag"],
+                **self.auth_headers
+            )
+        self.assertEqual(res.status_code, 304)
+
+    def test_add_product_invalidates_catalog(self):
+        """
+        retrieves the products, adds a product and retrieves them again
+        should get the new product and a new ETag
+        :return: None
+        """
+        res = self.client.get(
+            "/workshop/api/shop/products",
+            {"include_credit": "false"},
+            **self.auth_headers
+        )
+        self.assertNotIn("credit", res.json())
+        self.assertIn("max-age", res["Cache-Control"])
+        etag = res["ETag"]
+        res = self.client.post(
+            "/workshop/api/shop/products",
+            {"name": "Wheel", "price": "25.50", "image_url": "wheel.svg"},
+            content_type="application/json",
+            **self.auth_headers
+        )
+        self.assertEqual(res.status_code, 200)
+        new_res = self.client.get(
+            "/workshop/api/shop/products",
+            {"include_credit": "false"},
+            **self.auth_headers
+        )
+        self.assertEqual(new_res.json()["products"][0]["name"], "Wheel")
+        self.assertNotEqual(new_res["ETag"], etag)
+
+    def test_add_product_publishes_invalidation(self):
+        """
+        adds a product
+        should publish the write on the invalidation bus once committed
+        :return: None
+        """
+        with patch.object(bus, "publish") as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                res = self.client.post(
+                    "/workshop/api/shop/products",
+                    {"name": "Wheel", "price": "25.50", "image_url": "wheel.svg"},
+                    content_type="application/json",
+                    **self.auth_headers
+                )
+                publish.assert_not_called()
+        product = Product.objects.get(name="Wheel")
+        self.assertEqual(res.status_code, 200)
+        publish.assert_called_once_with(
+            {"model": "crapi.product", "pk": product.id}, "default"
+        )
+
+    @override_settings(COMPRESSION_MIN_SIZE=10)
+    def test_get_products_compressed(self):
+        """
+        retrieves the products accepting gzip
+        should get the products compressed with gzip and a weak ETag
+        :return: None
+        """
+        res = self.client.get(
+            "/workshop/api/shop/products",
+            HTTP_ACCEPT_ENCODING="br;q=0, gzip;q=0.8",
+            **self.auth_headers
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", res["Vary"])
+        self.assertTrue(res["ETag"].startswith("W/"))
+        products = json.loads(gzip.decompress(res.content))["products"]
+        self.assertEqual(products[0]["name"], "Seat")
+        res = self.client.get("/workshop/api/shop/products", **self.auth_headers)
+        self.assertFalse(res.has_header("Content-Encoding"))
+
+    def test_get_products_metrics(self):
+        """
+        retrieves the products, then the metrics
+        should get the latency and status of the products route
+        :return: None
+        """
+        self.client.get("/workshop/api/shop/products", **self.auth_headers)
+        res = self.client.get("/workshop/metrics")
+        self.assertEqual(res.status_code, 200)
+        metrics = res.content.decode()
+        self.assertIn(
+            'workshop_responses_total{method="GET",'
+            'route="workshop/api/shop/products$",status="200"}',
+            metrics,
+        )
+        self.assertIn(
+            'workshop_request_db_queries_count{route="workshop/api/shop/products$"}',
+            metrics,
+        )
+
+    @override_settings(PROFILING_DEBUG_TOKEN="profile-token")
+    def test_get_products_server_timing(self):
+        """
+        retrieves the products with and without the profiling token
+        should get a Server-Timing header only with the token
+        :return: None
+        """
+        res = self.client.get("/workshop/api/shop/products", **self.auth_headers)
+        self.assertFalse(res.has_header("Server-Timing"))
+        res = self.client.get(
+            "/workshop/api/shop/products",
+            HTTP_X_PROFILE_TOKEN="profile-token",
+            **self.auth_headers
+        )
+        self.assertEqual(res.status_code, 200)
+        phases = [
+            metric.split(";")[0] for metric in res.headers["Server-Timing"].split(", ")
+        ]
+        self.assertEqual(phases, ["auth", "db", "outbound", "view", "render", "total"])
+        self.assertIn('queries"', res.headers["Server-Timing"])
+
+    def test_get_products_slow_queries(self):
+        """
+        retrieves the products with a slow query threshold of 0 ms
+        should log the queries of the product view with one plan per shape,
+        and summarize them with the slow_queries command
+        :return: None
+        """
+        fd, log_path = tempfile.mkstemp(suffix=".log")
+        os.close(fd)
+        self.addCleanup(os.remove, log_path)
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=0, SLOW_QUERY_LOG_FILE=log_path):
+            for _ in range(2):
+                self.client.get("/workshop/api/shop/products", **self.auth_headers)
+        with open(log_path) as log_file:
+            entries = [json.loads(line) for line in log_file]
+        self.assertTrue(entries)
+        self.assertEqual(
+            {entry["view"] for entry in entries}, {"crapi.shop.views.ProductView"}
+        )
+        explained = [entry["fingerprint"] for entry in entries if "explain" in entry]
+        self.assertTrue(explained)
+        self.assertEqual(len(explained), len(set(explained)))
+        self.assertTrue(
+            all(
+                "actual time" in entry["explain"]
+                for entry in entries
+                if "explain" in entry
+            )
+        )
+
+        out = io.StringIO()
+        call_command("slow_queries", file=log_path, plans=True, stdout=out)
+        self.assertIn(explained[0], out.getvalue())
+        self.assertIn("crapi.shop.views.ProductView", out.getvalue())
+
+
+class WarmUpTestCase(TestCase):
+    """
+    contains all the test cases related to the warm-up of the workers
+    """
+
+    def setUp(self):
+        """
+        creates a product and forgets the warm-up of the worker
+        :return: None
+        """
+        Product.objects.create(name="Seat", price=10, image_url="seat.svg")
+        product_catalog.invalidate()
+        warm_up.ready = False
+        warm_up.attempted_at = None
+        self.addCleanup(setattr, warm_up, "ready", False)
+
+    def test_ready(self):
+        """
+        checks the readiness of a worker which was not warmed up
+        should warm it up, prime the catalog and report ready
+        :return: None
+        """
+        res = self.client.get("/workshop/ready")
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.json()["ready"])
+        self.assertEqual(
+            [
+                name
+                for name, step in res.json()["warm_up"]["steps"].items()
+                if step["error"]
+            ],
+            [],
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(product_catalog.get()[0][0]["name"], "Seat")
+
+    @override_settings(WARMUP_RETRY_INTERVAL=0)
+    def test_not_ready(self):
+        """
+        checks the readiness while a warm-up step fails, then once it works
+        should report not ready with the error, then ready
+        :return: None
+        """
+        with patch(
+            "crapi.shop.catalog.product_catalog.get", side_effect=OSError("down")
+        ):
+            res = self.client.get("/workshop/ready")
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.json()["warm_up"]["steps"]["caches"]["error"], "down")
+        res = self.client.get("/workshop/ready")
+        self.assertEqual(res.status_code, 200)
+
+    @override_settings(SERVER_INTERFACE="asgi")
+    def test_asgi_connections(self):
+        """
+        warms up the connections of a worker served under ASGI
+        should not open any connection
+        :return: None
+        """
+        executor = Mock()
+        with patch("utils.warmup.connection") as connection:
+            open_connections(executor, 4)
+            open_connections(None, 1)
+        executor.submit.assert_not_called()
+        connection.ensure_connection.assert_not_called()
+
+
+@override_settings(WARMUP=False)
+class HealthTestCase(TestCase):
+    """
+    contains all the test cases related to the health probes
+    """
+
+    def setUp(self):
+        """
+        forgets the last sample of the worker
+        :return: None
+        """
+        sampler.sampled_at = None
+        self.addCleanup(setattr, sampler, "checks", None)
+        self.addCleanup(setattr, sampler, "sampled_at", None)
+
+    def test_live(self):
+        """
+        checks the liveness of the worker
+        should answer without querying the database
+        :return: None
+        """
+        with self.assertNumQueries(0):
+            res = self.client.get("/workshop/live")
+        self.assertEqual(res.status_code, 200)
+
+    def test_ready_from_sample(self):
+        """
+        checks the readiness twice within the sample interval
+        should sample the database once and answer the second probe from it
+        :return: None
+        """
+        res = self.client.get("/workshop/ready")
+        self.assertEqual(res.status_code, 200)
+        health = res.json()["health"]
+        self.assertFalse(health["stale"])
+        self.assertTrue(health["checks"]["database"]["healthy"])
+        with self.assertNumQueries(0):
+            res = self.client.get("/workshop/ready")
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()["health"]["sampled_at"], health["sampled_at"])
+
+    def test_not_ready_when_check_fails(self):
+        """
+        checks the readiness while a dependency is down
+        should report not ready with the error of its check
+        :return: None
+        """
+        sampler.checks = {"mongodb": Mock(side_effect=OSError("down"))}
+        res = self.client.get("/workshop/ready")
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.json()["health"]["checks"]["mongodb"]["error"], "down")
+
+    @override_settings(HEALTH_MAX_AGE=30)
+    def test_not_ready_when_stale(self):
+        """
+        checks the readiness while the sampler thread is stuck
+        should report the last sample as stale and not ready
+        :return: None
+        """
+        sampler.sample()
+        sampler.sampled_at = time.time() - 60
+        with patch.object(
+            HealthSampler, "running", new_callable=PropertyMock, return_value=True
+        ):
+            res = self.client.get("/workshop/ready")
+        self.assertEqual(res.status_code, 503)
+        self.assertTrue(res.json()["health"]["stale"])
+        self.assertEqual(res.json()["health"]["age_seconds"], 60)
+
+
+class ORJSONTestCase(SimpleTestCase):
+    """
+    contains all the test cases related to the orjson renderer and parser
+    """
+
+    def render(self, renderer, data, accepted_media_type="application/json"):
+        return renderer.render(
+            data, accepted_media_type, {"indent": None, "request": None}
+        )
+
+    def test_render_like_json_renderer(self):
+        """
+        renders values orjson knows, values it encodes with the stock encoder
+        and the line and paragraph separators
+        should render the same bytes as JSONRenderer
+        :return: None
+        """
+        data = {
+            "id": uuid.UUID("6f1c1a66-8b1d-4c62-9d2e-0c3c1c2b7f11"),
+            "price": Decimal("10.50"),
+            "name": "Seat \u2028 cover \u2029",
+            "sizes": [1, 2.5, None, True],
+            1: "non string key",
+        }
+        rendered = self.render(ORJSONRenderer(), data)
+        self.assertEqual(rendered, self.render(JSONRenderer(), data))
+        self.assertIn(b"\\u2028", rendered)
+        self.assertIn(b"\\u2029", rendered)
+        self.assertEqual(self.render(ORJSONRenderer(), None), b"")
+
+    def test_render_fallbacks(self):
+        """
+        renders integers over 64 bits, with ensure_ascii and with indents
+        should render what JSONRenderer renders
+        :return: None
+        """
+        data = {"name": "Sièges", "count": 2**70}
+        self.assertEqual(
+            self.render(ORJSONRenderer(), data), self.render(JSONRenderer(), data)
+        )
+        renderer = ORJSONRenderer()
+        renderer.ensure_ascii = True
+        self.assertEqual(
+            self.render(renderer, data), b'{"name":"Si\\u00e8ges","count":%d}' % 2**70
+        )
+        media_type = "application/json; indent=4"
+        self.assertEqual(
+            self.render(ORJSONRenderer(), data, media_type),
+            self.render(JSONRenderer(), data, media_type),
+        )
+        media_type = "application/json; indent=2"
+        rendered = self.render(ORJSONRenderer(), {"name": "Sièges"}, media_type)
+        self.assertEqual(rendered, '{\n  "name": "Sièges"\n}'.encode())
+
+    def test_parse(self):
+        """
+        parses bodies in utf-8 and in another encoding
+        should get the same data as JSONParser
+        :return: None
+        """
+        body = '{"name": "Sièges", "count": %d, "price": 10.5}' % 2**70
+        data = {"name": "Sièges", "count": 2**70, "price": 10.5}
+        parser = ORJSONParser()
+        self.assertEqual(parser.parse(io.BytesIO(body.encode())), data)
+        self.assertEqual(
+            parser.parse(
+                io.BytesIO(body.encode("latin-1")),
+                parser_context={"encoding": "latin-1"},
+            ),
+            data,
+        )
+
+    def test_parse_error(self):
+        """
+        parses malformed bodies and a NaN
+        should raise a ParseError like JSONParser
+        :return: None
+        """
+        for body in [b'{"name": ', b"[1, 2,]", b'{"price": NaN}', b"\xff"]:
+            with self.assertRaises(ParseError):
+                ORJSONParser().parse(io.BytesIO(body))
+
+
+class CompressionTestCase(SimpleTestCase):
+    """
+    contains all the test cases related to the negotiation of encodings
+    """
+
+    def test_negotiate_encoding(self):
+        """
+        should pick the accepted encoding with the highest q-value,
+        the preferred one of the server on ties, and none if none is accepted
+        :return: None
+        """
+        encodings = ["br", "gzip"]
+        self.assertEqual(negotiate_encoding("gzip, br", encodings), "br")
+        self.assertEqual(negotiate_encoding("br;q=0.5, gzip", encodings), "gzip")
+        self.assertEqual(negotiate_encoding("*;q=0.1", encodings), "br")
+        self.assertEqual(negotiate_encoding("br;q=0, *", encodings), "gzip")
+        self.assertIsNone(negotiate_encoding("identity", encodings))
+        self.assertIsNone(negotiate_encoding("", encodings))
+
+
+class InvalidationBusTestCase(SimpleTestCase):
+    """
+    contains all the test cases related to the invalidation bus
+    """
+
+    databases = {"default"}
+
+    def setUp(self):
+        """
+        starts a bus on a channel of its own with a subscribed cache
+        :return: None
+        """
+        self.bus = InvalidationBus("workshop_invalidation_test", ping_interval=1)
+        self.evicted = queue.Queue()
+        self.flushes = queue.Queue()
+        self.bus.subscribe(Product, self.evicted.put, lambda: self.flushes.put(True))
+        self.bus.start()
+        self.addCleanup(self.bus.stop)
+        self.assertTrue(self.bus.listening.wait(5))
+
+    def test_publish(self):
+        """
+        publishes a write of a product
+        should pass it to the subscribed cache
+        :return: None
+        """
+        self.bus.publish({"model": "crapi.product", "pk": 1})
+        self.assertEqual(
+            self.evicted.get(timeout=5), {"model": "crapi.product", "pk": 1}
+        )
+
+    def test_flush_after_reconnect(self):
+        """
+        terminates the connection of the listener
+        should flush the subscribed cache once listening again
+        :return: None
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_terminate_backend(%s)",
+                [self.bus._connection.get_backend_pid()],
+            )
+        self.assertTrue(self.flushes.get(timeout=10))
+        self.assertTrue(self.bus.listening.wait(5))
+        self.bus.publish({"model": "crapi.product", "pk": 2})
+        self.assertEqual(self.evicted.get(timeout=5)["pk"], 2)
+
+
+class CoalescingTestCase(SimpleTestCase):
+    """
+    contains all the test cases related to request coalescing
+    """
+
+    def test_coalesced(self):
+        """
+        gets the same page several times while the first one is computed
+        should compute it once and share its content,
+        and compute the other pages separately
+        :return: None
+        """
+        started = threading.Event()
+        finish = threading.Event()
+        calls = []
+
+        class SlowView(APIView):
+            permission_classes = ()
+
+            @coalesced(scope=shared_scope)
+            def get(self, request, user=None):
+                calls.append(request.GET["offset"])
+                started.set()
+                finish.wait(5)
+                return Response({"offset": request.GET["offset"]})
+
+        view = SlowView.as_view()
+        factory = APIRequestFactory()
+        responses = []
+
+        def get(offset):
+            responses.append(view(factory.get("/slow", {"offset": offset})))
+
+        threads = [threading.Thread(target=get, args=("0",))]
+        threads[0].start()
+        started.wait(5)
+        threads += [threading.Thread(target=get, args=("0",)) for _ in range(3)]
+        for thread in threads[1:]:
+            thread.start()
+        # Lets the followers join the flight of the leader
+        threads[-1].join(0.2)
+        finish.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(calls, ["0"])
+        for response in responses:
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(json.loads(response.content), {"offset": "0"})
+        get("10")
+        self.assertEqual(calls, ["0", "10"])
+
+
+class AdmissionControlTestCase(SimpleTestCase):
+    """
+    contains all the test cases related to admission control
+    """
+
+    def test_gate(self):
+        """
+        should hand a released slot over to the first waiter,
+        and shed the requests over the queue or waiting too long
+        :return: None
+        """
+        gate = Gate("test", 1, 1)
+        gate.enter(1)
+        waiter = threading.Thread(target=gate.enter, args=(5,))
+        waiter.start()
+        while not gate._waiters:
+            waiter.join(0.01)
+        with self.assertRaises(Shed) as shed:
+            gate.enter(1)
+        self.assertEqual(shed.exception.reason, "queue_full")
+        gate.release()
+        waiter.join()
+        self.assertEqual(gate.in_flight, 1)
+        with self.assertRaises(Shed) as shed:
+            gate.enter(0.01)
+        self.assertEqual(shed.exception.reason, "timeout")
+        with self.assertRaises(Shed) as shed:
+            gate.try_enter()
+        self.assertEqual(shed.exception.reason, "overloaded")
+        gate.release()
+        self.assertEqual(gate.in_flight, 0)
+
+    @override_settings(ADMISSION_MAX_CONCURRENCY=1, ADMISSION_RETRY_AFTER=2)
+    def test_shed_requests(self):
+        """
+        should shed a request while the worker is busy, with a 503 and
+        a Retry-After header, and still admit the health checks
+        :return: None
+        """
+        started = threading.Event()
+        finish = threading.Event()
+
+        def get_response(request):
+            if request.path == "/workshop/api/shop/products":
+                started.set()
+                finish.wait(5)
+            return HttpResponse("ok")
+
+        middleware = AdmissionMiddleware(get_response)
+        factory = RequestFactory()
+        busy = threading.Thread(
+            target=middleware, args=(factory.get("/workshop/api/shop/products"),)
+        )
+        busy.start()
+        started.wait(5)
+        try:
+            res = middleware(factory.get("/workshop/api/shop/orders/all"))
+            self.assertEqual(res.status_code, 503)
+            self.assertEqual(res["Retry-After"], "2")
+            self.assertEqual(
+                json.loads(res.content)["message"], messages.SERVICE_OVERLOADED
+            )
+            res = middleware(factory.get("/workshop/health_check/"))
+            self.assertEqual(res.status_code, 200)
+        finally:
+            finish.set()
+            busy.join()
+        res = middleware(factory.get("/workshop/api/shop/orders/all"))
+        self.assertEqual(res.status_code, 200)
+
+    @override_settings(ADMISSION_MAX_WAITING=0)
+    def test_lanes(self):
+        """
+        should admit the liveness probe and the metrics while a readiness
+        check holds the health lane
+        :return: None
+        """
+        started = threading.Event()
+        finish = threading.Event()
+
+        def get_response(request):
+            if request.path == "/workshop/ready":
+                started.set()
+                finish.wait(5)
+            return HttpResponse("ok")
+
+        middleware = AdmissionMiddleware(get_response)
+        factory = RequestFactory()
+        busy = threading.Thread(
+            target=middleware, args=(factory.get("/workshop/ready"),)
+        )
+        busy.start()
+        started.wait(5)
+        try:
+            res = middleware(factory.get("/workshop/health_check/"))
+            self.assertEqual(res.status_code, 503)
+            res = middleware(factory.get("/workshop/live"))
+            self.assertEqual(res.status_code, 200)
+            res = middleware(factory.get("/workshop/metrics"))
+            self.assertEqual(res.status_code, 200)
+        finally:
+            finish.set()
+            busy.join()
+
+    @override_settings(ADMISSION_MAX_CONCURRENCY=1)
+    def test_streaming_response(self):
+        """
+        should hold the slot of a streaming response until its body is closed
+        :return: None
+        """
+        middleware = AdmissionMiddleware(
+            lambda request: StreamingHttpResponse(iter([b"zip"]))
+        )
+        factory = RequestFactory()
+        res = middleware(factory.get("/workshop/api/shop/products"))
+        self.assertEqual(
+            middleware(factory.get("/workshop/api/shop/products")).status_code, 503
+        )
+        self.assertEqual(b"".join(res.streaming_content), b"zip")
+        res.close()
+        res = middleware(factory.get("/workshop/api/shop/products"))
+        self.assertEqual(res.status_code, 200)
+        res.close()
+
+    @override_settings(
+        ADMISSION_MAX_CONCURRENCY=10,
+        WORKER_SYNC_CONCURRENCY=1,
+        ADMISSION_WAIT_TIMEOUT=0.05,
+    )
+    def test_sync_views(self):
+        """
+        should make the requests of sync views wait for the one running,
+        as under ASGI, and still admit the async views
+        :return: None
+        """
+        started = threading.Event()
+        finish = threading.Event()
+
+        def get_response(request):
+            if request.path == "/workshop/api/shop/products":
+                started.set()
+                finish.wait(5)
+            return HttpResponse("ok")
+
+        middleware = AdmissionMiddleware(get_response)
+        factory = RequestFactory()
+        busy = threading.Thread(
+            target=middleware, args=(factory.get("/workshop/api/shop/products"),)
+        )
+        busy.start()
+        started.wait(5)
+        try:
+            res = middleware(factory.get("/workshop/api/shop/orders/all"))
+            self.assertEqual(res.status_code, 503)
+            res = middleware(factory.get("/workshop/api/shop/orders/1"))
+            self.assertEqual(res.status_code, 200)
+        finally:
+            finish.set()
+            busy.join()
+        res = middleware(factory.get("/workshop/api/shop/orders/all"))
+        self.assertEqual(res.status_code, 200)
+
+
+class OrderPaymentTestCase(TestCase):
+    """
+    contains all the test cases related to the payment details of an order
+    """
+
+    def setUp(self):
+        """
+        creates a dummy user with an order
+        mocks the payment call to the API gateway
+        :return: None
+        """
+        self.client = Client()
+        user_data = get_sample_user_data()
+        self.user = User.objects.create(
+            email=user_data["email"],
+            number=user_data["number"],
+            password=user_data["password"],
+            role=User.ROLE_CHOICES.USER,
+            created_on=timezone.now(),
+        )
+        UserDetails.objects.create(
+            available_credit=100,
+            name=user_data["name"],
+            status="ACTIVE",
+            user=self.user,
+        )
+        product = Product.objects.create(name="Seat", price=10, image_url="seat.svg")
+        self.order = Order.objects.create(
+            user=self.user,
+            product=product,
+            quantity=2,
+            created_on=timezone.now(),
+            transaction_id=uuid.uuid4(),
+        )
+        payment_cache.clear()
+        payment_patcher = patch("crapi.shop.payment.post")
+        self.payment_post = payment_patcher.start()
+        self.addCleanup(payment_patcher.stop)
+        self.payment_post.return_value = Mock(status_code=200)
+        self.payment_post.return_value.json.return_value = {"status": "paid"}
+
+    def test_payment_is_cached(self):
+        """
+        retrieves the same order twice
+        should get the payment details both times
+        should call the API gateway only once
+        :return: None
+        """
+        for _ in range(2):
+            res = self.client.get("/workshop/api/shop/orders/%s" % self.order.id)
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(res.json()["payment"], {"status": "paid"})
+        self.assertEqual(self.payment_post.call_count, 1)
+        self.assertEqual(self.payment_post.call_args.kwargs["json"]["amount"], 20.0)
+
+    async def test_payment_async_client(self):
+        """
+        retrieves the order through the async request handler
+        should get the order and its payment details
+        :return: None
+        """
+        res = await AsyncClient().get("/workshop/api/shop/orders/%s" % self.order.id)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()["order"]["id"], self.order.id)
+        self.assertEqual(res.json()["payment"], {"status": "paid"})
+
+    @override_settings(PROFILING_DEBUG_TOKEN="profile-token", SLOW_QUERY_THRESHOLD_MS=0)
+    async def test_async_client_queries_recorded(self):
+        """
+        retrieves an order from an async view and the orders from a sync view
+        through the async request handler
+        should count the queries of both in the metrics, the Server-Timing
+        header and the slow query log
+        :return: None
+        """
+        fd, log_path = tempfile.mkstemp(suffix=".log")
+        os.close(fd)
+        self.addCleanup(os.remove, log_path)
+        headers = {
+            "authorization": "Bearer " + self.user.email,
+            "x-profile-token": "profile-token",
+        }
+        paths = [
+            "/workshop/api/shop/orders/%s" % self.order.id,
+            "/workshop/api/shop/orders/all",
+        ]
+        for path in paths:
+            with self.subTest(path=path), patch(
+                "utils.metrics.DB_QUERIES"
+            ) as db_queries, override_settings(SLOW_QUERY_LOG_FILE=log_path):
+                res = await AsyncClient().get(path, **headers)
+                self.assertEqual(res.status_code, 200)
+                self.assertGreater(db_queries.labels().observe.call_args.args[0], 0)
+                db_timing = res.headers["Server-Timing"].split(", ")[1]
+                self.assertNotIn('desc="0 queries"', db_timing)
+        with open(log_path) as log_file:
+            views = {json.loads(line)["view"] for line in log_file}
+        self.assertEqual(
+            views,
+            {"crapi.shop.views.OrderControlView", "crapi.shop.views.OrderDetailsView"},
+        )
+
+    def test_failed_payment_is_not_cached(self):
+        """
+        API gateway fails for the first retrieval
+        should get empty payment details and retry on the next retrieval
+        :return: None
+        """
+        self.payment_post.return_value.status_code = 500
+        res = self.client.get("/workshop/api/shop/orders/%s" % self.order.id)
+        self.assertEqual(res.json()["payment"], {})
+        self.payment_post.return_value.status_code = 200
+        res = self.client.get("/workshop/api/shop/orders/%s" % self.order.id)
+        self.assertEqual(res.json()["payment"], {"status": "paid"})
+        self.assertEqual(self.payment_post.call_count, 2)
+
+    def test_skip_payment(self):
+        """
+        retrieves the order with include_payment=false
+        should get the order without payment details
+        should not call the API gateway
+        :return: None
+        """
+        res = self.client.get(
+            "/workshop/api/shop/orders/%s" % self.order.id, {"include_payment": "false"}
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()["order"]["id"], self.order.id)
+        self.assertNotIn("payment", res.json())
+        self.payment_post.assert_not_called()
+
+    def test_get_orders(self):
+        """
+        lists the orders of the user
+        should get the same orders as OrderSerializer
+        :return: None
+        """
+        res = self.client.get(
+            "/workshop/api/shop/orders/all",
+            HTTP_AUTHORIZATION="Bearer " + self.user.email,
+        )
+        self.assertEqual(res.status_code, 200)
+        expected = OrderSerializer(Order.objects.filter(user=self.user), many=True)
+        self.assertEqual(res.json()["orders"], json.loads(json.dumps(expected.data)))
+
+    def test_get_orders_fieldset(self):
+        """
+        lists the orders of the user with fields and expand
+        should get only the requested fields and relations
+        should get an error response for unknown fields
+        :return: None
+        """
+        auth_headers = {"HTTP_AUTHORIZATION": "Bearer " + self.user.email}
+        res = self.client.get(
+            "/workshop/api/shop/orders/all",
+            {"fields": "id,status,product.name"},
+            **auth_headers
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            res.json()["orders"],
+            [{"id": self.order.id, "product": {"name": "Seat"}, "status": "delivered"}],
+        )
+        res = self.client.get(
+            "/workshop/api/shop/orders/all", {"expand": "product"}, **auth_headers
+        )
+        self.assertEqual(res.status_code, 200)
+        order = res.json()["orders"][0]
+        self.assertEqual(order["user"], self.user.id)
+        self.assertEqual(order["product"]["price"], "10.00")
+        res = self.client.get(
+            "/workshop/api/shop/orders/all",
+            {"fields": "id,user.password"},
+            **auth_headers
+        )
+        self.assertEqual(res.status_code, 400)
@@ -19,6 +19,7 @@ The `urlpatterns` list routes URLs to views.
 from django.urls import include, re_path
 
 import crapi.shop.views as shop_views
+from utils.compression import no_compression
 
 urlpatterns = [
     # Do not change the order of URLs
@@ -30,7 +31,7 @@ urlpatterns = [
     re_path(r"apply_coupon$", shop_views.ApplyCouponView.as_view()),
     re_path(
         r"return_qr_code$",
-        shop_views.ReturnQRCodeView.as_view(),
+        no_compression(shop_views.ReturnQRCodeView.as_view()),
         name="shop-return-qr-code",
     ),
 ]
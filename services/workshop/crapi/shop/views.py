@@ -15,33 +15,56 @@
 """
 contains views related to Shop APIs
 """
-import logging
+import hashlib
 import uuid
+from asgiref.sync import sync_to_async
 from django.db import connection
 from django.utils import timezone
 from django.http import FileResponse
 from django.urls import reverse
-import requests
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
 from crapi_site import settings
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from utils.helper import basic_auth
 from crapi.shop.serializers import (
     OrderSerializer,
     ProductSerializer,
     CouponSerializer,
     ProductQuantitySerializer,
+    order_values,
 )
-from crapi.user.serializers import UserSerializer
+from utils.async_views import AsyncAPIView
 from utils.jwt import jwt_auth_required
 from utils import messages
+from crapi.shop.catalog import product_catalog
 from crapi.shop.models import Order, Product, AppliedCoupon, Coupon
+from crapi.shop.payment import (
+    payment_cache,
+    request_payment,
+    request_payment_async,
+)
 from crapi.user.models import UserDetails
 from utils.logging import log_error
+from utils.coalescing import coalesced, shared_scope, user_scope
+from utils.rate_limit import rate_limited
+from utils.values_serializer import FieldsetSerializer
 from django.core.exceptions import ObjectDoesNotExist
 from rest_framework.pagination import LimitOffsetPagination
 
+FALSE_VALUES = ("false", "0", "no")
+
+
+def credit_scope(request, user):
+    """
+    coalesces the product lists of a user, or of all the users
+    when the credit is left out
+    """
+    if request.GET.get("include_credit", "true").lower() in FALSE_VALUES:
+        return shared_scope(request, user)
+    return user_scope(request, user)
+
 
 class ProductView(APIView, LimitOffsetPagination):
     """
@@ -49,24 +72,34 @@ class ProductView(APIView, LimitOffsetPagination):
     """
 
     @jwt_auth_required
+    @coalesced(scope=credit_scope)
     def get(self, request, user):
         """
         products view for fetching the list of products
         :param request: http request for the view
             method allowed: GET
             http request should be authorised by the jwt token of the user
+            query params: 'include_credit' false to leave out the credit
+                of the user, which lets clients cache the response longer
+            conditional requests are answered with 304 if the ETag matches
         :param user: User object of the requesting user
         :returns Response object with
             products list and 200 status if no error
             message and corresponding status if error
         """
-        user_details = UserDetails.objects.get(user=user)
-        products = Product.objects.all().order_by("-id")
+        products, version = product_catalog.get()
         paginated = self.paginate_queryset(products, request, view=self)
-        serializer = ProductSerializer(paginated, many=True)
-        response_data = dict(
-            products=serializer.data,
-            credit=user_details.available_credit,
+        response_data = dict(products=paginated)
+        include_credit = (
+            request.GET.get("include_credit", "true").lower() not in FALSE_VALUES
+        )
+        if include_credit:
+            response_data["credit"] = (
+                UserDetails.objects.filter(user=user)
+                .values_list("available_credit", flat=True)
+                .get()
+            )
+        response_data.update(
             next_offset=(
                 self.offset + self.limit
                 if self.offset + self.limit < self.count
@@ -77,7 +110,21 @@ class ProductView(APIView, LimitOffsetPagination):
             ),
             count=self.get_count(paginated),
         )
-        return Response(response_data, status=status.HTTP_200_OK)
+        fingerprint = (
+            f"{version}:{self.offset}:{self.limit}:{response_data.get('credit')}"
+        )
+        etag = quote_etag(hashlib.sha1(fingerprint.encode()).hexdigest())
+        response = get_conditional_response(request, etag=etag) or Response(
+            response_data, status=status.HTTP_200_OK
+        )
+        response["ETag"] = etag
+        if include_credit:
+            patch_cache_control(response, private=True, no_cache=True)
+        else:
+            patch_cache_control(
+                response, private=True, max_age=settings.PRODUCT_CATALOG_MAX_AGE
+            )
+        return response
 
     @jwt_auth_required
     def post(self, request, user):
@@ -98,20 +145,22 @@ class ProductView(APIView, LimitOffsetPagination):
             log_error(request.path, request.data, 400, serializer.errors)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         serializer.save()
+        product_catalog.invalidate()
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class OrderControlView(APIView):
+class OrderControlView(AsyncAPIView):
     """
     Order Controller View
     """
 
-    def get(self, request, order_id=None, user=None):
+    async def get(self, request, order_id=None, user=None):
         """
         order view for fetching  a particular order
         :param request: http request for the view
             method allowed: GET
             http request should be authorised by the jwt token of the user
+            query params: 'include_payment' false skips the API gateway call
         :param order_id:
             order_id of the order referring to\
         :param user: User object of the requesting user
@@ -119,51 +168,24 @@ class OrderControlView(APIView):
             order object and 200 status if no error
             message and corresponding status if error
         """
-        order = Order.objects.get(id=order_id)
-        order_serializer = OrderSerializer(order)
-        user = order.user
-        # email user.email, number user.number
-        payment = {}
-        try:
-            user_dict = UserSerializer(user).data
-            user_details = UserDetails.objects.get(user=user)
-            user_dict["name"] = user_details.name
-            gateway_endpoint = settings.API_GATEWAY_URL + "/v1/payment"
-            gateway_credential = basic_auth(
-                settings.API_GATEWAY_USERNAME, settings.API_GATEWAY_PASSWORD
+        order, order_data = await sync_to_async(self.get_order)(order_id)
+        response_data = dict(order=order_data)
+        if request.GET.get("include_payment", "true").lower() not in FALSE_VALUES:
+            response_data["payment"] = await payment_cache.aget(
+                order.transaction_id,
+                lambda: request_payment_async(order, order_data),
+                lambda: request_payment(order, order_data),
             )
-            logging.debug(gateway_endpoint)
-            data = {}
-            data["user"] = user_dict
-            data["order"] = order_serializer.data
-            data["amount"] = float(order.product.price) * int(order.quantity)
-            try:
-                payment_response = requests.post(
-                    gateway_endpoint,
-                    headers={
-                        "Authorization": gateway_credential,
-                        "Content-Type": "application/json",
-                    },
-                    json=data,
-                    verify=False,
-                    timeout=5,
-                )
-                if payment_response.status_code == 200:
-                    payment = payment_response.json()
-                else:
-                    logging.error(
-                        "Payment response error, {}: {}".format(
-                            payment_response.status_code, payment_response.content
-                        )
-                    )
-                logging.debug("payment response: {}".format(payment))
-            except Exception as e:
-                logging.error(e, exc_info=True)
-        except Exception as e:
-            logging.error(e, exc_info=True)
-        response_data = dict(order=order_serializer.data, payment=payment)
         return Response(response_data, status=status.HTTP_200_OK)
 
+    @staticmethod
+    def get_order(order_id):
+        """
+        :return: Order object and the serialized order
+        """
+        order = Order.objects.get(id=order_id)
+        return order, OrderSerializer(order).data
+
     @jwt_auth_required
     def post(self, request, order_id=None, user=None):
         """
@@ -254,6 +276,7 @@ class OrderControlView(APIView):
                 )
                 user_details.save()
         order.save()
+        payment_cache.invalidate(order.transaction_id)
         serializer = OrderSerializer(order)
         response_data = dict(orders=serializer.data)
         return Response(response_data, status=status.HTTP_200_OK)
@@ -271,16 +294,26 @@ class OrderDetailsView(APIView, LimitOffsetPagination):
         :param request: http request for the view
             method allowed: GET
             http request should be authorised by the jwt token of the user
+            query params: 'fields' and 'expand' as comma separated lists
+                of dotted field paths, e.g. fields=id,status,product.name
         :param user: User object of the requesting user
         :returns Response object with
             list of order object and 200 status if no error
             message and corresponding status if error
         """
+        fieldset = FieldsetSerializer(
+            data=request.GET, context={"values": order_values}
+        )
+        if not fieldset.is_valid():
+            log_error(
+                request.path, request.GET, status.HTTP_400_BAD_REQUEST, fieldset.errors
+            )
+            return Response(fieldset.errors, status=status.HTTP_400_BAD_REQUEST)
+        selection = fieldset.validated_data["selection"]
         orders = Order.objects.filter(user=user).order_by("-id")
-        paginated = self.paginate_queryset(orders, request, view=self)
-        serializer = OrderSerializer(paginated, many=True)
+        paginated = self.paginate_queryset(selection.values(orders), request, view=self)
         response_data = dict(
-            orders=serializer.data,
+            orders=selection.serialize(paginated),
             next_offset=(
                 self.offset + self.limit
                 if self.offset + self.limit < self.count
@@ -363,6 +396,7 @@ class ApplyCouponView(APIView):
     """
 
     @jwt_auth_required
+    @rate_limited("apply_coupon")
     def post(self, request, user=None):
         """
         api for checking if coupon is already claimed
@@ -0,0 +1,41 @@
+#
+# Licensed under the Apache License, Version 2.0 (the “License”);
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an “AS IS” BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Memoized lookups of users and vehicles
+The tables are written by the identity service as well, entries of its
+writes stay until their ttl. Users back the authentication, so their
+entries stay USER_CACHE_TTL seconds and are never served expired.
+"""
+from django.conf import settings
+from crapi.user.models import User, Vehicle
+from utils.cache import memoize
+
+
+@memoize("user_by_email", ttl=settings.USER_CACHE_TTL, stale_ttl=0, models=(User,))
+def user_by_email(email):
+    """
+    :return: User with the email
+    :raises User.DoesNotExist: if there is none
+    """
+    return User.objects.get(email=email)
+
+
+@memoize("vehicle_by_vin", models=(Vehicle,))
+def vehicle_by_vin(vin):
+    """
+    :return: Vehicle with the vin
+    :raises Vehicle.DoesNotExist: if there is none
+    """
+    return Vehicle.objects.get(vin=vin)
@@ -18,6 +18,9 @@ contains all the serializers for User and Vehicle Objects
 from rest_framework import serializers
 
 from crapi.user.models import User, UserDetails, Vehicle
+from crapi_site import settings
+from utils import messages
+from utils.values_serializer import ValuesSerializer
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -64,3 +67,27 @@ class VehicleSerializer(serializers.ModelSerializer):
 
         model = Vehicle
         fields = ("id", "vin", "owner")
+
+
+class ProfileSerializer(serializers.Serializer):
+    """
+    Serializer for the query params of the profiling API
+    """
+
+    duration = serializers.FloatField(min_value=0.1, default=10)
+    interval = serializers.IntegerField(min_value=1, max_value=1000, default=10)
+    # format is the renderer override of rest_framework
+    output = serializers.ChoiceField(
+        choices=("collapsed", "speedscope"), default="collapsed"
+    )
+    threads = serializers.ChoiceField(choices=("active", "all"), default="active")
+
+    def validate_duration(self, value):
+        if value > settings.PROFILER_MAX_DURATION:
+            raise serializers.ValidationError(
+                messages.PROFILE_TOO_LONG.format(settings.PROFILER_MAX_DURATION)
+            )
+        return value
+
+
+user_details_values = ValuesSerializer(UserDetailsSerializer)
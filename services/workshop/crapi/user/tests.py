@@ -13,7 +13,7 @@
 """
 contains all the test cases related to shop management
 """
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 
 from django.db import connection
 from utils.mock_methods import (
@@ -25,14 +25,32 @@ from utils.mock_methods import (
 
 patch("utils.jwt.jwt_auth_required", mock_jwt_auth_required).start()
 
+import glob
 import logging
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
 import bcrypt
 import json
-from django.test import TestCase, Client
+from django.core.cache import caches
+from django.test import SimpleTestCase, TestCase, Client, override_settings
 from django.utils import timezone
 from utils import messages
 from crapi_site import settings
+from crapi.user.lookups import user_by_email
 from crapi.user.models import User, UserDetails
+from crapi.user.serializers import UserDetailsSerializer
+from utils.cache import acquire_lock, memoize
+from utils import sampling_profiler
+from utils.logging import (
+    MAX_PARAMS_LENGTH,
+    JSONFormatter,
+    QueueWriterHandler,
+    TruncatedRepr,
+)
 
 logger = logging.getLogger("UserTest")
 MAX_USER_COUNT = 40
@@ -138,6 +156,24 @@ class UserDetailsTestCase(TestCase):
         response_data = json.loads(response.content)
         self.assertEqual(len(response_data["users"]), all_users_length)
 
+    def test_get_api_management_users_serialization(self):
+        """
+        tests the get user details api returns the same users as
+        UserDetailsSerializer
+        :return: None
+        """
+        self.setup_database()
+        response = self.client.get(
+            "/workshop/api/management/users/all?limit=10&offset=5", **self.auth_headers
+        )
+        self.assertEqual(response.status_code, 200)
+        expected = UserDetailsSerializer(
+            UserDetails.objects.all().order_by("id")[5:15], many=True
+        )
+        self.assertEqual(
+            json.loads(response.content)["users"], json.loads(json.dumps(expected.data))
+        )
+
     def test_bad_get_api_management_users_all(self):
         """
         tests the get user details api
@@ -145,3 +181,400 @@ class UserDetailsTestCase(TestCase):
         """
         response = self.client.get("/workshop/api/management/users/all")
         self.assertEqual(response.status_code, 401)
+
+
+def busy_loop(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+class AdminProfileTestCase(TestCase):
+    """
+    contains all the test cases related to the profiling API
+    """
+
+    databases = "__all__"
+
+    def setUp(self):
+        self.client = Client()
+        self.auth_headers = {}
+        for user_data in (get_sample_admin_user(), get_sample_user_data()):
+            user = User.objects.create(
+                email=user_data["email"],
+                number=user_data["number"],
+                password=bcrypt.hashpw(
+                    user_data["password"].encode("utf-8"), bcrypt.gensalt()
+                ).decode(),
+                role=user_data.get("role", User.ROLE_CHOICES.USER),
+                created_on=timezone.now(),
+            )
+            self.auth_headers[user.role] = {
+                "HTTP_AUTHORIZATION": "Bearer " + user_data["email"]
+            }
+        self.admin_headers = self.auth_headers[User.ROLE_CHOICES.ADMIN]
+        stop = threading.Event()
+        thread = threading.Thread(target=busy_loop, args=(stop,), name="busy")
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(stop.set)
+
+    def test_get_profile_collapsed(self):
+        """
+        profiles the worker while a thread is busy
+        should get the busy stack in the collapsed format
+        :return: None
+        """
+        res = self.client.get(
+            "/workshop/api/management/profile?duration=0.2&interval=5",
+            **self.admin_headers,
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertIn("collapsed", res["Content-Disposition"])
+        lines = res.content.decode().splitlines()
+        busy = [line for line in lines if line.startswith("busy;")]
+        self.assertTrue(busy)
+        self.assertIn("crapi.user.tests.busy_loop", busy[0])
+        self.assertTrue(all(line.rsplit(" ", 1)[1].isdigit() for line in lines))
+
+    def test_get_profile_speedscope(self):
+        """
+        profiles the worker in the speedscope format
+        should get one sampled profile per thread with valid frame indexes
+        :return: None
+        """
+        res = self.client.get(
+            "/workshop/api/management/profile?duration=0.2&output=speedscope"
+            "&threads=all",
+            **self.admin_headers,
+        )
+        self.assertEqual(res.status_code, 200)
+        profile = json.loads(res.content)
+        frames = profile["shared"]["frames"]
+        busy = [p for p in profile["profiles"] if p["name"] == "busy"]
+        self.assertEqual(len(busy), 1)
+        self.assertEqual(len(busy[0]["samples"]), len(busy[0]["weights"]))
+        for sample in busy[0]["samples"]:
+            self.assertTrue(all(0 <= index < len(frames) for index in sample))
+
+    def test_bad_get_profile(self):
+        """
+        profiles the worker as a user, with a too long duration,
+        and while another profile runs
+        should get 403, 400 and 409
+        :return: None
+        """
+        res = self.client.get(
+            "/workshop/api/management/profile?duration=0.1",
+            **self.auth_headers[User.ROLE_CHOICES.USER],
+        )
+        self.assertEqual(res.status_code, 403)
+        res = self.client.get(
+            "/workshop/api/management/profile?duration=3600", **self.admin_headers
+        )
+        self.assertEqual(res.status_code, 400)
+        with sampling_profiler._profile_lock:
+            res = self.client.get(
+                "/workshop/api/management/profile?duration=0.1", **self.admin_headers
+            )
+        self.assertEqual(res.status_code, 409)
+        self.assertEqual(res.json()["message"], messages.PROFILE_IN_PROGRESS)
+
+
+class MemoizeTestCase(TestCase):
+    """
+    contains all the test cases related to the memoized lookups
+    """
+
+    def setUp(self):
+        """
+        creates a dummy user
+        :return: None
+        """
+        user_data = get_sample_user_data()
+        self.user = User.objects.create(
+            email=user_data["email"],
+            number=user_data["number"],
+            password=user_data["password"],
+            role=User.ROLE_CHOICES.USER,
+            created_on=timezone.now(),
+        )
+
+    def test_user_by_email(self):
+        """
+        looks up a user several times and after a write
+        should query the user once, and again after the write
+        :return: None
+        """
+        with self.assertNumQueries(1):
+            self.assertEqual(user_by_email(self.user.email), self.user)
+            self.assertEqual(user_by_email(self.user.email).number, self.user.number)
+        self.user.number = "9999999999"
+        self.user.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(user_by_email(self.user.email).number, "9999999999")
+        with self.assertRaises(User.DoesNotExist):
+            user_by_email("nobody@example.com")
+
+    def test_single_flight(self):
+        """
+        looks up an expired entry while another caller recomputes it
+        should get the stale entry without computing it
+        :return: None
+        """
+        calls = []
+        lookup = memoize("test_single_flight")(lambda key: calls.append(key) or 1)
+        lookup("key")
+        key = lookup.key("key")
+        caches["shared"].set(key, (2, 0))
+        caches["default"].delete(key)
+        release = acquire_lock(key)
+        try:
+            self.assertEqual(lookup("key"), 2)
+        finally:
+            release()
+        self.assertEqual(lookup("key"), 1)
+        self.assertEqual(calls, ["key", "key"])
+
+    @override_settings(CACHE_LOCK_TIMEOUT=0.2)
+    def test_user_by_email_not_stale(self):
+        """
+        looks up an expired user while another caller recomputes it
+        should query the user instead of getting the expired one
+        :return: None
+        """
+        user_by_email(self.user.email)
+        key = user_by_email.key(self.user.email)
+        caches["shared"].set(key, (caches["shared"].get(key)[0], 0))
+        caches["default"].delete(key)
+        release = acquire_lock(key)
+        try:
+            with self.assertNumQueries(1):
+                self.assertEqual(user_by_email(self.user.email), self.user)
+        finally:
+            release()
+
+    def test_file_lock(self):
+        """
+        computes a missing entry from several threads with the file cache
+        should take the lock once at a time and compute the entry once
+        :return: None
+        """
+        with tempfile.TemporaryDirectory() as directory, override_settings(
+            CACHES={
+                **settings.CACHES,
+                "shared": {
+                    "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                    "LOCATION": directory,
+                },
+            }
+        ):
+            release = acquire_lock("test_file_lock")
+            self.assertIsNone(acquire_lock("test_file_lock"))
+            release()
+            acquire_lock("test_file_lock")()
+            self.assertEqual(glob.glob(os.path.join(directory, "*.lock")), [])
+
+            for namespace in ("test_file_lock", "test_file_lock_again"):
+                calls = []
+                lookup = memoize(namespace)(
+                    lambda key: calls.append(key) or time.sleep(0.2) or key
+                )
+                barrier = threading.Barrier(4)
+                results = []
+
+                def run():
+                    barrier.wait()
+                    results.append(lookup("key"))
+
+                threads = [threading.Thread(target=run) for _ in range(4)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                self.assertEqual(results, ["key"] * 4)
+                self.assertEqual(calls, ["key"])
+
+    def test_stored_while_locked(self):
+        """
+        takes the lock of a missing entry right after its previous holder
+        stored it
+        should get the stored entry without computing it
+        :return: None
+        """
+        calls = []
+        lookup = memoize("test_stored_while_locked")(lambda key: calls.append(key) or 1)
+        key = lookup.key("key")
+
+        def acquire_after_store(lock_key):
+            caches["shared"].set(key, (2, time.time() + 60))
+            return acquire_lock(lock_key)
+
+        with patch("utils.cache.acquire_lock", side_effect=acquire_after_store):
+            self.assertEqual(lookup("key"), 2)
+        self.assertEqual(calls, [])
+
+
+class LoggingTestCase(SimpleTestCase):
+    """
+    contains all the test cases related to the queued log handler
+    """
+
+    def record(self, message, level=logging.INFO, args=None):
+        return logging.LogRecord("test", level, __file__, 0, message, args, None)
+
+    def handler(self, **kwargs):
+        """
+        :return: QueueWriterHandler of the process whose writer is not
+            started, so that the records stay on its queue
+        """
+        handler = QueueWriterHandler(console=False, **kwargs)
+        handler._pid = os.getpid()
+        handler._queue = queue.Queue(handler.queue_size)
+        return handler
+
+    def test_truncated_repr(self):
+        """
+        formats a long string, a large dict and a value of a filtered record
+        should truncate the string and the dict, and not format the value
+        :return: None
+        """
+        text = str(TruncatedRepr("x" * (MAX_PARAMS_LENGTH + 10)))
+        self.assertEqual(text, "x" * MAX_PARAMS_LENGTH + "... (10 more characters)")
+        text = str(TruncatedRepr({i: "y" * 100 for i in range(100)}))
+        self.assertLessEqual(len(text), MAX_PARAMS_LENGTH + 30)
+        self.assertIn("...", text)
+        value = Mock(side_effect=AssertionError("formatted"))
+        logging.getLogger("test.truncated").debug(
+            "%s", TruncatedRepr(Mock(__repr__=value))
+        )
+        value.assert_not_called()
+
+    def test_json_formatter(self):
+        """
+        formats a record with args and an exception
+        should get one JSON object on one line
+        :return: None
+        """
+        record = self.record("Order %s of %s", logging.ERROR, (1, "user"))
+        record.exc_text = "Traceback\nValueError"
+        line = JSONFormatter().format(record)
+        self.assertNotIn("\n", line)
+        entry = json.loads(line)
+        self.assertEqual(entry["level"], "ERROR")
+        self.assertEqual(entry["message"], "Order 1 of user")
+        self.assertEqual(entry["exception"], "Traceback\nValueError")
+
+    def test_queue_overflow(self):
+        """
+        emits more records than the queue holds
+        should drop the others, truncate the messages and report the drops
+        :return: None
+        """
+        handler = self.handler(queue_size=2, max_message_length=10)
+        for _ in range(5):
+            handler.emit(self.record("z" * 20))
+        self.assertEqual(handler._queue.qsize(), 2)
+        self.assertEqual(
+            handler._queue.get().getMessage(), "z" * 10 + "... (10 more characters)"
+        )
+        losses = handler._losses(final=True)
+        self.assertEqual(losses.levelno, logging.WARNING)
+        self.assertEqual(losses.args, (3, 0))
+        self.assertIsNone(handler._losses(final=True))
+
+    def test_sampling(self):
+        """
+        emits records over the sample threshold within one second
+        should keep the threshold, sample the info records over it and
+        keep every warning
+        :return: None
+        """
+        handler = self.handler(sample_threshold=2, sample_rate=0.5)
+        with patch("utils.logging.time", Mock(**{"monotonic.return_value": 100.0})):
+            for _ in range(10):
+                handler.emit(self.record("info"))
+            for _ in range(3):
+                handler.emit(self.record("warning", logging.WARNING))
+        self.assertEqual(handler._queue.qsize(), 2 + 4 + 3)
+        self.assertEqual(handler._losses(final=True).args, (0, 4))
+
+    def test_write_and_rotate(self):
+        """
+        writes records from two handlers sharing a file, as gunicorn workers
+        should rotate the file under its size without losing a record
+        :return: None
+        """
+        with tempfile.TemporaryDirectory() as log_dir:
+            filename = os.path.join(log_dir, "debug.log")
+            handlers = [
+                QueueWriterHandler(
+                    filename,
+                    max_bytes=2000,
+                    backup_count=100,
+                    console=False,
+                    batch_size=5,
+                )
+                for _ in range(2)
+            ]
+
+            def write(handler, worker):
+                handler.setFormatter(JSONFormatter())
+                for i in range(200):
+                    handler.emit(self.record("worker %s record %s", args=(worker, i)))
+                handler.close()
+
+            threads = [
+                threading.Thread(target=write, args=(handler, worker))
+                for worker, handler in enumerate(handlers)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            messages_written = []
+            for path in glob.glob(filename + "*"):
+                if path.endswith(".lock"):
+                    continue
+                self.assertLessEqual(os.path.getsize(path), 2000)
+                with open(path) as log_file:
+                    messages_written += [
+                        json.loads(line)["message"] for line in log_file
+                    ]
+            self.assertGreater(len(glob.glob(filename + ".*")), 2)
+            self.assertEqual(
+                sorted(messages_written),
+                sorted(
+                    "worker %s record %s" % (worker, i)
+                    for worker in range(2)
+                    for i in range(200)
+                ),
+            )
+
+    def test_restart_after_fork(self):
+        """
+        logs from a forked process with the handler of its parent
+        should start a writer in the child which writes its records
+        :return: None
+        """
+        with tempfile.TemporaryDirectory() as log_dir:
+            filename = os.path.join(log_dir, "debug.log")
+            handler = QueueWriterHandler(filename, console=False)
+            handler.setFormatter(JSONFormatter())
+            handler.emit(self.record("parent"))
+            pid = os.fork()
+            if pid == 0:
+                code = 1
+                try:
+                    handler.emit(self.record("child"))
+                    code = 0 if handler._thread.is_alive() else 1
+                    handler.close()
+                finally:
+                    sys.stderr.flush()
+                    os._exit(code)
+            _, exit_status = os.waitpid(pid, 0)
+            handler.close()
+            self.assertEqual(os.waitstatus_to_exitcode(exit_status), 0)
+            with open(filename) as log_file:
+                messages_written = [json.loads(line)["message"] for line in log_file]
+            self.assertEqual(sorted(messages_written), ["child", "parent"])
@@ -16,17 +16,20 @@
 contains all the views related to Merchant
 """
 import logging
+import os
 import requests
+from django.http import HttpResponse, JsonResponse
 from requests.exceptions import MissingSchema, InvalidURL
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from crapi.user.serializers import UserDetailsSerializer
+from crapi.user.serializers import ProfileSerializer, user_details_values
 from crapi.user.models import User, UserDetails
 from crapi_site import settings
 from utils.jwt import jwt_auth_required
 from utils import messages
 from utils.logging import log_error
+from utils.sampling_profiler import ProfileInProgress, SamplingProfiler
 from rest_framework.pagination import LimitOffsetPagination
 
 logger = logging.getLogger()
@@ -51,14 +54,15 @@ class AdminUserView(APIView, LimitOffsetPagination):
         """
         # Sort by id
         userdetails = UserDetails.objects.all().order_by("id")
-        if not userdetails:
+        if not userdetails.exists():
             return Response(
                 {"message": messages.NO_USER_DETAILS}, status=status.HTTP_404_NOT_FOUND
             )
-        paginated = self.paginate_queryset(userdetails, request)
-        serializer = UserDetailsSerializer(paginated, many=True)
+        paginated = self.paginate_queryset(
+            user_details_values.values(userdetails), request
+        )
         response_data = dict(
-            users=serializer.data,
+            users=user_details_values.serialize(paginated),
             next_offset=(
                 self.offset + self.limit
                 if self.offset + self.limit < self.count
@@ -70,3 +74,60 @@ class AdminUserView(APIView, LimitOffsetPagination):
             count=self.get_count(paginated),
         )
         return Response(response_data, status=status.HTTP_200_OK)
+
+
+class AdminProfileView(APIView):
+    """
+    View for admin user to profile the worker serving the request
+    """
+
+    @jwt_auth_required
+    def get(self, request, user=None):
+        """
+        samples the stacks of the other threads of this worker
+        :param request: http request for the view
+            method allowed: GET
+            http request should be authorised by the jwt token of an admin
+            optional query params: duration in seconds, interval in
+            milliseconds, output collapsed or speedscope, threads active
+            to leave out the threads waiting for work or all
+        :returns Response object with
+            the profile and 200 status if no error
+            message and corresponding status if error
+        """
+        if user.role != User.ROLE_CHOICES.ADMIN:
+            return Response(
+                {"message": messages.RESTRICTED}, status=status.HTTP_403_FORBIDDEN
+            )
+        serializer = ProfileSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            log_error(
+                request.path,
+                request.query_params,
+                status.HTTP_400_BAD_REQUEST,
+                serializer.errors,
+            )
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = serializer.validated_data
+        profiler = SamplingProfiler(
+            interval=params["interval"] / 1000,
+            include_idle=params["threads"] == "all",
+        )
+        try:
+            profiler.run(params["duration"])
+        except ProfileInProgress:
+            return Response(
+                {"message": messages.PROFILE_IN_PROGRESS},
+                status=status.HTTP_409_CONFLICT,
+            )
+        filename = f"workshop-{os.getpid()}-{int(profiler.elapsed * 1000)}ms"
+        if params["output"] == "speedscope":
+            response = JsonResponse(profiler.speedscope(name=filename))
+            filename += ".speedscope.json"
+        else:
+            response = HttpResponse(
+                profiler.collapsed(), content_type="text/plain; charset=utf-8"
+            )
+            filename += ".collapsed.txt"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
@@ -42,6 +42,7 @@ def get_env_value(env_variable):
 
 
 FILES_LIMIT = int(os.environ.get("FILES_LIMIT", 1000))
+REPORTS_EXPORT_LIMIT = int(os.environ.get("REPORTS_EXPORT_LIMIT", 100))
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -66,6 +67,197 @@ ALLOWED_HOSTS = ["*"]
 API_GATEWAY_URL = get_env_value("API_GATEWAY_URL")
 API_GATEWAY_USERNAME = "vendorcrapi"
 API_GATEWAY_PASSWORD = "Pa$$4Vendor_1"
+PAYMENT_CACHE_TTL = int(os.environ.get("PAYMENT_CACHE_TTL", 60))
+PAYMENT_CACHE_STALE_TTL = int(os.environ.get("PAYMENT_CACHE_STALE_TTL", 300))
+PAYMENT_CACHE_MAX_ENTRIES = int(os.environ.get("PAYMENT_CACHE_MAX_ENTRIES", 10000))
+PAYMENT_CACHE_REFRESH_WORKERS = int(os.environ.get("PAYMENT_CACHE_REFRESH_WORKERS", 2))
+PRODUCT_CATALOG_TTL = int(os.environ.get("PRODUCT_CATALOG_TTL", 60))
+PRODUCT_CATALOG_MAX_AGE = int(os.environ.get("PRODUCT_CATALOG_MAX_AGE", 60))
+
+OUTBOUND_MAX_CONNECTIONS = int(os.environ.get("OUTBOUND_MAX_CONNECTIONS", 100))
+OUTBOUND_MAX_KEEPALIVE_CONNECTIONS = int(
+    os.environ.get("OUTBOUND_MAX_KEEPALIVE_CONNECTIONS", 20)
+)
+MECHANIC_API_ATTEMPT_TIMEOUT = float(os.environ.get("MECHANIC_API_ATTEMPT_TIMEOUT", 5))
+MECHANIC_API_DEADLINE = float(os.environ.get("MECHANIC_API_DEADLINE", 30))
+MECHANIC_API_BACKOFF_BASE = float(os.environ.get("MECHANIC_API_BACKOFF_BASE", 0.1))
+MECHANIC_API_BACKOFF_MAX = float(os.environ.get("MECHANIC_API_BACKOFF_MAX", 2))
+MECHANIC_API_MAX_FANOUT = int(os.environ.get("MECHANIC_API_MAX_FANOUT", 5))
+CONTACT_MECHANIC_JOB_WORKERS = int(os.environ.get("CONTACT_MECHANIC_JOB_WORKERS", 4))
+CONTACT_MECHANIC_JOB_QUEUE_SIZE = int(
+    os.environ.get("CONTACT_MECHANIC_JOB_QUEUE_SIZE", 100)
+)
+CONTACT_MECHANIC_JOB_TTL = int(os.environ.get("CONTACT_MECHANIC_JOB_TTL", 600))
+# Shared by the gunicorn workers, jobs are only kept in memory when empty
+CONTACT_MECHANIC_JOB_DIR = os.environ.get("CONTACT_MECHANIC_JOB_DIR", "")
+
+# Tiers of utils.cache: each worker keeps the entries it read for at most
+# CACHE_LOCAL_TTL seconds, the shared tier is a Redis server when
+# SHARED_CACHE_URL is set (needs the redis package), else a directory of
+# the host shared by the gunicorn workers, else the memory of the worker
+CACHE_TTL = int(os.environ.get("CACHE_TTL", 60))
+CACHE_TTL_JITTER = float(os.environ.get("CACHE_TTL_JITTER", 0.1))
+# Expired entries are still served this long while one worker recomputes them
+CACHE_STALE_TTL = int(os.environ.get("CACHE_STALE_TTL", 60))
+CACHE_LOCAL_TTL = int(os.environ.get("CACHE_LOCAL_TTL", 5))
+CACHE_LOCK_TIMEOUT = float(os.environ.get("CACHE_LOCK_TIMEOUT", 5))
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", 10000))
+# Users are written by the identity service as well, its role and status
+# changes reach the authentication of the workshop after this long
+USER_CACHE_TTL = int(os.environ.get("USER_CACHE_TTL", 5))
+SHARED_CACHE_URL = os.environ.get("SHARED_CACHE_URL", "")
+SHARED_CACHE_DIR = os.environ.get("SHARED_CACHE_DIR", "")
+if SHARED_CACHE_URL:
+    SHARED_CACHE = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": SHARED_CACHE_URL,
+    }
+elif SHARED_CACHE_DIR:
+    SHARED_CACHE = {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": SHARED_CACHE_DIR,
+        "OPTIONS": {"MAX_ENTRIES": CACHE_MAX_ENTRIES},
+    }
+else:
+    SHARED_CACHE = {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "workshop-shared",
+        "OPTIONS": {"MAX_ENTRIES": CACHE_MAX_ENTRIES},
+    }
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "workshop-local",
+        "OPTIONS": {"MAX_ENTRIES": CACHE_MAX_ENTRIES},
+    },
+    "shared": dict(SHARED_CACHE, KEY_PREFIX="workshop"),
+}
+
+# Workers evict the entries of their in-process caches on the writes of
+# the others, notified on this Postgres channel
+INVALIDATION_BUS = os.environ.get("INVALIDATION_BUS", "true").lower() == "true"
+INVALIDATION_CHANNEL = os.environ.get("INVALIDATION_CHANNEL", "workshop_invalidation")
+INVALIDATION_PING_INTERVAL = int(os.environ.get("INVALIDATION_PING_INTERVAL", 30))
+
+# Identical concurrent GETs of the coalesced views share one response,
+# the followers wait this long, in seconds, for the leader
+COALESCING = os.environ.get("COALESCING", "true").lower() == "true"
+COALESCING_WAIT_TIMEOUT = float(os.environ.get("COALESCING_WAIT_TIMEOUT", 5))
+
+# New workers load the views and templates, open their connections and
+# prime the caches before accepting requests, see utils/warmup.py
+WARMUP = os.environ.get("WARMUP", "true").lower() == "true"
+WARMUP_TIMEOUT = float(os.environ.get("WARMUP_TIMEOUT", 20))
+WARMUP_RETRY_INTERVAL = float(os.environ.get("WARMUP_RETRY_INTERVAL", 10))
+
+# The health of Postgres and MongoDB is sampled by a thread of every worker
+# and the readiness probe answers from the last sample, which is stale
+# after HEALTH_MAX_AGE seconds, see utils/health.py
+HEALTH_SAMPLE_INTERVAL = float(os.environ.get("HEALTH_SAMPLE_INTERVAL", 10))
+HEALTH_MAX_AGE = float(os.environ.get("HEALTH_MAX_AGE", 30))
+HEALTH_CHECK_TIMEOUT = float(os.environ.get("HEALTH_CHECK_TIMEOUT", 2))
+
+# Preferred first when the client accepts several of them equally
+COMPRESSION_ENCODINGS = [
+    encoding.strip()
+    for encoding in os.environ.get("COMPRESSION_ENCODINGS", "br,zstd,gzip").split(",")
+]
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", 1024))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get("COMPRESSION_GZIP_LEVEL", 6))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get("COMPRESSION_BROTLI_QUALITY", 4))
+COMPRESSION_ZSTD_LEVEL = int(os.environ.get("COMPRESSION_ZSTD_LEVEL", 3))
+
+# Share of the requests answered with a Server-Timing header
+PROFILING_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", 0))
+# Requests with this X-Profile-Token are always profiled and log their queries
+PROFILING_DEBUG_TOKEN = os.environ.get("PROFILING_DEBUG_TOKEN", "")
+
+# Longest profile the admin profiling API can take, in seconds
+PROFILER_MAX_DURATION = float(os.environ.get("PROFILER_MAX_DURATION", 60))
+
+# Queries slower than this are appended to SLOW_QUERY_LOG_FILE, empty to disable
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get("SLOW_QUERY_THRESHOLD_MS", 200))
+SLOW_QUERY_LOG_FILE = os.environ.get(
+    "SLOW_QUERY_LOG_FILE", os.path.join(BASE_DIR, "slow_queries.log")
+)
+SLOW_QUERY_EXPLAIN = os.environ.get("SLOW_QUERY_EXPLAIN", "true").lower() == "true"
+
+# Requests a worker serves at once, exported by gunicorn.conf.py
+WORKER_CONCURRENCY = int(os.environ.get("WORKER_CONCURRENCY", 20))
+# Sync views a worker runs at once, 1 under ASGI where they all run on the
+# same thread
+WORKER_SYNC_CONCURRENCY = int(
+    os.environ.get("WORKER_SYNC_CONCURRENCY", WORKER_CONCURRENCY)
+)
+# Admission control, per worker. The liveness probe, the other health
+# checks and the metrics get their own lanes of requests out of the worker
+# concurrency, as name: (paths, limit), so that a slow readiness check or
+# scrape does not fail the liveness probe. The other requests are shed
+# with a 503 once the rest is in use. The requests of sync views wait like
+# the ones of a route when the worker runs fewer sync views than requests
+# at once.
+ADMISSION_CONTROL = os.environ.get("ADMISSION_CONTROL", "true").lower() == "true"
+ADMISSION_LANES = {
+    "live": (
+        ("/workshop/live",),
+        int(os.environ.get("ADMISSION_LIVE_LIMIT", 1)),
+    ),
+    "health": (
+        ("/workshop/health_check/", "/workshop/ready"),
+        int(os.environ.get("ADMISSION_HEALTH_LIMIT", 1)),
+    ),
+    "metrics": (
+        ("/workshop/metrics",),
+        int(os.environ.get("ADMISSION_METRICS_LIMIT", 1)),
+    ),
+}
+ADMISSION_MAX_CONCURRENCY = int(
+    os.environ.get(
+        "ADMISSION_MAX_CONCURRENCY",
+        max(
+            1,
+            WORKER_CONCURRENCY - sum(limit for _, limit in ADMISSION_LANES.values()),
+        ),
+    )
+)
+# A single route may use this share of ADMISSION_MAX_CONCURRENCY, unless its
+# view has a limit in ADMISSION_ROUTE_LIMITS, e.g. ContactMechanicView=2
+ADMISSION_ROUTE_SHARE = float(os.environ.get("ADMISSION_ROUTE_SHARE", 0.5))
+ADMISSION_ROUTE_LIMITS = {
+    view.strip(): int(limit)
+    for view, limit in (
+        item.rsplit("=", 1)
+        for item in os.environ.get("ADMISSION_ROUTE_LIMITS", "").split(",")
+        if item.strip()
+    )
+}
+# Requests over the limit of their route wait this long, in seconds, at most
+# ADMISSION_MAX_WAITING of them per route
+ADMISSION_MAX_WAITING = int(os.environ.get("ADMISSION_MAX_WAITING", 10))
+ADMISSION_WAIT_TIMEOUT = float(os.environ.get("ADMISSION_WAIT_TIMEOUT", 1))
+ADMISSION_RETRY_AFTER = int(os.environ.get("ADMISSION_RETRY_AFTER", 1))
+
+# Token bucket budgets of the costly endpoints per user, as
+# scope=requests/seconds. A scope left out is not limited.
+RATE_LIMITS = {
+    scope.strip(): tuple(int(value) for value in budget.split("/"))
+    for scope, budget in (
+        item.rsplit("=", 1)
+        for item in os.environ.get(
+            "RATE_LIMITS",
+            "contact_mechanic=10/60,service_report=30/60,apply_coupon=10/60",
+        ).split(",")
+        if item.strip()
+    )
+}
+# memory keeps the buckets in each worker, database shares them
+# between the workers in the rate_limit_bucket table
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "database")
+
+# Serialize datetimes like the stock JSONRenderer instead of natively
+ORJSON_RENDERER_COMPAT = (
+    os.environ.get("ORJSON_RENDERER_COMPAT", "false").lower() == "true"
+)
 
 # Application definition
 
@@ -87,7 +279,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "utils.admission.AdmissionMiddleware",
+    "utils.metrics.MetricsMiddleware",
+    "utils.profiling.ProfilingMiddleware",
+    "utils.slow_queries.SlowQueryMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "utils.compression.CompressionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -127,48 +324,66 @@ WSGI_APPLICATION = "crapi_site.wsgi.application"
 
 REST_FRAMEWORK = {
     "DEFAULT_RENDERER_CLASSES": [
-        "rest_framework.renderers.JSONRenderer",
+        "utils.renderers.ORJSONRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "utils.parsers.ORJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
     ],
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.LimitOffsetPagination",
     "PAGE_SIZE": MAX_LIMIT,
     "DEFAULT_FILTER_BACKENDS": ("django_filters.rest_framework.DjangoFilterBackend",),
     "UNAUTHENTICATED_USER": None,  # Needed once you disable django.contrib.auth
 }
+LOG_FILE_MAX_BYTES = int(os.environ.get("LOG_FILE_MAX_BYTES", 10 * 1024 * 1024))
+LOG_FILE_BACKUP_COUNT = int(os.environ.get("LOG_FILE_BACKUP_COUNT", 5))
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+LOG_BATCH_SIZE = int(os.environ.get("LOG_BATCH_SIZE", 256))
+LOG_MAX_MESSAGE_LENGTH = int(os.environ.get("LOG_MAX_MESSAGE_LENGTH", 4096))
+# Records per second and process above which records below WARNING are sampled
+LOG_SAMPLE_THRESHOLD = int(os.environ.get("LOG_SAMPLE_THRESHOLD", 1000))
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", 0.1))
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
     "formatters": {
-        "standard": {"format": "%(asctime)s %(name)-12s [%(levelname)s]: %(message)s"},
-        "console": {"format": "%(name)-12s %(levelname)-8s %(message)s"},
+        "json": {"()": "utils.logging.JSONFormatter"},
     },
     "handlers": {
-        "file": {
+        "queue": {
             "level": LOG_LEVEL,
-            "class": "logging.FileHandler",
+            "class": "utils.logging.QueueWriterHandler",
+            "formatter": "json",
             "filename": BASE_DIR + "/debug.log",
-            "formatter": "standard",
-        },
-        "console": {
-            "level": LOG_LEVEL,
-            "class": "logging.StreamHandler",
-            "formatter": "console",
+            "max_bytes": LOG_FILE_MAX_BYTES,
+            "backup_count": LOG_FILE_BACKUP_COUNT,
+            "queue_size": LOG_QUEUE_SIZE,
+            "batch_size": LOG_BATCH_SIZE,
+            "max_message_length": LOG_MAX_MESSAGE_LENGTH,
+            "sample_threshold": LOG_SAMPLE_THRESHOLD,
+            "sample_rate": LOG_SAMPLE_RATE,
         },
     },
     "root": {
-        "handlers": ["file", "console"],
+        "handlers": ["queue"],
         "level": LOG_LEVEL,
     },
     "django.request": {
-        "handlers": ["file"],
+        "handlers": ["queue"],
         "level": LOG_LEVEL,
     },
     "djongo": {
         "level": LOG_LEVEL,
-        "handlers": ["console"],
+        "handlers": ["queue"],
         "propogate": True,
     },
 }
 
+# wsgi or asgi, the interface gunicorn serves the application with
+SERVER_INTERFACE = os.environ.get("SERVER_INTERFACE", "wsgi").lower()
+
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
@@ -184,7 +399,15 @@ DATABASES = {
             "NAME": "test_crapi",
             "USER": get_env_value("DB_USER"),
         },
-        "CONN_MAX_AGE": 0,
+        # Connections are kept between the requests of a thread, but not
+        # under ASGI where the threads running the sync code of a request
+        # would leak them (https://code.djangoproject.com/ticket/33497)
+        "CONN_MAX_AGE": (
+            0
+            if SERVER_INTERFACE == "asgi"
+            else int(os.environ.get("DB_CONN_MAX_AGE", 60))
+        ),
+        "CONN_HEALTH_CHECKS": True,
     },
     "mongodb": {
         "ENGINE": "djongo",
@@ -30,9 +30,14 @@ Including another URLconf
 # from django.contrib import admin
 from django.contrib import admin
 from django.urls import path, include
+from utils.metrics import metrics_view
+from utils.health import live_view, ready_view
 
 urlpatterns = [
     path("workshop/admin/", admin.site.urls),
     path("workshop/health_check/", include("health_check.urls")),
+    path("workshop/metrics", metrics_view),
+    path("workshop/live", live_view),
+    path("workshop/ready", ready_view),
     path("workshop/", include("crapi.urls")),
 ]
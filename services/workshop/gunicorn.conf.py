@@ -0,0 +1,185 @@
+#
+# Licensed under the Apache License, Version 2.0 (the “License”);
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an “AS IS” BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+gunicorn configuration of the workshop
+
+Every setting can be overridden from the environment. By default there is
+one worker process per available CPU, each one running the 20 threads the
+single worker of runner.sh used to run. Every authenticated request waits
+on the identity service, and many on the database or the mechanic apis,
+so a worker needs far more threads than CPUs. With GUNICORN_IO_RATIO, the
+share of a request spent waiting on the other services, the threads are
+sized to keep the CPU busy instead:
+    threads = ceil(1 / (1 - GUNICORN_IO_RATIO))
+The ratio has to be measured against the real upstream latencies: a
+request waiting 500 ms for 10 ms of CPU has a ratio of 0.98 and needs 50
+threads, while the 0.75 measured with the 20 ms stub of the load tests
+gives 4, and leaves the worker idle while its threads wait. More threads
+cost memory and add GIL contention on the CPU bound routes, like the
+report PDFs, so the ratio should not overshoot either. The application is
+loaded once in the master so the workers share its memory copy-on-write,
+and workers are recycled after about GUNICORN_MAX_REQUESTS requests.
+
+With SERVER_INTERFACE=asgi the workers are uvicorn workers serving
+crapi_site.asgi: the async views wait on the other services on the event
+loop of the worker, but Django runs every sync view, and the sync code of
+the async ones, through sync_to_async(thread_sensitive=True), that is one
+at a time on a single thread of the worker. Only the async views of
+contact_mechanic and of the orders gain from it, the other endpoints
+serve more requests with gthread workers, which stay the default. The
+database connections of uvicorn workers are closed after every request,
+see CONN_MAX_AGE in crapi_site/settings.py.
+
+The concurrency of a worker is exported as WORKER_CONCURRENCY, and the
+sync views it runs at once as WORKER_SYNC_CONCURRENCY, the admission
+control of the app sheds the requests over them.
+"""
+import math
+import os
+from prometheus_client import multiprocess
+
+DEFAULT_THREADS = 20
+MAX_IO_RATIO = 0.99
+
+
+def available_cpus():
+    """
+    :return: number of CPUs the process may use, from the cgroup quota of
+        the container when there is one, at least 1
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    quota = None
+    try:
+        # cgroup v2
+        with open("/sys/fs/cgroup/cpu.max") as cpu_max:
+            limit, period = cpu_max.read().split()
+        if limit != "max":
+            quota = int(limit) / int(period)
+    except (OSError, ValueError):
+        try:
+            # cgroup v1
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as cfs_quota:
+                limit = int(cfs_quota.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as cfs_period:
+                period = int(cfs_period.read())
+            if limit > 0:
+                quota = limit / period
+        except (OSError, ValueError):
+            pass
+    if quota is not None:
+        cpus = min(cpus, math.ceil(quota))
+    return max(1, cpus)
+
+
+def env_flag(name, default):
+    return os.environ.get(name, default).lower() in ["true", "1", "yes"]
+
+
+def default_threads():
+    io_ratio = os.environ.get("GUNICORN_IO_RATIO")
+    if not io_ratio:
+        return DEFAULT_THREADS
+    return math.ceil(1 / (1 - min(float(io_ratio), MAX_IO_RATIO)))
+
+
+cpus = available_cpus()
+
+bind = os.environ.get("GUNICORN_BIND", f"0.0.0.0:{os.environ.get('SERVER_PORT', 8000)}")
+workers = int(os.environ.get("GUNICORN_WORKERS", cpus))
+if os.environ.get("SERVER_INTERFACE", "wsgi").lower() == "asgi":
+    wsgi_app = "crapi_site.asgi:application"
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    wsgi_app = "crapi_site.wsgi:application"
+    worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", default_threads()))
+# Sizes the admission control of the app, the event loop of a uvicorn
+# worker is not bounded by its threads but runs a sync view at a time
+os.environ.setdefault(
+    "WORKER_CONCURRENCY", str(threads if worker_class == "gthread" else 1000)
+)
+os.environ.setdefault(
+    "WORKER_SYNC_CONCURRENCY", str(threads if worker_class == "gthread" else 1)
+)
+preload_app = env_flag("GUNICORN_PRELOAD", "true")
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 5000))
+max_requests_jitter = int(
+    os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", max_requests // 10)
+)
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+backlog = int(os.environ.get("GUNICORN_BACKLOG", 2048))
+loglevel = os.environ.get("GUNICORN_LOG_LEVEL", "info")
+
+if env_flag("TLS_ENABLED", "false"):
+    certfile = os.environ.get("TLS_CERTIFICATE") or "certs/server.crt"
+    keyfile = os.environ.get("TLS_KEY") or "certs/server.key"
+
+
+def when_ready(server):
+    server.log.info(
+        "Serving %s with %s %s workers of %s threads on %s CPUs, preload %s",
+        server.cfg.wsgi_app,
+        server.cfg.workers,
+        server.cfg.worker_class_str,
+        server.cfg.threads,
+        cpus,
+        server.cfg.preload_app,
+    )
+
+
+def pre_fork(server, worker):
+    """
+    closes the connections the master opened while loading the app,
+    the workers must not share their sockets
+    """
+    if server.cfg.preload_app:
+        from django.db import connections
+
+        connections.close_all()
+
+
+def post_worker_init(worker):
+    """
+    starts the listener of the invalidation bus of the worker, warms the
+    worker up before it accepts requests and starts sampling its health
+    """
+    from django.conf import settings
+
+    if settings.INVALIDATION_BUS:
+        from utils.invalidation import bus
+
+        bus.start()
+    if settings.WARMUP:
+        from utils.warmup import warm_up
+
+        # The thread pool of the gthread workers
+        executor = getattr(worker, "tpool", None)
+        warm_up.run(executor, worker.cfg.threads if executor else 1)
+    from utils.health import sampler
+
+    sampler.start()
+
+
+def child_exit(server, worker):
+    """
+    drops the live gauges of a worker which exited
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(worker.pid)
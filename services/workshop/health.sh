@@ -1,6 +1,7 @@
 #!/bin/sh
+# Usage: health.sh [live|ready], ready by default
 SCHEME="http"
 if [ "$TLS_ENABLED" = "true" ] || [ "$TLS_ENABLED" = "1" ]; then
   SCHEME="https"
 fi
-curl -k $SCHEME://0.0.0.0:${SERVER_PORT:-8000}/workshop/health_check/
+curl -fsk $SCHEME://0.0.0.0:${SERVER_PORT:-8000}/workshop/${1:-ready}
@@ -0,0 +1,240 @@
+#
+# Licensed under the Apache License, Version 2.0 (the “License”);
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an “AS IS” BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Compares gunicorn serving profiles of the workshop under the same load
+
+    . ./.env && python loadtest/compare_profiles.py --duration 30 \
+        --profile single:GUNICORN_WORKERS=1,GUNICORN_THREADS=20,GUNICORN_PRELOAD=false \
+        --profile tuned: --profile asgi:SERVER_INTERFACE=asgi
+
+A profile is a name and the environment overrides of gunicorn.conf.py, the
+first one is the reference of the comparison. The stub server is started
+once and every profile is started in turn, loaded with loadgen.py and
+stopped. The throughput, latencies, failures and memory of the workers,
+as the sum of their proportional set sizes, are reported per profile.
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+
+LOADTEST_DIR = os.path.dirname(os.path.abspath(__file__))
+WORKSHOP_DIR = os.path.dirname(LOADTEST_DIR)
+
+DEFAULT_PROFILES = [
+    "single:GUNICORN_WORKERS=1,GUNICORN_THREADS=20,GUNICORN_PRELOAD=false",
+    "tuned:",
+]
+
+
+def parse_profile(value):
+    """
+    :param value: NAME:VAR=VALUE,VAR=VALUE
+    :return: (name, dict of the environment overrides)
+    """
+    name, _, overrides = value.partition(":")
+    env = {}
+    for override in filter(None, overrides.split(",")):
+        var, sep, var_value = override.partition("=")
+        if not sep:
+            raise argparse.ArgumentTypeError(f"expected VAR=VALUE, got {override}")
+        env[var] = var_value
+    return name, env
+
+
+def process_tree(pid):
+    """
+    :return: pid and the pids of all the descendants of the process
+    """
+    pids = [pid]
+    for parent in pids:
+        try:
+            with open(f"/proc/{parent}/task/{parent}/children") as children:
+                pids.extend(int(child) for child in children.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def memory_mb(pid):
+    """
+    :return: sum of the proportional set sizes of the process tree in MB,
+        None where /proc does not report it
+    """
+    total = 0
+    for child in process_tree(pid):
+        try:
+            with open(f"/proc/{child}/smaps_rollup") as smaps:
+                for line in smaps:
+                    if line.startswith("Pss:"):
+                        total += int(line.split()[1])
+                        break
+        except OSError:
+            return None
+    return round(total / 1024, 1)
+
+
+def wait_until_up(base_url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            # Unauthenticated, any answer of the app will do
+            if httpx.get(base_url + "/workshop/api/shop/products").status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise SystemExit(f"The workshop did not start within {timeout}s")
+
+
+def run_profile(name, overrides, args, stub_url):
+    base_url = f"http://127.0.0.1:{args.port}"
+    with tempfile.TemporaryDirectory() as run_dir:
+        env = dict(
+            os.environ,
+            IDENTITY_SERVICE=stub_url.split("://", 1)[1],
+            API_GATEWAY_URL=stub_url,
+            TLS_ENABLED="false",
+            RATE_LIMITS="",
+            GUNICORN_BIND=f"127.0.0.1:{args.port}",
+            PROMETHEUS_MULTIPROC_DIR=os.path.join(run_dir, "metrics"),
+            CONTACT_MECHANIC_JOB_DIR=os.path.join(run_dir, "jobs"),
+            **overrides,
+        )
+        os.mkdir(env["PROMETHEUS_MULTIPROC_DIR"])
+        os.mkdir(env["CONTACT_MECHANIC_JOB_DIR"])
+        report_path = os.path.join(run_dir, "report.json")
+        with open(os.path.join(run_dir, "gunicorn.log"), "w") as server_log:
+            server = subprocess.Popen(
+                ["gunicorn", "-c", "gunicorn.conf.py"],
+                cwd=WORKSHOP_DIR,
+                env=env,
+                stdout=server_log,
+                stderr=subprocess.STDOUT,
+            )
+        try:
+            wait_until_up(base_url, args.start_timeout)
+            print(f"Loading profile {name} {overrides}", flush=True)
+            subprocess.run(
+                [
+                    sys.executable,
+                    os.path.join(LOADTEST_DIR, "loadgen.py"),
+                    f"--base-url={base_url}",
+                    f"--stub-url={stub_url}",
+                    f"--duration={args.duration}",
+                    f"--warmup={args.warmup}",
+                    f"--concurrency={args.concurrency}",
+                    f"--json={report_path}",
+                    *(f"--only={name}" for name in args.only or ()),
+                ],
+                check=True,
+                stdout=subprocess.DEVNULL,
+            )
+            memory = memory_mb(server.pid)
+        finally:
+            server.send_signal(signal.SIGTERM)
+            try:
+                server.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                server.kill()
+        with open(report_path) as report_file:
+            total = json.load(report_file)["total"]
+    return dict(total, memory_mb=memory)
+
+
+def change(value, reference):
+    if not reference or value is None:
+        return ""
+    return f"{(value - reference) / reference:+.0%}"
+
+
+def print_comparison(results):
+    header = (
+        f"{'profile':<16}{'rps':>16}{'p50 ms':>16}{'p95 ms':>16}"
+        f"{'p99 ms':>16}{'failures':>10}{'memory MB':>16}"
+    )
+    print()
+    print(header)
+    print("-" * len(header))
+    reference = next(iter(results.values()))
+    for name, row in results.items():
+        cells = [f"{name:<16}"]
+        for key in ("rps", "p50_ms", "p95_ms", "p99_ms"):
+            cells.append(f"{row[key]:>9} {change(row[key], reference[key]):>6}")
+        cells.append(f"{row['failures']:>10}")
+        memory = row["memory_mb"]
+        cells.append(
+            f"{memory if memory is not None else '-':>9} "
+            f"{change(memory, reference['memory_mb']):>6}"
+        )
+        print("".join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--profile",
+        type=parse_profile,
+        action="append",
+        help="NAME:VAR=VALUE,VAR=VALUE, can be repeated, "
+        f"by default {' and '.join(DEFAULT_PROFILES)}",
+    )
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--stub-port", type=int, default=8090)
+    parser.add_argument("--stub-latency-ms", type=float, default=20)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--start-timeout", type=float, default=60)
+    parser.add_argument(
+        "--only",
+        action="append",
+        help="endpoint of loadgen.py to load, can be repeated",
+    )
+    parser.add_argument("--json", help="also write the comparison to this file")
+    args = parser.parse_args()
+    profiles = args.profile or [parse_profile(value) for value in DEFAULT_PROFILES]
+
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+    stub = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.join(LOADTEST_DIR, "stub_server.py"),
+            f"--port={args.stub_port}",
+            f"--latency-ms={args.stub_latency_ms}",
+        ],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        results = {
+            name: run_profile(name, overrides, args, stub_url)
+            for name, overrides in profiles
+        }
+    finally:
+        stub.terminate()
+        stub.wait()
+    print_comparison(results)
+    if args.json:
+        with open(args.json, "w") as comparison_file:
+            json.dump(results, comparison_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+#
+# Licensed under the Apache License, Version 2.0 (the “License”);
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an “AS IS” BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Load generator for the shop, mechanic and merchant APIs of the workshop
+
+    python loadtest/loadgen.py --base-url http://127.0.0.1:8000 \
+        --stub-url http://127.0.0.1:8090 --duration 30 --concurrency 20
+
+The workshop must run against loadtest/stub_server.py, which accepts any
+token: the load test users are signed up through the mechanic signup API
+and authenticate with unsigned JWTs naming them. Requests are drawn from
+a weighted mix of endpoints by closed-loop clients, and the p50, p95 and
+p99 latencies and the throughput are reported per endpoint. Requests of
+the warm-up period are left out of the report.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+import httpx
+import jwt
+
+# name: (method, path, weight, expected statuses)
+ENDPOINTS = {
+    "products": ("GET", "/workshop/api/shop/products", 20, (200,)),
+    "orders_all": ("GET", "/workshop/api/shop/orders/all", 10, (200,)),
+    "order": ("GET", "/workshop/api/shop/orders/{order_id}", 10, (200,)),
+    "mechanics": ("GET", "/workshop/api/mechanic/", 10, (200,)),
+    "service_requests": (
+        "GET",
+        "/workshop/api/mechanic/service_requests",
+        10,
+        (200,),
+    ),
+    "merchant_service_requests": (
+        "GET",
+        "/workshop/api/merchant/service_requests/{vin}",
+        5,
+        (200, 404),
+    ),
+    "contact_mechanic": (
+        "POST",
+        "/workshop/api/merchant/contact_mechanic",
+        5,
+        (200,),
+    ),
+}
+
+
+def percentile(values, fraction):
+    """
+    :param values: sorted list
+    :param fraction: between 0 and 1
+    :return: nearest rank percentile
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def token_for(email):
+    # The stub identity service accepts any token, the workshop reads sub
+    return jwt.encode({"sub": email, "role": "user"}, "loadtest", algorithm="HS256")
+
+
+async def sign_up_users(client, count, run_id):
+    """
+    creates the load test users through the mechanic signup API
+    :return: list of Authorization headers
+    """
+    headers = []
+    for i in range(count):
+        email = f"loadtest-{run_id}-{i}@example.com"
+        res = await client.post(
+            "/workshop/api/mechanic/signup",
+            json={
+                "name": f"Load Test {i}",
+                "email": email,
+                "number": f"9{i:09d}",
+                "password": "loadtest",
+                "mechanic_code": f"LT_{run_id}_{i}",
+            },
+        )
+        if res.status_code != 200:
+            raise SystemExit(f"Could not sign up {email}: {res.status_code} {res.text}")
+        headers.append({"Authorization": "Bearer " + token_for(email)})
+    return headers
+
+
+async def find_order_ids(client, headers, limit=20):
+    """
+    :return: ids of the first orders, as the order API does not check the
+        owner, up to the first missing id
+    """
+    order_ids = []
+    for order_id in range(1, limit + 1):
+        res = await client.get(
+            f"/workshop/api/shop/orders/{order_id}",
+            params={"include_payment": "false"},
+            headers=headers,
+        )
+        if res.status_code == 200:
+            order_ids.append(order_id)
+        elif order_ids:
+            break
+    return order_ids
+
+
+class Recorder:
+    """
+    Latencies and failures per endpoint
+    """
+
+    def __init__(self):
+        self.latencies = {name: [] for name in ENDPOINTS}
+        self.failures = {name: 0 for name in ENDPOINTS}
+        self.statuses = {name: {} for name in ENDPOINTS}
+
+    def record(self, name, latency, status, ok):
+        self.latencies[name].append(latency)
+        self.statuses[name][status] = self.statuses[name].get(status, 0) + 1
+        if not ok:
+            self.failures[name] += 1
+
+    def report(self, elapsed):
+        rows = {}
+        for name, latencies in self.latencies.items():
+            if not latencies:
+                continue
+            latencies.sort()
+            rows[name] = {
+                "requests": len(latencies),
+                "failures": self.failures[name],
+                "rps": round(len(latencies) / elapsed, 2),
+                "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+                "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+                "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+                "max_ms": round(latencies[-1] * 1000, 2),
+                "statuses": {str(k): v for k, v in self.statuses[name].items()},
+            }
+        everything = sorted(
+            latency for latencies in self.latencies.values() for latency in latencies
+        )
+        rows["total"] = {
+            "requests": len(everything),
+            "failures": sum(self.failures.values()),
+            "rps": round(len(everything) / elapsed, 2),
+            "p50_ms": round(percentile(everything, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(everything, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(everything, 0.99) * 1000, 2),
+            "max_ms": round(everything[-1] * 1000, 2) if everything else 0.0,
+        }
+        return rows
+
+
+def build_request(name, rng, users, order_ids, stub_url):
+    method, path, _, _ = ENDPOINTS[name]
+    kwargs = {"headers": rng.choice(users)}
+    if name == "order":
+        path = path.format(order_id=rng.choice(order_ids))
+    elif name == "merchant_service_requests":
+        path = path.format(vin=f"LOADTEST{rng.randrange(10**9):09d}")
+    elif name == "contact_mechanic":
+        kwargs["json"] = {
+            "mechanic_api": stub_url + "/mechanic/receive_report",
+            "mechanic_code": "TRAC_JHN",
+            "problem_details": "Load test",
+            "vin": "LOADTEST000000000",
+        }
+    return method, path, kwargs
+
+
+async def client_loop(client, rng, mix, context, recorder, warmup_end, deadline):
+    names, weights = mix
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights)[0]
+        method, path, kwargs = build_request(name, rng, *context)
+        start = time.perf_counter()
+        try:
+            res = await client.request(method, path, **kwargs)
+            status = res.status_code
+            ok = status in ENDPOINTS[name][3]
+        except httpx.HTTPError as e:
+            status, ok = type(e).__name__, False
+        latency = time.perf_counter() - start
+        if start >= warmup_end:
+            recorder.record(name, latency, status, ok)
+
+
+def print_report(rows, elapsed, concurrency):
+    print(f"\n{elapsed:.1f}s measured with {concurrency} concurrent clients\n")
+    header = (
+        f"{'endpoint':<28}{'requests':>10}{'failures':>10}{'rps':>10}"
+        f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+    )
+    print(header)
+    print("-" * len(header))
+    for name, row in rows.items():
+        print(
+            f"{name:<28}{row['requests']:>10}{row['failures']:>10}{row['rps']:>10}"
+            f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}"
+            f"{row['max_ms']:>10}"
+        )
+
+
+async def run(args):
+    limits = httpx.Limits(
+        max_connections=args.concurrency, max_keepalive_connections=args.concurrency
+    )
+    async with httpx.AsyncClient(
+        base_url=args.base_url, limits=limits, timeout=args.timeout, verify=False
+    ) as client:
+        run_id = uuid.uuid4().hex[:8]
+        users = await sign_up_users(client, args.users, run_id)
+        order_ids = await find_order_ids(client, users[0])
+
+        mix = {
+            name: endpoint[2]
+            for name, endpoint in ENDPOINTS.items()
+            if not args.only or name in args.only
+        }
+        if not order_ids:
+            print("No orders found, the order endpoint is left out")
+            mix.pop("order", None)
+        if not mix:
+            raise SystemExit("No endpoint to load")
+
+        recorder = Recorder()
+        warmup_end = time.perf_counter() + args.warmup
+        deadline = warmup_end + args.duration
+        context = (users, order_ids, args.stub_url)
+        await asyncio.gather(
+            *(
+                client_loop(
+                    client,
+                    random.Random(args.seed + i),
+                    (list(mix), list(mix.values())),
+                    context,
+                    recorder,
+                    warmup_end,
+                    deadline,
+                )
+                for i in range(args.concurrency)
+            )
+        )
+    rows = recorder.report(args.duration)
+    print_report(rows, args.duration, args.concurrency)
+    if args.json:
+        with open(args.json, "w") as report_file:
+            json.dump(rows, report_file, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--stub-url", default="http://127.0.0.1:8090")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--only",
+        action="append",
+        choices=sorted(ENDPOINTS),
+        help="endpoint to load, can be repeated, all of them by default",
+    )
+    parser.add_argument("--json", help="also write the report to this file")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
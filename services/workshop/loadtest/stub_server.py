@@ -0,0 +1,228 @@
+#
+# Licensed under the Apache License, Version 2.0 (the “License”);
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an “AS IS” BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Stand-in for the identity service, the API gateway and a mechanic API,
+so the workshop can be load tested on its own
+
+    python loadtest/stub_server.py --port 8090 --latency-ms 5 --jitter-ms 2 \
+        --route verify:20:0.01
+
+Point the workshop at it with loadtest/stub.env. Every route answers after
+its latency, plus a uniform jitter, and fails with a 503 at its error rate.
+GET /stub/stats returns the number of calls and failures per route.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROUTES = {
+    ("POST", "/identity/api/auth/verify"): "verify",
+    ("GET", "/identity/health_check"): "health",
+    ("POST", "/v1/payment"): "payment",
+    ("GET", "/mechanic/receive_report"): "mechanic",
+}
+
+
+class RouteConfig:
+    """
+    Latency and error rate of a route
+    """
+
+    def __init__(self, latency, jitter, error_rate):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+    def delay(self):
+        return self.latency + random.uniform(0, self.jitter)
+
+
+class Stats:
+    """
+    Calls and failures per route, shared by the handler threads
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.failures = {}
+        self._lock = threading.Lock()
+
+    def record(self, route, failed):
+        with self._lock:
+            self.calls[route] = self.calls.get(route, 0) + 1
+            if failed:
+                self.failures[route] = self.failures.get(route, 0) + 1
+
+    def as_dict(self):
+        with self._lock:
+            return {"calls": dict(self.calls), "failures": dict(self.failures)}
+
+
+def verify(body):
+    if not body.get("token"):
+        return 401, {"message": "Invalid JWT Token!"}
+    return 200, {"message": "JWT Token valid"}
+
+
+def health(body):
+    return 200, {"status": "UP"}
+
+
+def payment(body):
+    return 200, {
+        "id": str(uuid.uuid4()),
+        "status": "captured",
+        "amount": body.get("amount", 0),
+        "currency": "USD",
+        "card": {"brand": "visa", "last4": "4242"},
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def mechanic(body):
+    return 200, {
+        "id": random.randint(1, 10**6),
+        "sent": True,
+        "report_link": "http://localhost/workshop/api/mechanic/mechanic_report",
+    }
+
+
+HANDLERS = {
+    "verify": verify,
+    "health": health,
+    "payment": payment,
+    "mechanic": mechanic,
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Routes the requests to the stubs
+    """
+
+    protocol_version = "HTTP/1.1"
+    server_version = "WorkshopStub/1.0"
+
+    def do_GET(self):
+        self.handle_stub("GET")
+
+    def do_POST(self):
+        self.handle_stub("POST")
+
+    def handle_stub(self, method):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw_body = self.rfile.read(length) if length else b""
+        path = self.path.split("?", 1)[0]
+        if method == "GET" and path == "/stub/stats":
+            return self.send_json(200, self.server.stats.as_dict())
+        route = ROUTES.get((method, path))
+        if route is None:
+            return self.send_json(404, {"message": "Not Found"})
+
+        config = self.server.routes[route]
+        time.sleep(config.delay())
+        failed = random.random() < config.error_rate
+        self.server.stats.record(route, failed)
+        if failed:
+            return self.send_json(503, {"message": "Injected failure"})
+        try:
+            body = json.loads(raw_body) if raw_body else {}
+        except ValueError:
+            return self.send_json(400, {"message": "Invalid JSON"})
+        self.send_json(*HANDLERS[route](body))
+
+    def send_json(self, status, data):
+        content = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, routes, verbose=False):
+        super().__init__(address, StubHandler)
+        self.routes = routes
+        self.stats = Stats()
+        self.verbose = verbose
+
+
+def parse_route(value):
+    """
+    :param value: NAME:LATENCY_MS[:ERROR_RATE]
+    :return: (name, latency in ms, error rate or None)
+    """
+    parts = value.split(":")
+    if parts[0] not in HANDLERS or len(parts) not in (2, 3):
+        raise argparse.ArgumentTypeError(
+            f"expected NAME:LATENCY_MS[:ERROR_RATE] with NAME in {sorted(HANDLERS)}"
+        )
+    error_rate = float(parts[2]) if len(parts) == 3 else None
+    return parts[0], float(parts[1]), error_rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=float, default=5)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument(
+        "--route",
+        type=parse_route,
+        action="append",
+        default=[],
+        help="override of a route, NAME:LATENCY_MS[:ERROR_RATE]",
+    )
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    routes = {
+        name: RouteConfig(
+            args.latency_ms / 1000, args.jitter_ms / 1000, args.error_rate
+        )
+        for name in HANDLERS
+    }
+    for name, latency, error_rate in args.route:
+        routes[name].latency = latency / 1000
+        if error_rate is not None:
+            routes[name].error_rate = error_rate
+
+    server = StubServer((args.host, args.port), routes, verbose=args.verbose)
+    print(f"Stub server listening on http://{args.host}:{args.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -34,22 +34,35 @@ if [ $? -ne 0 ]; then
   exit 1
 fi
 
+# Metrics of all the gunicorn workers are aggregated from this directory
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/workshop-metrics}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
+# Contact mechanic jobs are shared by the gunicorn workers through this directory
+export CONTACT_MECHANIC_JOB_DIR=${CONTACT_MECHANIC_JOB_DIR:-/tmp/workshop-jobs}
+rm -rf "$CONTACT_MECHANIC_JOB_DIR" && mkdir -p "$CONTACT_MECHANIC_JOB_DIR"
+
+# Cached read queries are shared by the gunicorn workers through this
+# directory, unless SHARED_CACHE_URL points them to a Redis server
+export SHARED_CACHE_DIR=${SHARED_CACHE_DIR:-/tmp/workshop-cache}
+rm -rf "$SHARED_CACHE_DIR" && mkdir -p "$SHARED_CACHE_DIR"
+
 echo "Starting Django server"
+# Workers, threads and recycling are set from the environment, see gunicorn.conf.py
 if [ "$TLS_ENABLED" = "true" ] || [ "$TLS_ENABLED" = "1" ]; then
   echo "TLS is ENABLED"
   # if $TLS_CERTIFICATE and $TLS_KEY are not set, use the default ones
   if [ "$TLS_CERTIFICATE" = "" ]; then
-    TLS_CERTIFICATE=$DIR/certs/server.crt
+    export TLS_CERTIFICATE=$DIR/certs/server.crt
   fi
   if [ "$TLS_KEY" = "" ]; then
-    TLS_KEY=$DIR/certs/server.key
+    export TLS_KEY=$DIR/certs/server.key
   fi
   echo "TLS_CERTIFICATE: $TLS_CERTIFICATE"
   echo "TLS_KEY: $TLS_KEY"
   # python3 manage.py runserver_plus --cert-file $TLS_CERTIFICATE --key-file $TLS_KEY --noreload 0.0.0.0:${SERVER_PORT}
-  gunicorn --workers=1 --threads=20  --timeout 60 --bind 0.0.0.0:${SERVER_PORT} --certfile $TLS_CERTIFICATE --keyfile $TLS_KEY --log-level=debug crapi_site.wsgi
 else
   echo "TLS is DISABLED"
   # python3 manage.py runserver 0.0.0.0:${SERVER_PORT} --noreload
-  gunicorn --workers=1 --threads=20  --timeout 60 --bind 0.0.0.0:${SERVER_PORT} --log-level=debug crapi_site.wsgi
 fi
+exec gunicorn -c gunicorn.conf.py
@@ -0,0 +1,330 @@
+#
+# Licensed under the Apache License, Version 2.0 (the “License”);
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an “AS IS” BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Admission control of the requests of a worker
+A request first takes one of the ADMISSION_MAX_CONCURRENCY slots of the
+worker, or is shed at once: waiting would hold one of the threads kept
+for the health checks. It then takes a slot of its route, waiting for
+one in a bounded queue if the route is at its limit, and likewise one of
+the WORKER_SYNC_CONCURRENCY slots of the sync views when there are fewer
+of them than of the worker, as under ASGI.
+"""
+import asyncio
+import math
+import threading
+from collections import deque
+from functools import partial
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import JsonResponse
+from django.urls import Resolver404, get_resolver
+from utils import messages
+from utils.metrics import REQUESTS_SHED, REQUESTS_WAITING, UNMATCHED_ROUTE
+
+SYNC_VIEWS = "sync_views"
+
+
+class Shed(Exception):
+    """
+    The request was not admitted, reason is the label of the metric
+    """
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class _ThreadWaiter:
+    def __init__(self):
+        self.admitted = False
+        self._event = threading.Event()
+
+    def wake(self):
+        self._event.set()
+
+    def wait(self, timeout):
+        self._event.wait(timeout)
+
+
+class _AsyncWaiter:
+    def __init__(self):
+        self.admitted = False
+        self._loop = asyncio.get_running_loop()
+        self._future = self._loop.create_future()
+
+    def wake(self):
+        self._loop.call_soon_threadsafe(self._set)
+
+    def _set(self):
+        if not self._future.done():
+            self._future.set_result(None)
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(asyncio.shield(self._future), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+class Gate:
+    """
+    At most limit requests at a time, and at most max_waiting waiting for
+    their turn in a FIFO queue. A released slot is handed over to the
+    first waiter directly.
+    """
+
+    def __init__(self, name, limit, max_waiting):
+        self.name = name
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.in_flight = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def _try_enter(self, waiter):
+        """
+        :return: True if admitted, False if the waiter was queued
+        """
+        with self._lock:
+            if self.in_flight < self.limit:
+                self.in_flight += 1
+                return True
+            if waiter is None:
+                raise Shed("overloaded")
+            if len(self._waiters) >= self.max_waiting:
+                raise Shed("queue_full")
+            self._waiters.append(waiter)
+        REQUESTS_WAITING.labels(self.name).inc()
+        return False
+
+    def _leave_queue(self, waiter):
+        """
+        :return: True if the waiter was handed a slot in the meantime
+        """
+        REQUESTS_WAITING.labels(self.name).dec()
+        with self._lock:
+            if waiter.admitted:
+                return True
+            self._waiters.remove(waiter)
+            return False
+
+    def try_enter(self):
+        """
+        takes a slot without waiting
+        :raises Shed: if there is none
+        """
+        self._try_enter(None)
+
+    def enter(self, timeout):
+        """
+        takes a slot, waiting at most timeout seconds for one
+        :raises Shed: if the queue is full or the wait timed out
+        """
+        waiter = _ThreadWaiter()
+        if not self._try_enter(waiter):
+            waiter.wait(timeout)
+            if not self._leave_queue(waiter):
+                raise Shed("timeout")
+
+    async def aenter(self, timeout):
+        """
+        takes a slot, waiting at most timeout seconds for one on the event loop
+        :raises Shed: if the queue is full or the wait timed out
+        """
+        waiter = _AsyncWaiter()
+        if not self._try_enter(waiter):
+            try:
+                await waiter.wait(timeout)
+            except asyncio.CancelledError:
+                # The client went away, the slot may have been handed over
+                if self._leave_queue(waiter):
+                    self.release()
+                raise
+            if not self._leave_queue(waiter):
+                raise Shed("timeout")
+
+    def release(self):
+        with self._lock:
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.admitted = True
+                waiter.wake()
+                return
+            self.in_flight -= 1
+
+
+class AdmissionController:
+    """
+    Gates of a worker: one for the whole worker, one per route, the one of
+    the sync views if they are fewer and one per lane of ADMISSION_LANES
+    """
+
+    def __init__(self):
+        self.worker = Gate("worker", settings.ADMISSION_MAX_CONCURRENCY, 0)
+        self.sync_views = None
+        if settings.WORKER_SYNC_CONCURRENCY < settings.ADMISSION_MAX_CONCURRENCY:
+            self.sync_views = Gate(
+                SYNC_VIEWS,
+                settings.WORKER_SYNC_CONCURRENCY,
+                settings.ADMISSION_MAX_WAITING,
+            )
+        self.lanes = [
+            (paths, Gate(name, limit, settings.ADMISSION_MAX_WAITING))
+            for name, (paths, limit) in settings.ADMISSION_LANES.items()
+        ]
+        self.route_limit = max(
+            1,
+            math.ceil(
+                settings.ADMISSION_MAX_CONCURRENCY * settings.ADMISSION_ROUTE_SHARE
+            ),
+        )
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def route_gates(self, request):
+        """
+        :return: tuple of the Gate of the route the request matches and of
+            the gate of the sync views if it is one, None if it matches none
+        """
+        try:
+            match = get_resolver(getattr(request, "urlconf", None)).resolve(
+                request.path_info
+            )
+        except Resolver404:
+            return None
+        gates = self._routes.get(match.route)
+        if gates is None:
+            view_class = getattr(match.func, "view_class", match.func)
+            limit = settings.ADMISSION_ROUTE_LIMITS.get(
+                view_class.__name__, self.route_limit
+            )
+            gates = (Gate(match.route, limit, settings.ADMISSION_MAX_WAITING),)
+            is_async = getattr(
+                view_class, "view_is_async", False
+            ) or iscoroutinefunction(match.func)
+            if self.sync_views is not None and not is_async:
+                gates += (self.sync_views,)
+            with self._lock:
+                gates = self._routes.setdefault(match.route, gates)
+        return gates
+
+    def gates(self, request):
+        """
+        :return: (gate taken without waiting, gates waited for in order,
+            route name)
+        """
+        for paths, gate in self.lanes:
+            if request.path.startswith(paths):
+                return None, (gate,), gate.name
+        route_gates = self.route_gates(request)
+        if route_gates is None:
+            return self.worker, (), UNMATCHED_ROUTE
+        return self.worker, route_gates, route_gates[0].name
+
+
+def release(gates):
+    """
+    releases the slots taken in gates, the last one first
+    """
+    for gate in reversed(gates):
+        gate.release()
+
+
+def release_after(response, gates):
+    """
+    releases the slots taken in gates once the response is sent: when its
+    streaming body is closed, else at once
+    """
+    if response is not None and response.streaming:
+        # Closed by the handler once the body is sent or the client is gone
+        response._resource_closers.append(partial(release, gates))
+    else:
+        release(gates)
+
+
+def overloaded(route, reason):
+    REQUESTS_SHED.labels(route, reason).inc()
+    response = JsonResponse({"message": messages.SERVICE_OVERLOADED}, status=503)
+    response.headers["Retry-After"] = str(settings.ADMISSION_RETRY_AFTER)
+    return response
+
+
+class AdmissionMiddleware:
+    """
+    Sheds the requests a worker has no room for with a 503 and a
+    Retry-After header, keeping a lane for the health checks
+    Disabled when ADMISSION_CONTROL is false.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.ADMISSION_CONTROL:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.controller = AdmissionController()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        outer, inner, route = self.controller.gates(request)
+        try:
+            if outer is not None:
+                outer.try_enter()
+        except Shed as e:
+            return overloaded(route, e.reason)
+        entered = [outer] if outer is not None else []
+        try:
+            for gate in inner:
+                gate.enter(settings.ADMISSION_WAIT_TIMEOUT)
+                entered.append(gate)
+        except Shed as e:
+            release(entered)
+            return overloaded(route, e.reason)
+        response = None
+        try:
+            response = self.get_response(request)
+            return response
+        finally:
+            release_after(response, entered)
+
+    async def __acall__(self, request):
+        outer, inner, route = self.controller.gates(request)
+        try:
+            if outer is not None:
+                outer.try_enter()
+        except Shed as e:
+            return overloaded(route, e.reason)
+        entered = [outer] if outer is not None else []
+        try:
+            for gate in inner:
+                await gate.aenter(settings.ADMISSION_WAIT_TIMEOUT)
+                entered.append(gate)
+        except Shed as e:
+            release(entered)
+            return overloaded(route, e.reason)
+        except asyncio.CancelledError:
+            release(entered)
+            raise
+        response = None
+        try:
+            response = await self.get_response(request)
+            return response
+        finally:
+            release_after(response, entered)
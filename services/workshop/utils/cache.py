@@ -0,0 +1,279 @@
+#
+# Licensed under the Apache License, Version 2.0 (the “License”);
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an “AS IS” BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Memoizes read queries in the two tiers of CACHES
+An entry is read from the "default" cache of the worker, then from the
+"shared" cache of all the workers, and computed on a miss of both. Keys
+contain the version of the code and the generation of their namespace,
+which invalidate() replaces, and workers drop their own entries on the
+writes of the others. Entries expire after a jittered ttl but are
+kept CACHE_STALE_TTL longer: a single caller recomputes an expired entry
+under a lock of the shared cache while the others get the stale value,
+or wait for the first value of a missing entry. The lock is an flock of
+a file of the shared directory for the file based cache.
+"""
+import fcntl
+import hashlib
+import math
+import os
+import random
+import time
+import uuid
+from functools import partial, update_wrapper
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from utils.invalidation import bus
+from utils.metrics import CACHE_LOOKUPS
+
+LOCAL = "default"
+SHARED = "shared"
+WAIT_INTERVAL = 0.05
+
+
+def acquire_lock(key):
+    """
+    takes the lock of computing an entry of the shared cache
+    add() of the file based cache is a has_key then a set, so there the
+    lock is an flock of a file next to the entries, released by the
+    system if its holder dies.
+    :return: function releasing the lock, None if another caller holds it
+    """
+    cache = caches[SHARED]
+    if isinstance(cache, FileBasedCache):
+        path = cache._key_to_file(key)
+        return _acquire_file_lock(path[: -len(cache.cache_suffix)] + ".lock")
+    lock_key = f"{key}:lock"
+    if not cache.add(lock_key, 1, timeout=math.ceil(settings.CACHE_LOCK_TIMEOUT)):
+        return None
+    return partial(cache.delete, lock_key)
+
+
+def _acquire_file_lock(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd = os.open(path, os.O_CREAT | os.O_WRONLY, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        # The holder removes the file before unlocking it, a lock taken on a
+        # removed file was released in between
+        opened, current = os.fstat(fd), os.stat(path)
+        if (opened.st_dev, opened.st_ino) == (current.st_dev, current.st_ino):
+            return partial(_release_file_lock, fd, path)
+    except OSError:
+        pass
+    os.close(fd)
+    return None
+
+
+def _release_file_lock(fd, path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    os.close(fd)
+
+
+class Memoized:
+    """
+    Function memoized in the cache tiers, see memoize
+    """
+
+    def __init__(self, func, namespace, ttl, version, stale_ttl):
+        self.func = func
+        self.namespace = namespace
+        self.ttl = ttl
+        self.version = version
+        self.stale_ttl = stale_ttl
+        self.generation_key = f"{namespace}:generation"
+        update_wrapper(self, func)
+
+    def generation(self):
+        generation = caches[LOCAL].get(self.generation_key)
+        if generation is None:
+            generation = caches[SHARED].get(self.generation_key)
+            if generation is None:
+                generation = self._create_generation()
+            caches[LOCAL].set(
+                self.generation_key, generation, timeout=settings.CACHE_LOCAL_TTL
+            )
+        return generation
+
+    def _create_generation(self):
+        """
+        creates the first generation of the namespace under its lock, so
+        that the workers all compute their entries under the same one
+        :return: the generation
+        """
+        deadline = time.monotonic() + settings.CACHE_LOCK_TIMEOUT
+        release = acquire_lock(self.generation_key)
+        while release is None and time.monotonic() < deadline:
+            time.sleep(WAIT_INTERVAL)
+            generation = caches[SHARED].get(self.generation_key)
+            if generation is not None:
+                return generation
+            release = acquire_lock(self.generation_key)
+        try:
+            generation = caches[SHARED].get(self.generation_key)
+            if generation is None:
+                generation = uuid.uuid4().hex
+                caches[SHARED].set(self.generation_key, generation, timeout=None)
+        finally:
+            if release is not None:
+                release()
+        return generation
+
+    def key(self, *args, **kwargs):
+        """
+        :return: cache key of the call
+        """
+        call = repr((args, sorted(kwargs.items()))).encode()
+        return (
+            f"{self.namespace}:{self.version}:{self.generation()}:"
+            f"{hashlib.sha1(call).hexdigest()}"
+        )
+
+    def __call__(self, *args, **kwargs):
+        key = self.key(*args, **kwargs)
+        now = time.time()
+        entry = caches[LOCAL].get(key)
+        if entry is not None and now < entry[1]:
+            CACHE_LOOKUPS.labels(self.namespace, "local").inc()
+            return entry[0]
+        entry = caches[SHARED].get(key)
+        if entry is not None and now < entry[1]:
+            CACHE_LOOKUPS.labels(self.namespace, "shared").inc()
+            self._set_local(key, entry, now)
+            return entry[0]
+        release = acquire_lock(key)
+        if release is None:
+            if entry is not None and self.stale_ttl:
+                CACHE_LOOKUPS.labels(self.namespace, "stale").inc()
+                return entry[0]
+            entry = self._wait(key)
+            if entry is not None:
+                CACHE_LOOKUPS.labels(self.namespace, "waited").inc()
+                return entry[0]
+            # The lock holder took too long, compute the entry as well
+        else:
+            # The previous holder of the lock may have stored the entry since
+            entry = caches[SHARED].get(key)
+            if entry is not None and time.time() < entry[1]:
+                release()
+                CACHE_LOOKUPS.labels(self.namespace, "shared").inc()
+                self._set_local(key, entry, now)
+                return entry[0]
+        CACHE_LOOKUPS.labels(self.namespace, "miss").inc()
+        try:
+            value = self.func(*args, **kwargs)
+            ttl = self.ttl * (
+                1
+                + random.uniform(-settings.CACHE_TTL_JITTER, settings.CACHE_TTL_JITTER)
+            )
+            entry = (value, time.time() + ttl)
+            caches[SHARED].set(key, entry, timeout=ttl + self.stale_ttl)
+            self._set_local(key, entry, now)
+        finally:
+            if release is not None:
+                release()
+        return value
+
+    async def acall(self, *args, **kwargs):
+        """
+        calls the memoized function from async code
+        """
+        return await sync_to_async(self)(*args, **kwargs)
+
+    def _set_local(self, key, entry, now):
+        timeout = min(settings.CACHE_LOCAL_TTL, entry[1] - now)
+        if timeout > 0:
+            caches[LOCAL].set(key, entry, timeout=timeout)
+
+    def _wait(self, key):
+        """
+        waits for the entry another caller is computing
+        :return: the fresh entry, None if it is still missing after
+            CACHE_LOCK_TIMEOUT
+        """
+        deadline = time.monotonic() + settings.CACHE_LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(WAIT_INTERVAL)
+            entry = caches[SHARED].get(key)
+            if entry is not None and time.time() < entry[1]:
+                return entry
+        return None
+
+    def invalidate(self):
+        """
+        drops all the entries of the namespace
+        Other workers see it after at most CACHE_LOCAL_TTL seconds.
+        """
+        caches[SHARED].set(self.generation_key, uuid.uuid4().hex, timeout=None)
+        caches[LOCAL].delete(self.generation_key)
+
+    def evict_local(self, message=None):
+        """
+        drops the entries of the worker, after a write of another worker
+        """
+        caches[LOCAL].delete(self.generation_key)
+
+    def invalidate_on_write(self, sender, **kwargs):
+        # Again on commit, a query before it may have cached the old rows
+        self.invalidate()
+        transaction.on_commit(self.invalidate)
+
+
+def memoize(namespace, ttl=None, version=1, models=(), stale_ttl=None):
+    """
+    decorator memoizing a read query in the cache tiers
+    Arguments and results must be picklable, exceptions are not cached.
+    :param namespace: prefix of the keys of the function
+    :param ttl: seconds an entry is fresh, CACHE_TTL by default
+    :param version: to bump when the results change shape
+    :param stale_ttl: seconds an expired entry is still served,
+        CACHE_STALE_TTL by default, 0 to never serve it
+    :param models: models whose writes invalidate the namespace,
+        in the other workers through the invalidation bus
+    :return: decorator returning a Memoized
+    """
+
+    def decorator(func):
+        memoized = Memoized(
+            func,
+            namespace,
+            settings.CACHE_TTL if ttl is None else ttl,
+            version,
+            settings.CACHE_STALE_TTL if stale_ttl is None else stale_ttl,
+        )
+        for model in models:
+            post_save.connect(
+                memoized.invalidate_on_write,
+                sender=model,
+                weak=False,
+                dispatch_uid=namespace,
+            )
+            post_delete.connect(
+                memoized.invalidate_on_write,
+                sender=model,
+                weak=False,
+                dispatch_uid=namespace,
+            )
+            bus.publish_writes(model)
+            bus.subscribe(model, memoized.evict_local, memoized.evict_local)
+        return memoized
+
+    return decorator
@@ -0,0 +1,132 @@
+#
+# Licensed under the Apache License, Version 2.0 (the “License”);
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an “AS IS” BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Coalescing of identical concurrent GET requests
+The first of identical requests computes and renders the response, the
+ones arriving while it is in flight wait for it and get a copy of its
+status, headers and bytes. Requests are identical when they are for the
+same view, path and query, ask for the same media type and ETag, and
+have the same auth scope.
+"""
+import threading
+from functools import wraps
+from django.conf import settings
+from django.http import HttpResponse
+from utils.metrics import REQUESTS_COALESCED
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+
+
+class Coalescer:
+    """
+    In-flight computations of the worker by key
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def run(self, key, compute, timeout):
+        """
+        :param compute: returns (status, content, headers) of a response
+        :return: (status, content, headers), True if computed by this call
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if leader:
+            try:
+                flight.response = compute()
+            finally:
+                with self._lock:
+                    del self._flights[key]
+                flight.done.set()
+            return flight.response, True
+        # Failures of the leader are not shared, nor waited for too long
+        if flight.done.wait(timeout) and flight.response is not None:
+            return flight.response, False
+        return compute(), True
+
+
+coalescer = Coalescer()
+
+
+def shared_scope(request, user):
+    """
+    auth scope of responses which are the same for all the users
+    """
+    return None
+
+
+def user_scope(request, user):
+    """
+    auth scope of responses of a single user
+    """
+    return user.id
+
+
+def coalesced(scope=user_scope):
+    """
+    decorator coalescing the identical requests of a GET view method,
+    under jwt_auth_required so that every request is authorized
+    :param scope: function of the request and user returning the part of
+        the key which separates the users who get different responses
+    :return: a decorator of sync view methods
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def new_func(self, request, *args, user=None, **kwargs):
+            if not settings.COALESCING:
+                return func(self, request, *args, user=user, **kwargs)
+            view = type(self).__name__
+            key = (
+                view,
+                request.get_full_path(),
+                request.accepted_media_type,
+                request.META.get("HTTP_IF_NONE_MATCH"),
+                scope(request, user),
+            )
+            leader_response = None
+
+            def compute():
+                nonlocal leader_response
+                response = func(self, request, *args, user=user, **kwargs)
+                response = self.finalize_response(request, response, *args, **kwargs)
+                if hasattr(response, "render"):
+                    response.render()
+                leader_response = response
+                return response.status_code, response.content, list(response.items())
+
+            (status_code, content, headers), computed = coalescer.run(
+                key, compute, settings.COALESCING_WAIT_TIMEOUT
+            )
+            REQUESTS_COALESCED.labels(view, "leader" if computed else "follower").inc()
+            if computed:
+                return leader_response
+            response = HttpResponse(content, status=status_code)
+            for header, value in headers:
+                response[header] = value
+            return response
+
+        return new_func
+
+    return decorator
@@ -0,0 +1,200 @@
+#
+# Licensed under the Apache License, Version 2.0 (the “License”);
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an “AS IS” BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Compresses the responses of the workshop APIs
+"""
+import zlib
+from functools import wraps
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/xml",
+)
+
+
+def gzip_compressor():
+    compressor = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+
+def brotli_compressor():
+    compressor = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+    return compressor.process, compressor.finish
+
+
+def zstd_compressor():
+    compressor = zstandard.ZstdCompressor(
+        level=settings.COMPRESSION_ZSTD_LEVEL
+    ).compressobj()
+    return compressor.compress, compressor.flush
+
+
+# Preferred first when the client accepts several encodings equally
+COMPRESSORS = {
+    "br": brotli_compressor if brotli else None,
+    "zstd": zstd_compressor if zstandard else None,
+    "gzip": gzip_compressor,
+}
+
+
+def parse_accept_encoding(header):
+    """
+    :param header: value of the Accept-Encoding header
+    :return: dict of lowercase coding to its q-value
+    """
+    codings = {}
+    for item in header.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        codings[coding] = quality
+    return codings
+
+
+def negotiate_encoding(header, encodings):
+    """
+    picks the encoding of a response
+    :param header: value of the Accept-Encoding header
+    :param encodings: encodings the server supports, preferred first
+    :return: chosen encoding or None to send the response as it is
+    """
+    codings = parse_accept_encoding(header)
+    wildcard = codings.get("*", 0.0)
+    best, best_quality = None, 0.0
+    for encoding in encodings:
+        quality = codings.get(encoding, wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def no_compression(view_func):
+    """
+    Marks a view whose responses must be sent uncompressed
+    """
+
+    @wraps(view_func)
+    def wrapped_view(*args, **kwargs):
+        return view_func(*args, **kwargs)
+
+    wrapped_view.no_compression = True
+    return wrapped_view
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses with the best encoding the client accepts among
+    COMPRESSION_ENCODINGS. Responses below COMPRESSION_MIN_SIZE bytes, of
+    types which are not text, or of views marked with no_compression are
+    sent as they are. Streaming responses are compressed chunk by chunk.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.encodings = [
+            encoding
+            for encoding in settings.COMPRESSION_ENCODINGS
+            if COMPRESSORS.get(encoding)
+        ]
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.compress_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.compress_response(request, await self.get_response(request))
+
+    def compress_response(self, request, response):
+        if getattr(request, "_no_compression", False) or not self.encodings:
+            return response
+        if response.has_header("Content-Encoding"):
+            return response
+        content_type = response.get("Content-Type", "").lower()
+        if not content_type.startswith(COMPRESSIBLE_TYPES):
+            return response
+        if not response.streaming and len(response.content) < (
+            settings.COMPRESSION_MIN_SIZE
+        ):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding = negotiate_encoding(
+            request.META.get("HTTP_ACCEPT_ENCODING", ""), self.encodings
+        )
+        if encoding is None:
+            return response
+
+        compress, flush = COMPRESSORS[encoding]()
+        if response.streaming:
+            response.streaming_content = self.compress_stream(
+                response.streaming_content, compress, flush
+            )
+            del response.headers["Content-Length"]
+        else:
+            compressed = compress(response.content) + flush()
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers["Content-Length"] = str(len(compressed))
+
+        # The compressed body is not byte for byte the one the ETag was made for
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = encoding
+        return response
+
+    @staticmethod
+    def compress_stream(chunks, compress, flush):
+        for chunk in chunks:
+            data = compress(chunk)
+            if data:
+                yield data
+        yield flush()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if getattr(view_func, "no_compression", False):
+            request._no_compression = True
+        return None
@@ -0,0 +1,196 @@
+#
+# Licensed under the Apache License, Version 2.0 (the “License”);
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an “AS IS” BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Liveness and readiness probes served from sampled dependency health
+A thread of every worker checks Postgres and MongoDB every
+HEALTH_SAMPLE_INTERVAL seconds, and the readiness probe answers from the
+last sample instead of querying them on every probe. A sample older than
+HEALTH_MAX_AGE is stale, as when the sampler is stuck on a dependency
+which does not answer, and the worker is then not ready. The liveness
+probe only tells that the worker answers requests.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+import pymongo
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.http import JsonResponse
+from utils.metrics import DEPENDENCY_UP
+from utils.warmup import warm_up
+
+logger = logging.getLogger()
+
+MONGO_ALIAS = "mongodb"
+
+
+def check_database():
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        cursor.execute("SELECT 1")
+
+
+class MongoCheck:
+    """
+    pings MongoDB with a client kept between the samples
+    """
+
+    def __init__(self):
+        self._client = None
+
+    def __call__(self):
+        if self._client is None:
+            timeout_ms = int(settings.HEALTH_CHECK_TIMEOUT * 1000)
+            self._client = pymongo.MongoClient(
+                **settings.DATABASES[MONGO_ALIAS]["CLIENT"],
+                connectTimeoutMS=timeout_ms,
+                serverSelectionTimeoutMS=timeout_ms,
+            )
+        self._client.admin.command("ping")
+
+
+def default_checks():
+    checks = {"database": check_database}
+    # The tests run without MongoDB
+    if MONGO_ALIAS in settings.DATABASES:
+        checks["mongodb"] = MongoCheck()
+    return checks
+
+
+class HealthSampler:
+    """
+    Last sampled health of the dependencies of the worker
+    """
+
+    def __init__(self, checks=None):
+        self.checks = checks
+        self.results = {}
+        self.sampled_at = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def sample(self):
+        """
+        runs all the checks and keeps their results
+        """
+        with self._lock:
+            if self.checks is None:
+                self.checks = default_checks()
+            results = {}
+            for name, check in self.checks.items():
+                started = time.perf_counter()
+                try:
+                    check()
+                    error = None
+                except Exception as e:
+                    logger.warning(f"Health check {name} failed: {e}")
+                    error = str(e)
+                results[name] = {
+                    "healthy": error is None,
+                    "ms": round((time.perf_counter() - started) * 1000, 1),
+                    "error": error,
+                }
+                DEPENDENCY_UP.labels(name).set(error is None)
+            self.results = results
+            self.sampled_at = time.time()
+
+    def start(self):
+        """
+        starts the sampler thread of the worker
+        """
+        if self.running:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="health-sampler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            # The connection of the thread is dropped once broken or too old
+            connections[DEFAULT_DB_ALIAS].close_if_unusable_or_obsolete()
+            self.sample()
+            self._stopping.wait(settings.HEALTH_SAMPLE_INTERVAL)
+        connections.close_all()
+
+    def refresh(self):
+        """
+        samples from the caller when no thread samples, as under runserver,
+        at most once per HEALTH_SAMPLE_INTERVAL
+        """
+        if self.running:
+            return
+        if (
+            self.sampled_at is None
+            or time.time() - self.sampled_at >= settings.HEALTH_SAMPLE_INTERVAL
+        ):
+            self.sample()
+
+    def status(self):
+        """
+        :return: dict of the last results, their age and whether they
+            are stale, healthy if every check passed and none is stale
+        """
+        if self.sampled_at is None:
+            return {"healthy": False, "stale": True, "checks": {}}
+        age = time.time() - self.sampled_at
+        stale = age > settings.HEALTH_MAX_AGE
+        return {
+            "healthy": not stale
+            and all(result["healthy"] for result in self.results.values()),
+            "stale": stale,
+            "sampled_at": datetime.fromtimestamp(
+                self.sampled_at, timezone.utc
+            ).isoformat(),
+            "age_seconds": round(age, 1),
+            "checks": self.results,
+        }
+
+
+sampler = HealthSampler()
+
+
+def live_view(request):
+    """
+    liveness of the worker, without checking its dependencies
+    """
+    return JsonResponse({"live": True})
+
+
+def ready_view(request):
+    """
+    readiness of the worker, 503 until it is warmed up and while the last
+    sample of its dependencies is failed or stale
+    """
+    if settings.WARMUP:
+        warm_up.retry()
+    sampler.refresh()
+    health = sampler.status()
+    ready = (warm_up.ready or not settings.WARMUP) and health["healthy"]
+    return JsonResponse(
+        {"ready": ready, "warm_up": warm_up.status(), "health": health},
+        status=200 if ready else 503,
+    )
@@ -0,0 +1,229 @@
+#
+# Licensed under the Apache License, Version 2.0 (the “License”);
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an “AS IS” BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Contains the shared async HTTP client used for outbound calls
+"""
+import asyncio
+import concurrent.futures
+import logging
+import os
+import random
+import threading
+import weakref
+import httpx
+from django.conf import settings
+from utils.metrics import observe_outbound
+from utils.profiling import profile_phase
+
+logger = logging.getLogger()
+
+_clients = weakref.WeakKeyDictionary()
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_async_client():
+    """
+    returns the pooled client of the running event loop
+    httpx clients are bound to the loop they are used on,
+    so every loop gets its own connection pool
+    :return: httpx.AsyncClient
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            verify=False,
+            follow_redirects=True,
+            limits=httpx.Limits(
+                max_connections=settings.OUTBOUND_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.OUTBOUND_MAX_KEEPALIVE_CONNECTIONS,
+            ),
+        )
+        _clients[loop] = client
+    return client
+
+
+def _get_background_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_loop.run_forever, name="outbound-http", daemon=True
+            ).start()
+        return _loop
+
+
+def _reset_after_fork():
+    global _loop, _loop_lock
+    _loop = None
+    _loop_lock = threading.Lock()
+    _clients.clear()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def run_sync(coroutine, timeout=None):
+    """
+    runs a coroutine on the shared outbound event loop from sync code
+    all the threads of a worker share the loop and its connection pool
+    :param coroutine: coroutine to run
+    :param timeout: seconds to wait for the result, None waits forever
+    :return: result of the coroutine
+    :raises concurrent.futures.TimeoutError: if the timeout expires
+    """
+    future = asyncio.run_coroutine_threadsafe(coroutine, _get_background_loop())
+    try:
+        # The coroutine runs on another thread, out of the request profile
+        with profile_phase("outbound"):
+            return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise
+
+
+async def run_async(coroutine, phase="outbound"):
+    """
+    awaits a coroutine run on the shared outbound event loop
+    the loops async_to_sync creates per request under WSGI are short lived,
+    running the calls on the shared loop keeps one connection pool per worker
+    :param coroutine: coroutine to run
+    :param phase: phase of the request profile the wait counts for
+    :return: result of the coroutine
+    """
+    future = asyncio.run_coroutine_threadsafe(coroutine, _get_background_loop())
+    # Cancelling the wrapper cancels the coroutine too
+    with profile_phase(phase):
+        return await asyncio.wrap_future(future)
+
+
+async def post(url, **kwargs):
+    """
+    POSTs with the pooled client of the running event loop
+    :param url: url to call
+    :param kwargs: passed on to httpx.AsyncClient.post
+    :return: httpx.Response
+    """
+    return await get_async_client().post(url, **kwargs)
+
+
+def backoff_delays(base, cap):
+    """
+    generates capped exponential backoff delays with full jitter
+    :param base: delay in seconds before the first retry
+    :param cap: maximum delay in seconds
+    """
+    attempt = 0
+    while True:
+        yield random.uniform(0, min(cap, base * 2**attempt))
+        attempt += 1
+
+
+async def get_with_retries(
+    url,
+    params=None,
+    headers=None,
+    attempts=1,
+    attempt_timeout=None,
+    deadline=None,
+    backoff_base=None,
+    backoff_max=None,
+    on_attempt=None,
+    client=None,
+):
+    """
+    GETs the url until it answers with 200 or the attempts run out
+    :param url: url to call
+    :param params: query params of the request
+    :param headers: headers of the request
+    :param attempts: maximum number of attempts
+    :param attempt_timeout: timeout in seconds of a single attempt
+    :param deadline: seconds after which no new attempt is started
+    :param backoff_base: delay in seconds before the first retry
+    :param backoff_max: maximum delay in seconds between two attempts
+    :param on_attempt: called with (attempt, response, error) after every attempt
+    :param client: httpx.AsyncClient to use instead of the shared one
+    :return: httpx.Response of the last attempt
+    :raises httpx.UnsupportedProtocol, httpx.InvalidURL: if the url is invalid
+    :raises httpx.TransportError: if the last attempt got no response
+    """
+    attempt_timeout = attempt_timeout or settings.MECHANIC_API_ATTEMPT_TIMEOUT
+    deadline = deadline or settings.MECHANIC_API_DEADLINE
+    delays = backoff_delays(
+        backoff_base or settings.MECHANIC_API_BACKOFF_BASE,
+        backoff_max or settings.MECHANIC_API_BACKOFF_MAX,
+    )
+    client = client or get_async_client()
+    loop = asyncio.get_running_loop()
+    give_up_at = loop.time() + deadline
+    attempt = 0
+    while True:
+        attempt += 1
+        response, error = None, None
+        logger.info(f"Attempt: {attempt}, url: {url}")
+        try:
+            with observe_outbound("mechanic"):
+                response = await client.get(
+                    url,
+                    params=params,
+                    headers=headers,
+                    timeout=min(attempt_timeout, max(give_up_at - loop.time(), 0.001)),
+                )
+        except (httpx.UnsupportedProtocol, httpx.InvalidURL):
+            raise
+        except httpx.TransportError as e:
+            error = e
+        if on_attempt:
+            on_attempt(attempt, response, error)
+        if response is not None and response.status_code == 200:
+            return response
+        delay = next(delays)
+        if attempt >= attempts or loop.time() + delay >= give_up_at:
+            break
+        await asyncio.sleep(delay)
+    if error:
+        raise error
+    return response
+
+
+async def get_first_success(urls, **kwargs):
+    """
+    GETs all the urls concurrently and returns as soon as one answers 200
+    :param urls: urls to call
+    :param kwargs: passed on to get_with_retries for every url
+    :return: httpx.Response of the first success,
+        otherwise the last response received
+    :raises the last error if no url returned a response
+    """
+    tasks = [asyncio.ensure_future(get_with_retries(url, **kwargs)) for url in urls]
+    last_response, last_error = None, None
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                response = await next_done
+            except (httpx.TransportError, httpx.InvalidURL) as e:
+                last_error = e
+                continue
+            if response.status_code == 200:
+                return response
+            last_response = response
+    finally:
+        for task in tasks:
+            task.cancel()
+    if last_response is not None:
+        return last_response
+    raise last_error
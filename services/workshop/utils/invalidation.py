@@ -0,0 +1,179 @@
+#
+# Licensed under the Apache License, Version 2.0 (the “License”);
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an “AS IS” BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Invalidation bus of the in-process caches over Postgres LISTEN/NOTIFY
+Writes of the published models are notified on INVALIDATION_CHANNEL once
+committed, and the listener thread of every worker passes them to the
+caches subscribed to the model, which evict their entries. Postgres drops
+the notifications of a listener which is disconnected, so every cache is
+flushed once the listener is connected again: each worker either gets a
+write or forgets everything it cached before it.
+"""
+import json
+import logging
+import select
+import threading
+from collections import defaultdict
+from functools import partial
+import psycopg2
+from psycopg2 import sql
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+from django.db.models.signals import post_delete, post_save
+from utils.metrics import INVALIDATION_FLUSHES, INVALIDATION_MESSAGES
+
+logger = logging.getLogger()
+
+MAX_RECONNECT_DELAY = 30
+
+
+class InvalidationBus:
+    """
+    Publishes the writes of models and passes the ones of all the workers
+    to the subscribed caches
+    """
+
+    def __init__(self, channel, ping_interval):
+        self.channel = channel
+        self.ping_interval = ping_interval
+        self.listening = threading.Event()
+        self._subscribers = defaultdict(list)
+        self._flushes = []
+        self._stopping = threading.Event()
+        self._thread = None
+        self._connection = None
+
+    def subscribe(self, model, evict, flush):
+        """
+        :param model: model whose writes evict entries of the cache
+        :param evict: called with the message of each write,
+            a dict of the model label, pk and published fields
+        :param flush: called to drop all the entries of the cache
+        """
+        self._subscribers[model._meta.label_lower].append(evict)
+        if flush not in self._flushes:
+            self._flushes.append(flush)
+
+    def publish_writes(self, model, fields=()):
+        """
+        notifies the saves and deletes of a model
+        :param fields: fields of the instance added to the messages
+        """
+        handler = partial(self._on_write, fields=fields)
+        uid = f"invalidation:{model._meta.label_lower}"
+        post_save.connect(handler, sender=model, weak=False, dispatch_uid=uid)
+        post_delete.connect(handler, sender=model, weak=False, dispatch_uid=uid)
+
+    def _on_write(self, sender, instance, using=DEFAULT_DB_ALIAS, fields=(), **kwargs):
+        message = {"model": sender._meta.label_lower, "pk": instance.pk}
+        message.update((field, getattr(instance, field)) for field in fields)
+        # Once committed, readers of the other workers must get the new rows
+        transaction.on_commit(partial(self.publish, message, using), using=using)
+
+    def publish(self, message, using=DEFAULT_DB_ALIAS):
+        if not settings.INVALIDATION_BUS:
+            return
+        payload = json.dumps(message, default=str)
+        try:
+            with connections[using].cursor() as cursor:
+                cursor.execute("SELECT pg_notify(%s, %s)", [self.channel, payload])
+        except DatabaseError as e:
+            # The listeners lost their connection as well and will flush
+            logger.warning(f"Could not publish the invalidation {payload}: {e}")
+
+    def dispatch(self, payload):
+        message = json.loads(payload)
+        INVALIDATION_MESSAGES.labels(message["model"]).inc()
+        for evict in self._subscribers.get(message["model"], ()):
+            try:
+                evict(message)
+            except Exception:
+                logger.exception(f"Could not evict the entries of {payload}")
+
+    def flush(self):
+        INVALIDATION_FLUSHES.inc()
+        for flush in self._flushes:
+            try:
+                flush()
+            except Exception:
+                logger.exception("Could not flush a cache")
+
+    def start(self):
+        """
+        starts the listener thread of the worker
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="invalidation-bus", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        connection = self._connection
+        if connection is not None:
+            connection.close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        connected_before = False
+        delay = 1
+        while not self._stopping.is_set():
+            try:
+                self._connection = self._connect()
+                if connected_before:
+                    logger.info("Invalidation bus reconnected, flushing the caches")
+                    self.flush()
+                connected_before = True
+                delay = 1
+                self.listening.set()
+                self._listen(self._connection)
+            except Exception as e:
+                if not self._stopping.is_set():
+                    logger.warning(f"Invalidation bus disconnected: {e}")
+            finally:
+                self.listening.clear()
+                if self._connection is not None:
+                    self._connection.close()
+                    self._connection = None
+            self._stopping.wait(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+    def _connect(self):
+        params = connections[DEFAULT_DB_ALIAS].get_connection_params()
+        connection = psycopg2.connect(**params)
+        connection.set_session(autocommit=True)
+        with connection.cursor() as cursor:
+            cursor.execute(sql.SQL("LISTEN {}").format(sql.Identifier(self.channel)))
+        return connection
+
+    def _listen(self, connection):
+        while not self._stopping.is_set():
+            readable, _, _ = select.select([connection], [], [], self.ping_interval)
+            if not readable:
+                # Finds out about a connection dropped without a word
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+            connection.poll()
+            while connection.notifies:
+                self.dispatch(connection.notifies.pop(0).payload)
+
+
+bus = InvalidationBus(
+    settings.INVALIDATION_CHANNEL, settings.INVALIDATION_PING_INTERVAL
+)
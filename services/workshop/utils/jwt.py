@@ -20,6 +20,9 @@ from rest_framework import status
 from rest_framework.response import Response
 from django.conf import settings
 from utils import messages
+from utils.http_client import post, run_async
+from utils.metrics import observe_outbound
+from crapi.user.lookups import user_by_email
 from crapi.user.models import User
 import urllib3
 import logging
@@ -50,9 +53,10 @@ def jwt_auth_required(func):
                 tokenJson = {"token": token}
                 identity_url = settings.IDENTITY_VERIFY
                 logger.debug(f"Identity url: {identity_url}, tokenJson: {tokenJson}")
-                token_verify_response = requests.post(
-                    identity_url, json=tokenJson, verify=False
-                )
+                with observe_outbound("identity", phase="auth"):
+                    token_verify_response = requests.post(
+                        identity_url, json=tokenJson, verify=False
+                    )
                 logger.debug(
                     f"Identity url: {identity_url}, token_verify_response: {token_verify_response}"
                 )
@@ -60,7 +64,7 @@ def jwt_auth_required(func):
                 if response_status_code == status.HTTP_200_OK:
                     decoded = jwt.decode(token, options={"verify_signature": False})
                     username = decoded["sub"]
-                    user = User.objects.get(email=username)
+                    user = user_by_email(username)
                     # Add user object to the view function if authorized
                     kwargs["user"] = user
                     return func(*args, **kwargs)
@@ -88,3 +92,66 @@ def jwt_auth_required(func):
             )
 
     return new_func
+
+
+def async_jwt_auth_required(func):
+    """
+    decorator for authorizing http requests to async views
+    waiting on the identity service does not hold a thread
+    :param func: async view function of the api
+    :return: a new async view function which
+        awaits the actual view function if authorized
+        returns error message if not authorized
+    """
+
+    @wraps(func)
+    async def new_func(*args, **kwargs):
+        try:
+            request = args[1]
+            if (
+                "HTTP_AUTHORIZATION" in request.META
+                and request.META.get("HTTP_AUTHORIZATION")[0:7] == "Bearer "
+            ):
+                token = request.META.get("HTTP_AUTHORIZATION")[7:]
+                tokenJson = {"token": token}
+                identity_url = settings.IDENTITY_VERIFY
+                logger.debug(f"Identity url: {identity_url}, tokenJson: {tokenJson}")
+                with observe_outbound("identity", phase="auth"):
+                    token_verify_response = await run_async(
+                        post(identity_url, json=tokenJson), phase="auth"
+                    )
+                logger.debug(
+                    f"Identity url: {identity_url}, token_verify_response: {token_verify_response}"
+                )
+                response_status_code = token_verify_response.status_code
+                if response_status_code == status.HTTP_200_OK:
+                    decoded = jwt.decode(token, options={"verify_signature": False})
+                    username = decoded["sub"]
+                    user = await user_by_email.acall(username)
+                    # Add user object to the view function if authorized
+                    kwargs["user"] = user
+                    return await func(*args, **kwargs)
+                logger.debug("JWT token verification failed")
+                return Response(
+                    {"message": messages.INVALID_TOKEN},
+                    status=status.HTTP_401_UNAUTHORIZED,
+                    content_type="application/json",
+                )
+            logger.debug("JWT token not found in request header")
+            return Response(
+                {"message": messages.JWT_REQUIRED},
+                status=status.HTTP_401_UNAUTHORIZED,
+                content_type="application/json",
+            )
+
+        except (jwt.exceptions.DecodeError, User.DoesNotExist) as e:
+            logger.debug(
+                f"JWT token verification failed with exception: {e}", exc_info=True
+            )
+            return Response(
+                {"message": messages.INVALID_TOKEN},
+                status=status.HTTP_401_UNAUTHORIZED,
+                content_type="application/json",
+            )
+
+    return new_func
@@ -12,7 +12,54 @@
 # limitations under the License.
 
 
+"""
+Logging of the workshop
+Request threads only put records on a queue, a writer thread per process
+formats them as JSON lines and writes them in batches.
+"""
+import fcntl
+import json
 import logging
+import os
+import queue
+import reprlib
+import sys
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+
+# Longest repr of a request payload in log_error
+MAX_PARAMS_LENGTH = 1024
+# Seconds between two reports of dropped and sampled out records
+LOSS_REPORT_INTERVAL = 10
+
+_params_repr = reprlib.Repr()
+_params_repr.maxstring = MAX_PARAMS_LENGTH
+_params_repr.maxother = MAX_PARAMS_LENGTH
+_params_repr.maxdict = 20
+_params_repr.maxlist = 20
+_params_repr.maxlevel = 4
+
+
+class TruncatedRepr:
+    """
+    Formats a value lazily with a bounded repr, so a large payload
+    costs nothing when the record is filtered out
+    """
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        if isinstance(self.value, str):
+            return truncate(self.value, MAX_PARAMS_LENGTH)
+        return truncate(_params_repr.repr(self.value), MAX_PARAMS_LENGTH)
+
+
+def truncate(text, limit):
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... ({len(text) - limit} more characters)"
 
 
 def log_error(url, params, status_code, message):
@@ -23,4 +70,263 @@ def log_error(url, params, status_code, message):
     :param message: The message of the error.
     :return:
     """
-    logging.getLogger().error(f"{url} - {params} - {status_code} -{message}")
+    logging.getLogger().error(
+        "%s - %s - %s -%s", url, TruncatedRepr(params), status_code, message
+    )
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    Formats records as one JSON object per line
+    """
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+            "thread": record.threadName,
+        }
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class QueueWriterHandler(logging.Handler):
+    """
+    Puts records on a bounded queue read by a writer thread
+    Messages are formatted and truncated in the calling thread, without
+    ever blocking it: records are dropped when the queue is full. Above
+    sample_threshold records per second, records below WARNING are sampled
+    with sample_rate. The writer thread writes batches of up to batch_size
+    records to the console and to a file rotated by size, and periodically
+    reports the dropped and sampled out records. The thread is started again
+    in processes forked by gunicorn, whose workers append to the file and
+    rotate it in turn under a lock.
+    """
+
+    def __init__(
+        self,
+        filename=None,
+        max_bytes=0,
+        backup_count=0,
+        console=True,
+        queue_size=10000,
+        batch_size=256,
+        max_message_length=4096,
+        sample_threshold=0,
+        sample_rate=1.0,
+        level=logging.NOTSET,
+    ):
+        super().__init__(level)
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.console = console
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.max_message_length = max_message_length
+        self.sample_threshold = sample_threshold
+        self.sample_rate = sample_rate
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        self._file = None
+        self._lock_file = None
+        self._window = 0
+        self._window_count = 0
+        self._sample_counter = 0.0
+        self._dropped = 0
+        self._sampled_out = 0
+        self._reported = 0.0
+        # The handler lock is held by logging.shutdown while closing
+        self._losses_lock = threading.Lock()
+        # A fork in the middle of a write would leave the stream locked
+        self._write_lock = threading.Lock()
+        os.register_at_fork(
+            before=lambda: self._write_lock.acquire(),
+            after_in_parent=lambda: self._write_lock.release(),
+            after_in_child=self._reset_after_fork,
+        )
+
+    def _reset_after_fork(self):
+        self._losses_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def _start(self):
+        self._pid = os.getpid()
+        self._queue = queue.Queue(self.queue_size)
+        self._dropped = self._sampled_out = 0
+        if self._file is not None:
+            # Opened by the parent process
+            self._file.close()
+        if self._lock_file is not None:
+            # A lock of the parent process would be shared with it
+            self._lock_file.close()
+            self._lock_file = None
+        if self.filename:
+            self._file = RotatingFileHandler(
+                self.filename,
+                maxBytes=self.max_bytes,
+                backupCount=self.backup_count,
+                delay=True,
+            )
+        self._thread = threading.Thread(
+            target=self._write_loop, name="log-writer", daemon=True
+        )
+        self._thread.start()
+
+    def _sampled(self, record):
+        if not self.sample_threshold or record.levelno >= logging.WARNING:
+            return False
+        window = int(time.monotonic())
+        if window != self._window:
+            self._window, self._window_count = window, 0
+        self._window_count += 1
+        if self._window_count <= self.sample_threshold:
+            return False
+        # Keeps one record out of 1 / sample_rate
+        self._sample_counter += self.sample_rate
+        if self._sample_counter >= 1:
+            self._sample_counter -= 1
+            return False
+        return True
+
+    def prepare(self, record):
+        message = truncate(record.getMessage(), self.max_message_length)
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args = message, None
+        record.exc_info = None
+        return record
+
+    def emit(self, record):
+        # Called under the lock of the handler
+        if self._pid != os.getpid():
+            self._start()
+        if self._sampled(record):
+            with self._losses_lock:
+                self._sampled_out += 1
+            return
+        try:
+            self._queue.put_nowait(self.prepare(record))
+        except queue.Full:
+            with self._losses_lock:
+                self._dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def _losses(self, final=False):
+        now = time.monotonic()
+        if not final and now - self._reported < LOSS_REPORT_INTERVAL:
+            return None
+        self._reported = now
+        with self._losses_lock:
+            losses = self._dropped, self._sampled_out
+            self._dropped = self._sampled_out = 0
+        if not any(losses):
+            return None
+        return logging.LogRecord(
+            __name__,
+            logging.WARNING,
+            __file__,
+            0,
+            "Dropped %d log records on a full queue, sampled out %d",
+            losses,
+            None,
+        )
+
+    def _write_loop(self):
+        log_queue = self._queue
+        while True:
+            record = log_queue.get()
+            batch = [record]
+            while record is not None and len(batch) < self.batch_size:
+                try:
+                    record = log_queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(record)
+            records = [record for record in batch if record is not None]
+            losses = self._losses(final=batch[-1] is None)
+            if losses is not None:
+                records.append(losses)
+            if records:
+                self._write(records)
+            if batch[-1] is None:
+                return
+
+    def _write(self, records):
+        with self._write_lock:
+            self._write_batch(records)
+
+    def _write_batch(self, records):
+        lines = []
+        for record in records:
+            try:
+                lines.append(self.format(record) + "\n")
+            except Exception:
+                self.handleError(record)
+        text = "".join(lines)
+        try:
+            if self.console:
+                sys.stderr.write(text)
+                sys.stderr.flush()
+            if self._file is not None:
+                self._write_file(text)
+        except Exception:
+            self.handleError(records[0])
+
+    def _write_file(self, text):
+        handler = self._file
+        if handler.maxBytes:
+            # Workers share the file, a single one at a time writes or rotates it
+            if self._lock_file is None:
+                self._lock_file = open(f"{handler.baseFilename}.lock", "a")
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            if handler.stream is not None and not self._same_file(handler):
+                # Rotated by another gunicorn worker
+                handler.close()
+            if handler.stream is None:
+                handler.stream = handler._open()
+            if (
+                handler.maxBytes
+                and os.fstat(handler.stream.fileno()).st_size + len(text)
+                > handler.maxBytes
+            ):
+                handler.doRollover()
+                if handler.stream is None:
+                    handler.stream = handler._open()
+            handler.stream.write(text)
+            handler.stream.flush()
+        finally:
+            if handler.maxBytes:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _same_file(handler):
+        try:
+            stat = os.stat(handler.baseFilename)
+        except OSError:
+            return False
+        opened = os.fstat(handler.stream.fileno())
+        return (stat.st_dev, stat.st_ino) == (opened.st_dev, opened.st_ino)
+
+    def close(self):
+        thread = self._thread
+        if thread is not None and self._pid == os.getpid() and thread.is_alive():
+            try:
+                self._queue.put(None, timeout=1)
+            except queue.Full:
+                pass
+            thread.join(timeout=5)
+        self._thread = None
+        if self._file is not None:
+            self._file.close()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+        super().close()
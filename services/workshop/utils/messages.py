@@ -49,7 +49,22 @@ INVALID_SERVICE_REQUEST_STATUS = (
 REPORT_ID_MISSING = "Please enter the report_id value."
 INVALID_REPORT_ID = "Please enter a valid report_id value."
 REPORT_DOES_NOT_EXIST = "The Report does not exist for given report_id."
+REPORT_IDS_OR_DATE_RANGE_REQUIRED = (
+    "Please enter either report_ids or a start_date and end_date range."
+)
+INVALID_REPORT_IDS = "report_ids should be a comma separated list of report ids."
+INVALID_DATE_RANGE = "start_date should not be after end_date."
+REPORTS_EXPORT_LIMIT_EXCEEDED = "At most {} reports can be downloaded at once."
+NO_REPORTS_FOUND = "No reports found for the given criteria."
 COULD_NOT_CONNECT = "Could not connect to mechanic api."
+CONTACT_MECHANIC_JOB_QUEUE_FULL = (
+    "Too many mechanic requests are in progress. Please try again later."
+)
 INVALID_LIMIT_OR_OFFSET = "Param limit and offset values should be integers."
+INVALID_FIELDSET = "Unknown field or relation: {}"
 NO_USER_DETAILS = "No user details found."
+PROFILE_IN_PROGRESS = "This worker is already being profiled, try again later."
+PROFILE_TOO_LONG = "duration should be at most {} seconds."
 NO_OBJECT_FOUND = "No object found."
+SERVICE_OVERLOADED = "The service is overloaded. Please try again later."
+RATE_LIMITED = "Too many requests. Please try again in {} seconds."
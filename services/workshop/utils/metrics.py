@@ -0,0 +1,230 @@
+#
+# Licensed under the Apache License, Version 2.0 (the “License”);
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an “AS IS” BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Prometheus metrics of the workshop
+When PROMETHEUS_MULTIPROC_DIR is set, every gunicorn worker writes its
+samples to that directory and the metrics view aggregates all the workers.
+"""
+import os
+import time
+from contextlib import contextmanager
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from utils.profiling import profile_phase, wrap_queries
+
+UNMATCHED_ROUTE = "unmatched"
+
+REQUEST_LATENCY = Histogram(
+    "workshop_request_duration_seconds",
+    "Time spent in the view and middlewares per route",
+    ["method", "route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "workshop_requests_in_flight",
+    "Requests being processed per route",
+    ["route"],
+    multiprocess_mode="livesum",
+)
+CACHE_LOOKUPS = Counter(
+    "workshop_cache_lookups_total",
+    "Lookups of the memoized read queries per namespace and result",
+    ["namespace", "result"],
+)
+INVALIDATION_MESSAGES = Counter(
+    "workshop_invalidation_messages_total",
+    "Writes of other workers received on the invalidation bus per model",
+    ["model"],
+)
+INVALIDATION_FLUSHES = Counter(
+    "workshop_invalidation_flushes_total",
+    "Flushes of the in-process caches after the invalidation bus reconnected",
+)
+REQUESTS_COALESCED = Counter(
+    "workshop_requests_coalesced_total",
+    "Coalesced GET requests per view, computed by a leader or shared by followers",
+    ["view", "role"],
+)
+REQUESTS_RATE_LIMITED = Counter(
+    "workshop_requests_rate_limited_total",
+    "Requests answered with a 429 by the rate limits per scope",
+    ["scope"],
+)
+RESPONSES = Counter(
+    "workshop_responses_total",
+    "Responses per route and status code",
+    ["method", "route", "status"],
+)
+DB_QUERIES = Histogram(
+    "workshop_request_db_queries",
+    "Database queries per request",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 200),
+)
+DB_TIME = Histogram(
+    "workshop_request_db_duration_seconds",
+    "Time spent in database queries per request",
+    ["route"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+OUTBOUND_LATENCY = Histogram(
+    "workshop_outbound_duration_seconds",
+    "Duration of calls to other services",
+    ["target"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+OUTBOUND_ERRORS = Counter(
+    "workshop_outbound_errors_total",
+    "Calls to other services which raised an exception",
+    ["target"],
+)
+REQUESTS_SHED = Counter(
+    "workshop_requests_shed_total",
+    "Requests answered with a 503 by admission control per route and reason",
+    ["route", "reason"],
+)
+REQUESTS_WAITING = Gauge(
+    "workshop_requests_waiting",
+    "Requests waiting for admission per route",
+    ["route"],
+    multiprocess_mode="livesum",
+)
+DEPENDENCY_UP = Gauge(
+    "workshop_dependency_up",
+    "Whether the last health sample of a dependency passed, the lowest of the workers",
+    ["dependency"],
+    multiprocess_mode="livemin",
+)
+
+
+@contextmanager
+def observe_outbound(target, phase="outbound"):
+    """
+    records the duration of a call to another service
+    :param target: name of the called service, like identity or gateway
+    :param phase: phase of the request profile the call belongs to
+    """
+    start = time.perf_counter()
+    try:
+        with profile_phase(phase):
+            yield
+    except Exception:
+        OUTBOUND_ERRORS.labels(target).inc()
+        raise
+    finally:
+        OUTBOUND_LATENCY.labels(target).observe(time.perf_counter() - start)
+
+
+class QueryRecorder:
+    """
+    execute_wrapper counting the queries of a request and their duration
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+class MetricsMiddleware:
+    """
+    Records the latency, status code and database usage of every request,
+    labelled with the route pattern the request matched
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        recorder = QueryRecorder()
+        try:
+            with wrap_queries(recorder):
+                response = self.get_response(request)
+        finally:
+            route = self.leave(request)
+        return self.record(request, response, route, start, recorder)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        recorder = QueryRecorder()
+        try:
+            with wrap_queries(recorder):
+                response = await self.get_response(request)
+        finally:
+            route = self.leave(request)
+        return self.record(request, response, route, start, recorder)
+
+    @staticmethod
+    def leave(request):
+        """
+        :return: route of the request, None if it matched none
+        """
+        route = getattr(request, "_metrics_route", None)
+        if route is not None:
+            REQUESTS_IN_FLIGHT.labels(route).dec()
+        return route
+
+    @staticmethod
+    def record(request, response, route, start, recorder):
+        route = route or UNMATCHED_ROUTE
+        REQUEST_LATENCY.labels(request.method, route).observe(
+            time.perf_counter() - start
+        )
+        RESPONSES.labels(request.method, route, response.status_code).inc()
+        DB_QUERIES.labels(route).observe(recorder.count)
+        DB_TIME.labels(route).observe(recorder.duration)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics_route = request.resolver_match.route
+        REQUESTS_IN_FLIGHT.labels(request._metrics_route).inc()
+        return None
+
+
+def metrics_view(request):
+    """
+    exposes the metrics in the Prometheus text format
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -131,3 +131,42 @@ def mock_jwt_auth_required(func):
             )
 
     return new_func
+
+
+def mock_async_jwt_auth_required(func):
+    """
+    mock function to validate jwt in async views
+    :param func: async view function of the api
+    :return: a new async view function which
+        awaits the actual view function if token is a valid email
+        returns error message if token is a invalid email
+    """
+
+    @wraps(func)
+    async def new_func(*args, **kwargs):
+        try:
+            request = args[1]
+            if (
+                "HTTP_AUTHORIZATION" in request.META
+                and request.META.get("HTTP_AUTHORIZATION")[0:7] == "Bearer "
+            ):
+                token = request.META.get("HTTP_AUTHORIZATION")[7:]
+                user = await User.objects.aget(email=token)
+                # Add user object to the view function if authorized
+                kwargs["user"] = user
+                return await func(*args, **kwargs)
+
+            return Response(
+                {"message": messages.JWT_REQUIRED},
+                status=status.HTTP_401_UNAUTHORIZED,
+                content_type="application/json",
+            )
+
+        except (jwt.exceptions.DecodeError, User.DoesNotExist):
+            return Response(
+                {"message": messages.INVALID_TOKEN},
+                status=status.HTTP_401_UNAUTHORIZED,
+                content_type="application/json",
+            )
+
+    return new_func
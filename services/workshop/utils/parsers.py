@@ -0,0 +1,57 @@
+#
+# Licensed under the Apache License, Version 2.0 (the “License”);
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an “AS IS” BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+contains the parsers of the workshop APIs
+"""
+import codecs
+import orjson
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.utils import json
+from utils.renderers import ORJSONRenderer
+
+
+class ORJSONParser(JSONParser):
+    """
+    JSONParser which parses with orjson
+    Bodies orjson rejects, like integers over 64 bits, are parsed again
+    the way JSONParser does, so both accept and reject the same input.
+    """
+
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        """
+        Parses the incoming bytestream as JSON and returns the resulting data.
+        """
+        if not self.strict:
+            return super().parse(stream, media_type, parser_context)
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        body = stream.read()
+        try:
+            if codecs.lookup(encoding).name == "utf-8":
+                return orjson.loads(body)
+            return orjson.loads(body.decode(encoding))
+        except ValueError:
+            pass
+
+        try:
+            return json.loads(
+                body.decode(encoding), parse_constant=json.strict_constant
+            )
+        except ValueError as exc:
+            raise ParseError("JSON parse error - %s" % str(exc))
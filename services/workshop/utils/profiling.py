@@ -0,0 +1,248 @@
+#
+# Licensed under the Apache License, Version 2.0 (the “License”);
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an “AS IS” BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Sampled request profiler reporting its phases in a Server-Timing header
+"""
+import contextvars
+import hmac
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager
+from functools import partial
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+logger = logging.getLogger()
+
+PHASES = ("auth", "db", "outbound", "view", "render")
+PROFILE_TOKEN_HEADER = "HTTP_X_PROFILE_TOKEN"
+
+_current_profile = contextvars.ContextVar("request_profile", default=None)
+_query_wrappers = contextvars.ContextVar("query_wrappers", default=())
+
+
+class RequestProfile:
+    """
+    Time spent by a request per phase
+    Phases are exclusive, time spent in a nested phase, like a query run
+    while authenticating, only counts for the nested phase.
+    """
+
+    def __init__(self, record_queries=False):
+        self.started = time.perf_counter()
+        self.durations = dict.fromkeys(PHASES, 0.0)
+        self.queries = [] if record_queries else None
+        self.query_count = 0
+        self._stack = []
+
+    def push(self, phase):
+        now = time.perf_counter()
+        if self._stack:
+            parent = self._stack[-1]
+            self.durations[parent[0]] += now - parent[1]
+        self._stack.append([phase, now])
+
+    def pop(self):
+        now = time.perf_counter()
+        phase, started = self._stack.pop()
+        self.durations[phase] += now - started
+        if self._stack:
+            self._stack[-1][1] = now
+
+    def close(self):
+        while self._stack:
+            self.pop()
+
+    def server_timing(self):
+        """
+        :return: value of the Server-Timing header
+        """
+        metrics = []
+        for phase, duration in self.durations.items():
+            metric = f"{phase};dur={duration * 1000:.2f}"
+            if phase == "db":
+                metric += f';desc="{self.query_count} queries"'
+            metrics.append(metric)
+        total = time.perf_counter() - self.started
+        metrics.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(metrics)
+
+
+@contextmanager
+def profile_phase(phase):
+    """
+    attributes the time spent in the block to a phase of the current request,
+    does nothing if the request is not profiled
+    :param phase: one of PHASES
+    """
+    profile = _current_profile.get()
+    if profile is None:
+        yield
+        return
+    profile.push(phase)
+    try:
+        yield
+    finally:
+        profile.pop()
+
+
+@contextmanager
+def wrap_queries(wrapper):
+    """
+    runs an execute_wrapper around the queries of the block on every database
+    The wrapper is kept in the context, which sync_to_async copies to the
+    thread running the queries of async code, and run by run_query_wrappers.
+    :param wrapper: execute_wrapper function
+    """
+    reset_token = _query_wrappers.set(_query_wrappers.get() + (wrapper,))
+    try:
+        yield
+    finally:
+        _query_wrappers.reset(reset_token)
+
+
+def run_query_wrappers(execute, sql, params, many, context):
+    """
+    execute_wrapper of every connection, running the wrappers of the context
+    """
+    for wrapper in reversed(_query_wrappers.get()):
+        execute = partial(wrapper, execute)
+    return execute(sql, params, many, context)
+
+
+def install_query_wrappers(sender, connection, **kwargs):
+    """
+    receiver of connection_created installing run_query_wrappers, the
+    connections of a thread are only created once it runs a query
+    """
+    if run_query_wrappers not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, run_query_wrappers)
+
+
+def record_query(execute, sql, params, many, context):
+    profile = _current_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    profile.push("db")
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.pop()
+        profile.query_count += 1
+        if profile.queries is not None:
+            profile.queries.append(
+                {
+                    "sql": sql,
+                    "many": many,
+                    "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+                }
+            )
+
+
+def has_debug_token(request):
+    token = settings.PROFILING_DEBUG_TOKEN
+    given = request.META.get(PROFILE_TOKEN_HEADER)
+    return bool(token and given) and hmac.compare_digest(token, given)
+
+
+class ProfilingMiddleware:
+    """
+    Profiles a PROFILING_SAMPLE_RATE share of the requests, and every request
+    carrying PROFILING_DEBUG_TOKEN in the X-Profile-Token header. Profiled
+    responses get a Server-Timing header, requests with the token also log
+    all their queries with their duration.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profile = self.sample(request)
+        if profile is None:
+            return self.get_response(request)
+        reset_token = _current_profile.set(profile)
+        try:
+            with wrap_queries(record_query):
+                response = self.get_response(request)
+        finally:
+            profile.close()
+            _current_profile.reset(reset_token)
+        return self.report(request, response, profile)
+
+    async def __acall__(self, request):
+        profile = self.sample(request)
+        if profile is None:
+            return await self.get_response(request)
+        reset_token = _current_profile.set(profile)
+        try:
+            with wrap_queries(record_query):
+                response = await self.get_response(request)
+        finally:
+            profile.close()
+            _current_profile.reset(reset_token)
+        return self.report(request, response, profile)
+
+    @staticmethod
+    def sample(request):
+        """
+        :return: RequestProfile if the request is profiled, otherwise None
+        """
+        debug = has_debug_token(request)
+        if not debug and random.random() >= settings.PROFILING_SAMPLE_RATE:
+            return None
+        return RequestProfile(record_queries=debug)
+
+    @staticmethod
+    def report(request, response, profile):
+        response.headers["Server-Timing"] = profile.server_timing()
+        if profile.queries is not None:
+            logger.info(
+                "Profile of %s %s: %s",
+                request.method,
+                request.path,
+                json.dumps(
+                    {
+                        "server_timing": response.headers["Server-Timing"],
+                        "queries": profile.queries,
+                    }
+                ),
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # The view phase covers the whole body of the view, its queries and
+        # outbound calls excepted, serializers included
+        profile = _current_profile.get()
+        if profile is not None:
+            profile.push("view")
+        return None
+
+    def process_template_response(self, request, response):
+        # Rendering starts right after the template response middlewares
+        profile = _current_profile.get()
+        if profile is not None:
+            profile.close()
+            profile.push("render")
+        return response
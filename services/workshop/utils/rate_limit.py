@@ -0,0 +1,173 @@
+#
+# Licensed under the Apache License, Version 2.0 (the “License”);
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an “AS IS” BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Token bucket rate limits of the costly endpoints per user
+A bucket holds up to the requests of the budget of its scope and refills
+at requests/seconds per second, every call takes one token. The responses
+carry the RateLimit-* headers of the IETF draft, and a 429 with
+Retry-After once the bucket is empty.
+"""
+import math
+import threading
+from collections import namedtuple
+from functools import wraps
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from crapi.models import RateLimitBucket
+from utils import messages
+from utils.metrics import REQUESTS_RATE_LIMITED
+
+Quota = namedtuple("Quota", ["allowed", "limit", "period", "remaining", "reset"])
+
+
+def take_token(tokens, elapsed, limit, period):
+    """
+    refills a bucket for the elapsed seconds and takes a token from it
+    :param tokens: tokens left in the bucket
+    :param elapsed: seconds since the bucket was last updated
+    :param limit: capacity of the bucket
+    :param period: seconds to refill an empty bucket
+    :return: (tokens left, Quota)
+    """
+    rate = limit / period
+    tokens = min(limit, tokens + max(elapsed, 0) * rate)
+    allowed = tokens >= 1
+    if allowed:
+        tokens -= 1
+        # Seconds until the bucket is full again
+        reset = (limit - tokens) / rate
+    else:
+        # Seconds until the next token
+        reset = (1 - tokens) / rate
+    return tokens, Quota(allowed, limit, period, math.floor(tokens), math.ceil(reset))
+
+
+class MemoryBackend:
+    """
+    buckets of the current worker
+    """
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, limit, period):
+        now = timezone.now()
+        with self._lock:
+            tokens, updated_on = self._buckets.get(key, (limit, now))
+            tokens, quota = take_token(
+                tokens, (now - updated_on).total_seconds(), limit, period
+            )
+            self._buckets[key] = (tokens, now)
+        return quota
+
+
+class DatabaseBackend:
+    """
+    buckets shared by the workers, the row of a bucket is locked
+    while a token is taken from it
+    """
+
+    def take(self, key, limit, period):
+        now = timezone.now()
+        with transaction.atomic():
+            RateLimitBucket.objects.bulk_create(
+                [RateLimitBucket(key=key, tokens=limit, updated_on=now)],
+                ignore_conflicts=True,
+            )
+            bucket = RateLimitBucket.objects.select_for_update().get(key=key)
+            bucket.tokens, quota = take_token(
+                bucket.tokens,
+                (now - bucket.updated_on).total_seconds(),
+                limit,
+                period,
+            )
+            bucket.updated_on = now
+            bucket.save(update_fields=["tokens", "updated_on"])
+        return quota
+
+
+BACKENDS = {"memory": MemoryBackend(), "database": DatabaseBackend()}
+
+
+def check_rate_limit(scope, user):
+    """
+    takes a token from the bucket of the user for the scope
+    :return: Quota, None if the scope is not limited
+    """
+    budget = settings.RATE_LIMITS.get(scope)
+    if budget is None:
+        return None
+    limit, period = budget
+    backend = BACKENDS[settings.RATE_LIMIT_BACKEND]
+    return backend.take(f"{scope}:{user.id}", limit, period)
+
+
+def limited_response(scope, quota, response=None):
+    """
+    adds the RateLimit-* headers to the response of the view,
+    or answers with a 429 if the quota is exhausted
+    """
+    if quota is None:
+        return response
+    if not quota.allowed:
+        REQUESTS_RATE_LIMITED.labels(scope).inc()
+        response = Response(
+            {"message": messages.RATE_LIMITED.format(quota.reset)},
+            status=status.HTTP_429_TOO_MANY_REQUESTS,
+        )
+        response["Retry-After"] = str(quota.reset)
+    response["RateLimit-Limit"] = str(quota.limit)
+    response["RateLimit-Remaining"] = str(quota.remaining)
+    response["RateLimit-Reset"] = str(quota.reset)
+    response["RateLimit-Policy"] = f"{quota.limit};w={quota.period}"
+    return response
+
+
+def rate_limited(scope):
+    """
+    decorator limiting the calls of a view per user, under jwt_auth_required
+    :param scope: name of the budget in RATE_LIMITS
+    :return: a decorator of sync and async view functions
+    """
+
+    def decorator(func):
+        if iscoroutinefunction(func):
+
+            @wraps(func)
+            async def new_func(self, request, *args, user=None, **kwargs):
+                quota = await sync_to_async(check_rate_limit)(scope, user)
+                if quota is not None and not quota.allowed:
+                    return limited_response(scope, quota)
+                response = await func(self, request, *args, user=user, **kwargs)
+                return limited_response(scope, quota, response)
+
+        else:
+
+            @wraps(func)
+            def new_func(self, request, *args, user=None, **kwargs):
+                quota = check_rate_limit(scope, user)
+                if quota is not None and not quota.allowed:
+                    return limited_response(scope, quota)
+                response = func(self, request, *args, user=user, **kwargs)
+                return limited_response(scope, quota, response)
+
+        return new_func
+
+    return decorator
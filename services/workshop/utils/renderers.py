@@ -0,0 +1,74 @@
+#
+# Licensed under the Apache License, Version 2.0 (the “License”);
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an “AS IS” BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+contains the renderers of the workshop APIs
+"""
+import orjson
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+LINE_SEPARATOR = b"\xe2\x80\xa8"
+PARAGRAPH_SEPARATOR = b"\xe2\x80\xa9"
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer which serializes with orjson
+    Datetimes and UUIDs are serialized natively. Everything else orjson does
+    not know, like Decimal or lazy strings, goes through the encoder of the
+    stock JSONRenderer, so both produce the same bytes. The only differences
+    are floats needing an exponent (1e16 instead of 1e+16) and NaN, which is
+    rendered as null instead of failing. With ORJSON_RENDERER_COMPAT set,
+    datetimes go through the stock encoder as well.
+    Indents other than 2 and payloads orjson rejects, like integers over
+    64 bits, fall back to the stock JSONRenderer.
+    """
+
+    default = encoders.JSONEncoder().default
+
+    def get_options(self):
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z
+        if getattr(settings, "ORJSON_RENDERER_COMPAT", False):
+            options |= orjson.OPT_PASSTHROUGH_DATETIME
+        return options
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """
+        Render `data` into JSON, returning a bytestring.
+        """
+        if data is None:
+            return b""
+        if self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        options = self.get_options()
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent == 2:
+            options |= orjson.OPT_INDENT_2
+        elif indent is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.default, option=options)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Same escaping as JSONRenderer, to output a strict javascript subset.
+        if LINE_SEPARATOR in ret:
+            ret = ret.replace(LINE_SEPARATOR, b"\\u2028")
+        if PARAGRAPH_SEPARATOR in ret:
+            ret = ret.replace(PARAGRAPH_SEPARATOR, b"\\u2029")
+        return ret
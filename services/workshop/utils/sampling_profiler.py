@@ -0,0 +1,164 @@
+#
+# Licensed under the Apache License, Version 2.0 (the “License”);
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an “AS IS” BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Sampling profiler of the threads of the current process
+Nothing runs between two profiles: the stacks are sampled from the thread
+which asked for the profile, for the duration of the profile only.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Innermost frames of threads waiting for work
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("socket.py", "accept"),
+    ("base_events.py", "_run_once"),
+}
+
+_profile_lock = threading.Lock()
+
+
+class ProfileInProgress(Exception):
+    """
+    Raised when the process is already being profiled
+    """
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of every other thread of the process
+    :param interval: seconds between two samples
+    :param include_idle: keep the samples of threads waiting for work
+    """
+
+    def __init__(self, interval=0.01, include_idle=False):
+        self.interval = interval
+        self.include_idle = include_idle
+        self.stacks = Counter()
+        self.samples = 0
+        self.elapsed = 0.0
+        self._frames = {}
+
+    def _frame(self, frame):
+        code = frame.f_code
+        key = (code.co_filename, code.co_qualname, code.co_firstlineno)
+        label = self._frames.get(key)
+        if label is None:
+            module = frame.f_globals.get("__name__", "?")
+            label = self._frames[key] = f"{module}.{code.co_qualname}"
+        return key
+
+    def sample(self, exclude):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id in exclude:
+                continue
+            code = frame.f_code
+            leaf = (os.path.basename(code.co_filename), code.co_name)
+            if not self.include_idle and leaf in IDLE_FRAMES:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame(frame))
+                frame = frame.f_back
+            stack.reverse()
+            name = names.get(thread_id, str(thread_id))
+            self.stacks[(name, tuple(stack))] += 1
+        self.samples += 1
+
+    def run(self, duration):
+        """
+        samples the other threads for duration seconds,
+        one profile at a time per process
+        :raises ProfileInProgress: if another profile is running
+        """
+        if not _profile_lock.acquire(blocking=False):
+            raise ProfileInProgress()
+        try:
+            exclude = {threading.get_ident()}
+            start = time.perf_counter()
+            deadline = start + duration
+            next_sample = start
+            while True:
+                self.sample(exclude)
+                next_sample += self.interval
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+                # Late samples are skipped rather than taken in a burst
+                while next_sample <= now:
+                    next_sample += self.interval
+                time.sleep(min(next_sample, deadline) - now)
+            self.elapsed = time.perf_counter() - start
+        finally:
+            _profile_lock.release()
+        return self
+
+    def collapsed(self):
+        """
+        :return: stacks in the collapsed format of flamegraph.pl and speedscope,
+            one "thread;outer;...;inner count" line per stack
+        """
+        lines = []
+        for (thread, stack), count in sorted(self.stacks.items()):
+            frames = [thread] + [self._frames[key] for key in stack]
+            lines.append(";".join(frame.replace(";", ":") for frame in frames))
+            lines[-1] += f" {count}"
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self, name="workshop"):
+        """
+        :return: dict in the speedscope file format, with one sampled profile
+            per thread and samples weighted in milliseconds
+        """
+        frame_index = {}
+        frames = []
+        threads = {}
+        weight = self.elapsed * 1000 / max(self.samples, 1)
+        for (thread, stack), count in sorted(self.stacks.items()):
+            indexes = []
+            for key in stack:
+                if key not in frame_index:
+                    frame_index[key] = len(frames)
+                    frames.append(
+                        {"name": self._frames[key], "file": key[0], "line": key[2]}
+                    )
+                indexes.append(frame_index[key])
+            samples, weights = threads.setdefault(thread, ([], []))
+            samples.append(indexes)
+            weights.append(round(count * weight, 3))
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "crapi-workshop",
+            "shared": {"frames": frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": thread,
+                    "unit": "milliseconds",
+                    "startValue": 0,
+                    "endValue": round(sum(weights), 3),
+                    "samples": samples,
+                    "weights": weights,
+                }
+                for thread, (samples, weights) in threads.items()
+            ],
+        }
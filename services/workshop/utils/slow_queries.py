@@ -0,0 +1,214 @@
+#
+# Licensed under the Apache License, Version 2.0 (the “License”);
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an “AS IS” BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Log of the database queries slower than SLOW_QUERY_THRESHOLD_MS
+Every slow query is appended as a JSON line to SLOW_QUERY_LOG_FILE, and the
+first slow SELECT of each shape also gets its EXPLAIN (ANALYZE, BUFFERS).
+The slow_queries management command summarizes the log.
+"""
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+from utils.profiling import wrap_queries
+
+logger = logging.getLogger()
+
+# Shapes explained per process, later slow queries are logged without plan
+MAX_EXPLAINED_SHAPES = 1000
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"%s(?:\s*,\s*%s)+")
+_WHITESPACE = re.compile(r"\s+")
+
+_explained = set()
+_explained_lock = threading.Lock()
+_write_lock = threading.Lock()
+_state = threading.local()
+
+
+def normalize_sql(sql):
+    """
+    reduces a query to its shape, without literals and with lists of
+    placeholders of any length collapsed, so IN clauses of different sizes
+    share a shape
+    :param sql: query as given to the database cursor
+    :return: normalized query
+    """
+    sql = _STRING_LITERAL.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _PLACEHOLDER_LIST.sub("%s, ...", sql)
+    return _WHITESPACE.sub(" ", sql).strip()
+
+
+def fingerprint(text):
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+def view_label(view_func):
+    """
+    :param view_func: view resolved for the request
+    :return: dotted path of the view class or function
+    """
+    view = getattr(view_func, "view_class", view_func)
+    return f"{view.__module__}.{view.__qualname__}"
+
+
+def explain(connection, sql, params):
+    """
+    runs EXPLAIN (ANALYZE, BUFFERS) for a query in a savepoint,
+    so a failing plan does not break the transaction of the request
+    :return: text of the plan, or None if it could not be obtained
+    """
+    _state.explaining = True
+    try:
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute("EXPLAIN (ANALYZE, BUFFERS) " + sql, params)
+                return "\n".join(row[0] for row in cursor.fetchall())
+    except DatabaseError as e:
+        logger.info("Could not explain slow query: %s", e)
+        return None
+    finally:
+        _state.explaining = False
+
+
+def should_explain(connection, shape_id, sql, many):
+    if not settings.SLOW_QUERY_EXPLAIN or many:
+        return False
+    if connection.vendor != "postgresql":
+        return False
+    # ANALYZE runs the statement, which is only harmless for a SELECT
+    if not sql.lstrip().upper().startswith("SELECT"):
+        return False
+    if connection.needs_rollback:
+        return False
+    with _explained_lock:
+        if shape_id in _explained or len(_explained) >= MAX_EXPLAINED_SHAPES:
+            return False
+        _explained.add(shape_id)
+    return True
+
+
+def write_entry(entry):
+    line = json.dumps(entry, default=str) + "\n"
+    with _write_lock:
+        with open(settings.SLOW_QUERY_LOG_FILE, "a") as log_file:
+            log_file.write(line)
+
+
+class SlowQueryLogger:
+    """
+    execute_wrapper logging the queries slower than SLOW_QUERY_THRESHOLD_MS
+    :param view: label of the code running the queries
+    """
+
+    def __init__(self, view=None):
+        self.view = view
+
+    def __call__(self, execute, sql, params, many, context):
+        # The EXPLAIN of a slow query goes through the wrappers too
+        if getattr(_state, "explaining", False):
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        error = None
+        try:
+            return execute(sql, params, many, context)
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+            if duration_ms >= settings.SLOW_QUERY_THRESHOLD_MS:
+                self.log(sql, params, many, context["connection"], duration_ms, error)
+
+    def log(self, sql, params, many, connection, duration_ms, error):
+        shape = normalize_sql(sql)
+        shape_id = fingerprint(shape)
+        entry = {
+            "time": timezone.now().isoformat(),
+            "view": self.view,
+            "database": connection.alias,
+            "fingerprint": shape_id,
+            "sql": shape,
+            "params_fingerprint": fingerprint(repr(params)),
+            "many": many,
+            "duration_ms": round(duration_ms, 3),
+        }
+        if error is not None:
+            entry["error"] = error
+        elif should_explain(connection, shape_id, sql, many):
+            entry["explain"] = explain(connection, sql, params)
+        try:
+            write_entry(entry)
+        except OSError as e:
+            logger.error("Could not write the slow query log: %s", e)
+
+
+@contextmanager
+def log_slow_queries(view=None):
+    """
+    logs the slow queries run in the block on every database
+    :param view: label of the code running the queries
+    :return: the SlowQueryLogger, whose view can be changed in the block
+    """
+    query_logger = SlowQueryLogger(view)
+    with wrap_queries(query_logger):
+        yield query_logger
+
+
+class SlowQueryMiddleware:
+    """
+    Logs the slow queries of every request with the view which ran them
+    Disabled when SLOW_QUERY_LOG_FILE is empty.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.SLOW_QUERY_LOG_FILE:
+            return self.get_response(request)
+        with log_slow_queries(request.path) as query_logger:
+            request._slow_query_logger = query_logger
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        if not settings.SLOW_QUERY_LOG_FILE:
+            return await self.get_response(request)
+        with log_slow_queries(request.path) as query_logger:
+            request._slow_query_logger = query_logger
+            return await self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        query_logger = getattr(request, "_slow_query_logger", None)
+        if query_logger is not None:
+            query_logger.view = view_label(view_func)
+        return None
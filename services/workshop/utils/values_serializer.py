@@ -0,0 +1,266 @@
+#
+# Licensed under the Apache License, Version 2.0 (the “License”);
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an “AS IS” BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Read only serialization of querysets through values_list()
+"""
+from rest_framework import serializers
+from utils import messages
+
+# Fields whose to_representation returns database values unchanged
+IDENTITY_REPRESENTATIONS = (
+    serializers.CharField.to_representation,
+    serializers.IntegerField.to_representation,
+    serializers.FloatField.to_representation,
+)
+# Compiled selections kept per ValuesSerializer
+MAX_SELECTIONS = 64
+
+
+def parse_fieldset(value, whole=True):
+    """
+    parses a comma separated list of dotted field paths into a tree
+    "id,product.name" becomes {"id": None, "product": {"name": None}}
+    :param value: comma separated list of field paths
+    :param whole: if a path without subpaths selects all of its subfields,
+        the path maps to None, otherwise to an empty tree
+    :return: dict of field name to subtree
+    """
+    tree = {}
+    for path in value.split(","):
+        names = [name.strip() for name in path.split(".")]
+        if not all(names):
+            raise ValueError(path)
+        node = tree
+        for name in names[:-1]:
+            if name in node and node[name] is None:
+                break
+            node = node.setdefault(name, {})
+        else:
+            if whole:
+                node[names[-1]] = None
+            else:
+                node.setdefault(names[-1], {})
+    return tree
+
+
+def freeze_fieldset(tree):
+    if tree is None:
+        return None
+    return tuple(sorted((name, freeze_fieldset(sub)) for name, sub in tree.items()))
+
+
+class ValuesRelated:
+    """
+    Many side of a relation, serialized with one query for a whole page
+    :param serializer_class: ModelSerializer of the related model
+    :param related_field: name of the foreign key pointing to the parent
+    :param order_by: ordering of the related objects of a parent
+    """
+
+    def __init__(self, serializer_class, related_field, order_by=()):
+        self.values = ValuesSerializer(serializer_class)
+        self.related_field = related_field
+        self.order_by = order_by
+
+    def group(self, pks, fields=None):
+        """
+        :param pks: primary keys of the parents
+        :param fields: fieldset tree of the related objects, None for all
+        :return: dict of parent pk to list of serialized related objects
+        """
+        selection = self.values.select(fields)
+        groups = {}
+        rows = (
+            self.values.model.objects.filter(**{self.related_field + "__in": pks})
+            .order_by(*self.order_by)
+            .values_list(*selection.lookups, self.related_field)
+        )
+        row_to_dict = selection.row_to_dict
+        for row in rows:
+            groups.setdefault(row[-1], []).append(row_to_dict(row))
+        return groups
+
+
+class ValuesSelection:
+    """
+    A ValuesSerializer compiled for a set of fields and expanded relations
+    """
+
+    def __init__(self, values, fields, expand):
+        self.lookups = ["pk"]
+        self.related = {}
+        converters = {}
+
+        def column(lookup):
+            if lookup not in self.lookups:
+                self.lookups.append(lookup)
+            return self.lookups.index(lookup)
+
+        def compile_fields(serializer, model, prefix, fields, expand):
+            readable = {
+                name: field
+                for name, field in serializer.fields.items()
+                if not field.write_only
+            }
+            unknown = set(fields or ()).union(expand or ()) - set(readable)
+            if unknown:
+                raise ValueError(prefix.replace("__", ".") + sorted(unknown)[0])
+            items = []
+            for name, field in readable.items():
+                if fields is not None and name not in fields:
+                    continue
+                sub_fields = fields[name] if fields is not None else None
+                sub_expand = expand.get(name, {}) if expand is not None else None
+                expanded = expand is None or name in expand or sub_fields is not None
+                if not prefix and name in values.related:
+                    if expanded:
+                        self.related[name] = sub_fields
+                        items.append(f"{name!r}: None")
+                    continue
+                if sub_fields is not None or sub_expand:
+                    if not isinstance(field, serializers.BaseSerializer):
+                        raise ValueError(prefix.replace("__", ".") + name)
+                if field.source == "*" or "." in field.source:
+                    raise ValueError(f"Unsupported source of field {name}")
+                model_field = model._meta.get_field(field.source)
+                lookup = prefix + field.source
+                if isinstance(field, serializers.BaseSerializer) and expanded:
+                    value = compile_fields(
+                        field,
+                        model_field.related_model,
+                        lookup + "__",
+                        sub_fields,
+                        sub_expand,
+                    )
+                    if model_field.null:
+                        index = column(lookup)
+                        value = f"(None if row[{index}] is None else {value})"
+                elif isinstance(field, serializers.BaseSerializer):
+                    # Collapsed relations are rendered as their primary key
+                    value = f"row[{column(lookup)}]"
+                elif isinstance(field, serializers.SerializerMethodField):
+                    raise ValueError(f"Field {name} must be given in related")
+                else:
+                    index = column(lookup)
+                    value = f"row[{index}]"
+                    if type(field).to_representation not in IDENTITY_REPRESENTATIONS:
+                        converter = f"to_representation_{len(converters)}"
+                        converters[converter] = field.to_representation
+                        value = f"(None if {value} is None else {converter}({value}))"
+                items.append(f"{name!r}: {value}")
+            return "{" + ", ".join(items) + "}"
+
+        serializer_class = values.serializer_class
+        body = compile_fields(serializer_class(), values.model, "", fields, expand)
+        source = f"def row_to_dict(row):\n    return {body}\n"
+        namespace = dict(converters)
+        exec(compile(source, f"<{serializer_class.__name__}>", "exec"), namespace)
+        self.row_to_dict = namespace["row_to_dict"]
+        self.values_related = values.related
+
+    def values(self, queryset):
+        """
+        :param queryset: queryset of the model of the serializer
+        :return: queryset of the rows needed by serialize
+        """
+        return queryset.values_list(*self.lookups)
+
+    def serialize(self, rows):
+        """
+        :param rows: rows of a queryset returned by values
+        :return: list of dicts equal to the data of the serializer
+        """
+        row_to_dict = self.row_to_dict
+        data = [row_to_dict(row) for row in rows]
+        if self.related and data:
+            pks = [row[0] for row in rows]
+            for name, fields in self.related.items():
+                groups = self.values_related[name].group(pks, fields)
+                for item, pk in zip(data, pks):
+                    item[name] = groups.get(pk, [])
+        return data
+
+    def data(self, queryset):
+        """
+        :param queryset: queryset of the model of the serializer
+        :return: list of dicts equal to the data of the serializer
+        """
+        return self.serialize(list(self.values(queryset)))
+
+
+class ValuesSerializer:
+    """
+    Produces the data of a ModelSerializer with many=True without building
+    model instances. Only the columns the serializer reads are fetched, with
+    joins for nested serializers, and every row is turned into a dict by a
+    function compiled from the serializer fields.
+    Fields the serializer computes, like SerializerMethodField, must be
+    provided as ValuesRelated in related.
+    """
+
+    def __init__(self, serializer_class, related=None):
+        self.serializer_class = serializer_class
+        self.model = serializer_class.Meta.model
+        self.related = related or {}
+        self._selections = {}
+
+    def select(self, fields=None, expand=None):
+        """
+        compiles the serializer for a subset of its fields
+        :param fields: fieldset tree of the fields to return, None for all
+        :param expand: fieldset tree of the nested serializers to embed,
+            None for all. Other nested serializers are returned as their
+            primary key and other related lists are left out.
+        :return: ValuesSelection
+        :raises ValueError: with the path of an unknown field
+        """
+        key = (freeze_fieldset(fields), freeze_fieldset(expand))
+        selection = self._selections.get(key)
+        if selection is None:
+            selection = ValuesSelection(self, fields, expand)
+            if len(self._selections) < MAX_SELECTIONS:
+                self._selections[key] = selection
+        return selection
+
+    def values(self, queryset):
+        return self.select().values(queryset)
+
+    def serialize(self, rows):
+        return self.select().serialize(rows)
+
+    def data(self, queryset):
+        return self.select().data(queryset)
+
+
+class FieldsetSerializer(serializers.Serializer):
+    """
+    Serializer for the fields and expand query params of list APIs
+    The ValuesSerializer of the API is expected in context["values"]
+    """
+
+    fields = serializers.CharField(required=False)
+    expand = serializers.CharField(required=False)
+
+    def validate(self, attrs):
+        try:
+            fields = expand = None
+            if "fields" in attrs:
+                fields = parse_fieldset(attrs["fields"])
+            if "expand" in attrs:
+                expand = parse_fieldset(attrs["expand"], whole=False)
+            attrs["selection"] = self.context["values"].select(fields, expand)
+        except ValueError as e:
+            raise serializers.ValidationError(messages.INVALID_FIELDSET.format(e))
+        return attrs
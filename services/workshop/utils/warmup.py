@@ -0,0 +1,155 @@
+#
+# Licensed under the Apache License, Version 2.0 (the “License”);
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an “AS IS” BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Warm-up of a new worker before it accepts requests
+gunicorn runs it from post_worker_init: the views and templates are
+loaded, a report is rendered once, the threads serving the requests
+open their database connections, except under ASGI, and the caches are
+primed. The readiness view of utils/health.py reports the steps, and
+warms up again a worker whose warm-up failed.
+"""
+import io
+import logging
+import threading
+import time
+from django.conf import settings
+from django.db import connection, connections
+from django.template.loader import get_template
+from django.urls import get_resolver
+
+logger = logging.getLogger()
+
+REPORT_TEMPLATE = "service_report.html"
+
+
+def load_views(executor, threads):
+    # Imports the views and xhtml2pdf with them
+    get_resolver().url_patterns
+
+
+def load_templates(executor, threads):
+    get_template(REPORT_TEMPLATE)
+
+
+def render_pdf(executor, threads):
+    # Loads the fonts and the modules of reportlab
+    from xhtml2pdf import pisa
+
+    pisa.CreatePDF(src="<p>warm-up</p>", dest=io.BytesIO())
+
+
+def open_connections(executor, threads):
+    """
+    opens the database connection of every thread serving requests,
+    kept between the requests for CONN_MAX_AGE seconds
+    Under ASGI connections are not kept, and the connection of the thread
+    running the warm-up would stay open, so only the sync workers open them.
+    """
+    if settings.SERVER_INTERFACE == "asgi":
+        return
+    if executor is None:
+        connection.ensure_connection()
+        return
+    # Every task waits for the others, so each one runs on its own thread
+    barrier = threading.Barrier(threads, timeout=settings.WARMUP_TIMEOUT)
+
+    def connect():
+        barrier.wait()
+        connection.ensure_connection()
+
+    for future in [executor.submit(connect) for _ in range(threads)]:
+        future.result(timeout=settings.WARMUP_TIMEOUT)
+    # The thread running the warm-up does not serve requests
+    connections.close_all()
+
+
+def prime_caches(executor, threads):
+    from crapi.mechanic.lookups import mechanic_list
+    from crapi.shop.catalog import product_catalog
+
+    product_catalog.get()
+    mechanic_list()
+
+
+STEPS = (
+    ("views", load_views),
+    ("templates", load_templates),
+    ("pdf", render_pdf),
+    ("connections", open_connections),
+    ("caches", prime_caches),
+)
+
+
+class WarmUp:
+    """
+    State of the warm-up of the worker
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.steps = {}
+        self.attempted_at = None
+        self._lock = threading.Lock()
+
+    def run(self, executor=None, threads=1):
+        """
+        runs all the steps, the worker is ready if none failed
+        :param executor: thread pool serving the requests, if any
+        :param threads: number of threads of the pool
+        """
+        with self._lock:
+            self._run(executor, threads)
+
+    def retry(self):
+        """
+        warms up again a worker which was not warmed up or whose warm-up
+        failed, at most once per WARMUP_RETRY_INTERVAL
+        """
+        if self.ready or not self._lock.acquire(blocking=False):
+            return
+        try:
+            if (
+                self.attempted_at is None
+                or time.monotonic() - self.attempted_at
+                >= settings.WARMUP_RETRY_INTERVAL
+            ):
+                self._run(None, 1)
+        finally:
+            self._lock.release()
+
+    def _run(self, executor, threads):
+        self.attempted_at = time.monotonic()
+        steps = {}
+        for name, step in STEPS:
+            started = time.perf_counter()
+            try:
+                step(executor, threads)
+                error = None
+            except Exception as e:
+                logger.warning(f"Warm-up step {name} failed: {e}")
+                error = str(e)
+            steps[name] = {
+                "ms": round((time.perf_counter() - started) * 1000, 1),
+                "error": error,
+            }
+        self.steps = steps
+        self.ready = all(step["error"] is None for step in steps.values())
+        logger.info(f"Warm-up {'done' if self.ready else 'failed'}: {steps}")
+
+    def status(self):
+        return {"ready": self.ready, "steps": self.steps}
+
+
+warm_up = WarmUp()
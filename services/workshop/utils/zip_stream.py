@@ -0,0 +1,76 @@
+#
+# Licensed under the Apache License, Version 2.0 (the “License”);
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an “AS IS” BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Streams ZIP archives chunk by chunk without buffering them in memory
+"""
+import io
+import time
+import zipfile
+
+CHUNK_SIZE = 64 * 1024
+
+
+class _ChunkBuffer(io.RawIOBase):
+    """
+    Unseekable sink for zipfile which hands written bytes back to the caller.
+    zipfile falls back to data descriptors when the target cannot seek, so
+    every member can be emitted as soon as it is written.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        return b"".join(chunks)
+
+
+def iter_zip(entries, chunk_size=CHUNK_SIZE):
+    """
+    generates a ZIP archive from the given entries
+    :param entries: iterable of (arcname, open_file) tuples
+        open_file is called lazily and must return a binary file object,
+        so expensive members are only produced when the stream reaches them
+    :param chunk_size: number of bytes read from a member at a time
+    :return: generator of bytes chunks forming the archive
+    """
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_STORED) as archive:
+        for arcname, open_file in entries:
+            info = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+            info.compress_type = zipfile.ZIP_STORED
+            with open_file() as source, archive.open(info, mode="w") as member:
+                while True:
+                    chunk = source.read(chunk_size)
+                    if not chunk:
+                        break
+                    member.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            data = buffer.drain()
+            if data:
+                yield data
+    data = buffer.drain()
+    if data:
+        yield data